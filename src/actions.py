@@ -1,45 +1,153 @@
+import asyncio
 import os
 import platform
 import sys
 import getpass
-from jinja2 import Template
 from dotenv import load_dotenv; load_dotenv()
-from google import genai
-from google.genai import types
 import re
-import subprocess
 import threading
 import time
-import googlesearch
 from typing import Callable
-import json
-from jsonpath_ng import jsonpath, parse
 from base64 import b64encode
+from streaming import StreamParser
+from scheduler import Scheduler
+from pypool import PythonPool
+from capture import run_streaming, DEFAULT_HEAD
+from history import History
+from context_cache import ContextCache
+from memory import MemoryStore, MEMORY_DB
+from retrieval import MemoryRetriever, format_entries
+from search import SearchEngine
+from transport import ModelTransport
+from response_cache import CachingTransport, ResponseCache, strip_readonly
+from tracing import Tracer
+from journal import Journal, SESSIONS_DIR, find_session, list_sessions, new_id, session_path
+from lazy import Lazy, LazyModule
+import files
+import tools
 
-client = genai.Client(
-    api_key = os.getenv("GEMINI_API_KEY"),
-)
+# google.genai takes most of the startup time, so it is only imported when a
+# request is built or the client is first used. Call client.warm() to create
+# the client on a background thread meanwhile.
+types = LazyModule("google.genai.types")
+
+def _make_client():
+    from google import genai
+    return genai.Client(
+        api_key = os.getenv("GEMINI_API_KEY"),
+    )
+
+client = Lazy(_make_client)
 
 DEBUG = bool(os.getenv("DEBUG")) or False
 if DEBUG: print("[+] Debug mode is enabled.")
 
-MEMORY_FILE = "memory.json"
+def _open_memory():
+    if not os.path.exists(MEMORY_DB):
+        print("[+] Memory file does not exist. Initialising new session.")
+    return MemoryStore()
 
-def write_memory(data): return json.dump(data, open(MEMORY_FILE, 'w'))
-def read_memory(): return json.load(open(MEMORY_FILE))
+memory = Lazy(_open_memory)
+memory_index = MemoryRetriever(memory)
 
-if not os.path.exists(MEMORY_FILE):
-    print("[+] Memory file does not exist. Initialising new session.")
-    write_memory({})
+def read_memory(): return memory.get()
 
 class Jasper:
-    def __init__(self, client: genai.Client, model: str = "gemini-2.5-flash", callback: Callable = None, overrides: dict = {}):
+    def __init__(self, client: "genai.Client", model: str = "gemini-2.5-flash", callback: Callable = None, overrides: dict = {}, stream: bool = False, concurrency: dict = None, timeouts: dict = None, python_pool: PythonPool = None, transport: ModelTransport = None, function_calling: bool = False):
         self.client = client
         self.model = os.getenv("GEMINI_MODEL") or model
+        self.stream = stream or bool(os.getenv("JASPER_STREAM"))
+        # Set JASPER_FUNCTION_CALLING=1 to give the model its commands as
+        # function declarations instead of execute codeblocks.
+        self.function_calling = function_calling or bool(os.getenv("JASPER_FUNCTION_CALLING"))
         self.callback = callback or (lambda *a, **k: None)
         
-        self.sys_prompt = open("sys_prompt.md").read()
+        self.sys_prompt = None
+
+        # Per-language execution timeouts in seconds, e.g. JASPER_TIMEOUT_SH=30.
+        self.timeouts = {"sh": 10, "py": 10, **(timeouts or {})}
+        for lang in self.timeouts:
+            if os.getenv(f"JASPER_TIMEOUT_{lang.upper()}"):
+                self.timeouts[lang] = float(os.getenv(f"JASPER_TIMEOUT_{lang.upper()}"))
+        # Bytes of command output kept from each end; the middle is dropped.
+        self.output_limit = int(os.getenv("JASPER_OUTPUT_LIMIT") or DEFAULT_HEAD)
+
+        # Up to memory_inline entries, the whole memory goes in the system prompt.
+        # Past that, only the memory_top_k entries most relevant to each message
+        # are sent with it.
+        self.memory_inline = int(os.getenv("JASPER_MEMORY_INLINE") or 50)
+        self.memory_top_k = int(os.getenv("JASPER_MEMORY_TOP_K") or 5)
+
+        self.overrides = overrides
+        # Rendered on first use by _config(), and again after memory changes.
+        self.prompt = None
+        self.generation_config = None
+
+        # Function calls of the last model reply, answered by _tool_content().
+        self.calls = []
+        self.reply_index = None
+
+        # Each conversation is journaled to sessions/<id>.log as it goes, so it
+        # can be resumed after a restart. Set JASPER_JOURNAL=0 to keep it in
+        # memory only.
+        self.sessions_dir = (os.getenv("JASPER_SESSIONS_DIR") or SESSIONS_DIR) if os.getenv("JASPER_JOURNAL") != "0" else None
+        self.journal_fsync = os.getenv("JASPER_JOURNAL_FSYNC") or "turn"
+        self.session_id = None
+        self.messages = None
+        self.new_session()
+
+        # Token budget for the history sent with each request.
+        self.history = History(
+            budget = int(os.getenv("JASPER_HISTORY_BUDGET") or 100_000),
+            count_tokens = (lambda contents: self.client.models.count_tokens(model=self.model, contents=contents).total_tokens) if os.getenv("JASPER_COUNT_TOKENS") else None,
+        )
+
+        # Set JASPER_PY_WORKERS=0 to run each execute:py block in a fresh interpreter.
+        # Several Jasper instances can share one pool by passing python_pool.
+        workers = int(os.getenv("JASPER_PY_WORKERS") or 2)
+        self.python_pool = python_pool or PythonPool(
+            size = workers,
+            preload = [name for name in (os.getenv("JASPER_PY_PRELOAD") or "").split(",") if name],
+            persistent = bool(os.getenv("JASPER_PY_PERSISTENT")),
+            timeout = self.timeouts["py"],
+            output_limit = self.output_limit,
+        ) if workers > 0 else None
 
+        # Large binary files for execute:analyse are uploaded once per content hash.
+        self.uploader = files.FileUploader(self.client)
+
+        # Set JASPER_SEARCH_FETCH=N to include excerpts of the top N result pages.
+        self.search = SearchEngine(fetch_pages = int(os.getenv("JASPER_SEARCH_FETCH") or 0))
+
+        # Retries, rate limiting and metrics for model calls. Set
+        # GEMINI_FALLBACK_MODEL to fall back to another model when the main
+        # one keeps failing.
+        # Set JASPER_RESPONSE_CACHE=1 to reuse model responses to repeated
+        # requests and the output of read-only commands.
+        self.response_cache = ResponseCache.from_env()
+        self.transport = CachingTransport(transport or ModelTransport(self.client), self.response_cache, self._config)
+
+        # Set JASPER_TRACE, JASPER_OTLP_ENDPOINT or JASPER_PROFILE to record
+        # where the time in each turn goes.
+        self.tracer = Tracer.from_env(lambda info: self.callback(info))
+
+        self.scheduler = Scheduler(self._execute, concurrency, lambda info: self.callback(info))
+        # Event loop send_message() runs turns on, created on first use.
+        self.loop = None
+
+        # Set JASPER_CONTEXT_CACHE=1 to keep the system prompt and large
+        # attachments in a Gemini cached content instead of resending them.
+        self.context_cache = ContextCache(
+            self.client,
+            self.model,
+            ttl = int(os.getenv("JASPER_CACHE_TTL") or 3600),
+        ) if os.getenv("JASPER_CONTEXT_CACHE") else None
+
+    def _render_prompt(self):
+        # Called again whenever memory changes, since memory is part of the prompt.
+        from jinja2 import Template
+        if self.sys_prompt is None:
+            self.sys_prompt = open("sys_prompt.md").read()
         self.prompt = Template(self.sys_prompt).render(
             system = platform.system(),
             version = platform.version(),
@@ -47,20 +155,59 @@ class Jasper:
             is_admin = self._is_admin(),
             user = getpass.getuser(),
             device_name = platform.node(),
-            memory = read_memory(),
+            memory = self._memory_summary(),
+            timeouts = ", ".join(f"{lang}: {timeout:g}" for lang, timeout in self.timeouts.items()),
+            function_calling = self.function_calling,
         )
 
-        self.overrides = overrides
+        if self.overrides.get("sys_prompt"):
+            self.prompt += "\n" + self.overrides["sys_prompt"]
 
-        if overrides.get("sys_prompt"):
-            self.prompt += "\n" + overrides["sys_prompt"]
+        self.generation_config = types.GenerateContentConfig(
+            system_instruction=self.prompt,
+            tools=[tools.tool(self.overrides)] if self.function_calling else None,
+        )
 
-        self.messages = []
+    def _config(self):
+        if self.generation_config is None:
+            self._render_prompt()
+        return self.generation_config
 
-        self.generation_config = types.GenerateContentConfig(
-            system_instruction=self.prompt
+    def warm(self):
+        # Prepares everything the first request needs on a background thread,
+        # so the first message does not wait for it.
+        def prepare():
+            try:
+                self.client.models
+                self._config()
+            except Exception:
+                # Raised again by the first request.
+                pass
+        thread = threading.Thread(target=prepare, daemon=True)
+        thread.start()
+        return thread
+
+    def _memory_summary(self):
+        if len(memory_index) <= self.memory_inline:
+            return read_memory()
+        # Kept independent of the number of entries so the prompt (and any
+        # context cache) only changes when a new top-level key appears.
+        return (
+            f"(Memory is too large to include in full. It has these top-level keys: {', '.join(memory.keys())}. "
+            "The entries most relevant to each user message are attached to it. "
+            "Use memory:search or memory:fetch to look up anything else.)"
         )
 
+    def _relevant_memory(self, message):
+        if len(memory_index) <= self.memory_inline:
+            return None
+        with self.tracer.span("memory.retrieve") as span:
+            entries = memory_index.search(message, self.memory_top_k)
+            span.set(entries = len(entries))
+        if not entries:
+            return None
+        return "SYSTEM: Relevant memory:\n" + format_entries(entries)
+
     def _is_admin(self):
         try:
             # Windows
@@ -85,46 +232,74 @@ class Jasper:
         matches = re.findall(pattern, text, re.DOTALL)
         return matches  # List of tuples: (lang, code)
     
-    def _execute_code(self, command_tuple):
+    async def _run_process(self, lang, args, shell=False):
+        return await run_streaming(
+            args,
+            shell = shell,
+            timeout = self.timeouts[lang],
+            progress = lambda info: self.callback({"progress": {"lang": lang, **info}}),
+            head = self.output_limit,
+            tail = self.output_limit,
+        )
+
+    async def _execute_code(self, command_tuple):
+        # Processes are run on the event loop, and everything else, which
+        # may block, in a thread.
         lang, code = command_tuple
-        if lang == "sh":
-            self.callback({"state": "executing"})
-            result = subprocess.run(code, shell=True, capture_output=True, text=True, timeout=10)
-            self.callback({"state":"idle"})
-            return result.stdout + result.stderr
-        elif lang == "py":
+        if lang == "sh" or (lang == "py" and not self.python_pool):
             self.callback({"state": "executing"})
             try:
-                result = subprocess.run(
-                    [sys.executable, "-c", code],
-                    capture_output=True,
-                    text=True,
-                    timeout=10
-                )
+                if lang == "sh":
+                    return await self._run_process(lang, code, shell=True)
+                return await self._run_process(lang, [sys.executable, "-c", code])
+            finally:
                 self.callback({"state":"idle"})
-                return result.stdout + result.stderr
+        if lang == "py":
+            self.callback({"state": "executing"})
+            try:
+                return await asyncio.to_thread(self.python_pool.run, code, owner = self)
+            except asyncio.CancelledError:
+                # The pool may be shared; only stop this Jasper's code.
+                self.python_pool.interrupt(self)
+                raise
             except Exception as e:
-                self.callback({"state":"idle"})
                 return f"Python exec error: {e}"
-        elif lang == "search":
-            res = "## Search Results"
+            finally:
+                self.callback({"state":"idle"})
+        return await asyncio.to_thread(self._run_tool, lang, code)
+
+    def _run_tool(self, lang, code):
+        if lang in ("search", "search:fetch"):
             self.callback({"state":"searching"})
-            results = googlesearch.search(code, advanced=True)
-            self.callback({"state":"idle"})
-            for result in results:
-                res += f"\n### {result.title}\n{result.url}\n{result.description}"
-            return res
+            try:
+                return self.search.search(code, fetch = lang == "search:fetch")
+            finally:
+                self.callback({"state":"idle"})
         elif lang.startswith("analyse"):
-            _, mimetype = lang.split(":")
+            _, mimetype, *view = lang.split(":")
             mimetype = mimetype.strip().lower()
             filepath = code.strip()
             if mimetype == "text/plain":
-                return f"File: {filepath}\n\n{open(filepath).read()}"
-            data = open(filepath, 'rb').read()
-            filepart = types.Part.from_bytes(
-                data=data,
-                mime_type=mimetype,
-            )
+                if view == ["grep"]:
+                    filepath, _, pattern = filepath.partition("\n")
+                    return f"File: {filepath}\n\n{files.grep(filepath.strip(), pattern.strip())}"
+                if len(view) == 2:
+                    return f"File: {filepath}\n\n{files.read_range(filepath, int(view[0]), int(view[1]))}"
+                return f"File: {filepath}\n\n{files.read_text(filepath)}"
+            if os.path.getsize(filepath) > files.INLINE_BYTES:
+                self.callback({"state":"analysing"})
+                try:
+                    uri, mimetype = self.uploader.upload(filepath, mimetype)
+                finally:
+                    self.callback({"state":"idle"})
+                filepart = types.Part.from_uri(file_uri=uri, mime_type=mimetype)
+            else:
+                with open(filepath, 'rb') as f:
+                    data = f.read()
+                filepart = types.Part.from_bytes(
+                    data=data,
+                    mime_type=mimetype,
+                )
             contents = types.Content(
                 role = "user",
                 parts = [
@@ -135,6 +310,9 @@ class Jasper:
             self.messages.append(contents)
             return "The file has been attached for you to work with."
         elif lang.startswith("memory"):
+            if lang.startswith("memory:search"):
+                query = lang[len("memory:search:"):] or code.strip()
+                return format_entries(memory_index.search(query, self.memory_top_k)) or "No matching memories."
             command = lang.split(":")
             if len(command) > 3 or len(command) < 2:
                 return "Invalid usage of memory tool. Refer to system prompt for usage guidelines."
@@ -142,28 +320,12 @@ class Jasper:
             if len(command) == 2 and verb == "fetch":
                 return str(read_memory())
             elif verb == "fetch":
-                path = command[2]
-                path = parse(path)
-                matches = path.find(read_memory())
-                values = [match.value for match in matches]
-                return str(values)
+                return str(memory.find(command[2]))
             elif verb == "store":
                 if len(command) < 3:
                     return "Missing path for store command."
-                path = command[2]
-                mem = read_memory()
-
-                def set_in_dict(data, path, value):
-                    keys = path.split('.')
-                    d = data
-                    for key in keys[:-1]:
-                        if key not in d or not isinstance(d[key], dict):
-                            d[key] = {}
-                        d = d[key]
-                    d[keys[-1]] = value
-
-                set_in_dict(mem, path, code.strip())
-                write_memory(mem)
+                memory.set(command[2], code.strip())
+                self._render_prompt()
                 return "Memory updated."
             
         elif self.overrides.get("execute") and self.overrides["execute"].get(lang):
@@ -171,56 +333,259 @@ class Jasper:
         else:
             return f"Unknown execution language: {lang}"
         
-    def send_message(self, message):
-        self.messages.append(types.Content(
-            role = "user",
-            parts = [
-                types.Part(text = message)
-            ],
-        ))
-        self.callback({"state":"thinking"})
-        res = self.client.models.generate_content(
-            model = self.model,
-            contents = self.messages,
-            config = self.generation_config,
-        )
-        self.callback({"state":"idle"})
-        output = res.text
-        if DEBUG: print(output)
-        self.messages.append(types.Content(
+    def _cached_tool(self, command):
+        # Returns (cached output or None, key to store the output under).
+        cached = self.response_cache.tool_key(*command) if self.response_cache.enabled else None
+        if cached is None:
+            return None, None
+        return self.response_cache.get_tool(cached[0]), cached
+
+    async def _execute(self, command):
+        lang, code = command
+        with self.tracer.span("execute", lang = lang, code_bytes = len(code.encode())) as span:
+            output, cached = await asyncio.to_thread(self._cached_tool, command)
+            if output is not None:
+                span.set(cached = True)
+                return output
+            try:
+                output = await self._execute_code((strip_readonly(lang), code))
+            except Exception as e:
+                output = f"Error executing: {e}"
+                span.set(error = str(e))
+            if cached:
+                await asyncio.to_thread(self.response_cache.put_tool, *cached, output)
+            span.set(output_bytes = len(str(output).encode()))
+            return output
+
+    def _traced_callback(self, span):
+        # Passes transport events on, recording the model call's usage on `span`.
+        def callback(info):
+            if call := info.get("model_call"):
+                span.set(
+                    model = call.get("model"),
+                    attempts = call.get("attempts"),
+                    prompt_tokens = call.get("prompt_tokens"),
+                    output_tokens = call.get("output_tokens"),
+                    first_chunk_seconds = call.get("first_chunk_seconds"),
+                )
+            self.callback(info)
+        return callback
+
+    def _request(self):
+        # Returns the (contents, config) for the next model call.
+        contents, config = self.messages, self._config()
+        if self.context_cache:
+            contents, config = self.context_cache.prepare(config, contents)
+        with self.tracer.span("history.compact") as span:
+            contents, stats = self.history.compact(contents)
+            span.set(**stats)
+        self.callback({"payload": stats})
+        if DEBUG: print(f"[+] Request payload: {stats}")
+        return contents, config
+
+    async def _respond(self):
+        # One model round trip. Returns the raw output and the outputs of any
+        # commands it contained, in order. The reply is always parsed as it
+        # arrives, so with streaming, prose is sent to the callback as it
+        # arrives and each block starts as soon as its closing fence is seen.
+        parser = StreamParser(commands = not self.function_calling)
+        reply = tools.Reply() if self.function_calling else None
+        output = ""
+        calls = []
+        tasks = []
+        # Commands such as analyse may append to self.messages while the
+        # model is still writing, so remember where the model turn belongs.
+        index = len(self.messages)
+
+        def handle(events):
+            for kind, value in events:
+                if kind == "message":
+                    if self.stream:
+                        self.callback({"message": value})
+                else:
+                    tasks.append(self.scheduler.submit(value))
+
+        with self.tracer.span("model_call", model = self.model, stream = self.stream) as span:
+            contents, config = await asyncio.to_thread(self._request)
+            self.callback({"state": "thinking"})
+            try:
+                if self.stream:
+                    async for chunk in self.transport.generate_stream_async(
+                        model = self.model,
+                        contents = contents,
+                        config = config,
+                        callback = self._traced_callback(span),
+                    ):
+                        if reply:
+                            text, calls = reply.add(chunk)
+                        else:
+                            text, calls = chunk.text or "", []
+                        output += text
+                        handle(parser.feed(text))
+                        # Calls arrive whole, so each one can start right away.
+                        handle([("execute", tools.command(call)) for call in calls])
+                else:
+                    res = await self.transport.generate_async(
+                        model = self.model,
+                        contents = contents,
+                        config = config,
+                        callback = self._traced_callback(span),
+                    )
+                    if reply:
+                        output, calls = reply.add(res)
+                    else:
+                        output = res.text or ""
+                self.callback({"state": "idle"})
+                span.set(output_bytes = len(output.encode()))
+            except asyncio.CancelledError:
+                for task in tasks:
+                    task.cancel()
+                raise
+        try:
+            if DEBUG: print(output)
+            if reply:
+                self._add_reply(index, reply)
+            else:
+                self.messages.insert(index, self._model_content(output))
+            if not self.stream:
+                self.callback({"message": output.strip() if reply else self._strip_codeblocks(output)})
+                handle(parser.feed(output))
+                handle([("execute", tools.command(call)) for call in calls])
+            handle(parser.close())
+            return output, list(await asyncio.gather(*tasks))
+        except asyncio.CancelledError:
+            for task in tasks:
+                task.cancel()
+            raise
+
+    def _add_reply(self, index, reply):
+        # Inserts a function calling reply at `index`; its calls are answered
+        # by the next _tool_content().
+        self.messages.insert(index, reply.content())
+        self.reply_index = index
+        self.calls = reply.calls
+
+    def _journal(self, session_id):
+        path = session_path(self.sessions_dir, session_id) if self.sessions_dir else None
+        return Journal(path, fsync = self.journal_fsync, on_load = self._resumed_content)
+
+    def new_session(self):
+        # Starts a new conversation; the current one stays in its journal.
+        if self.messages is not None:
+            self.messages.close()
+        self.session_id = new_id()
+        self.messages = self._journal(self.session_id)
+        self.calls, self.reply_index = [], None
+
+    def sessions(self):
+        return list_sessions(self.sessions_dir) if self.sessions_dir else []
+
+    def resume(self, session_id):
+        # Continues a saved conversation. `session_id` can be any unique
+        # prefix of its id. Returns the full id.
+        if not self.sessions_dir:
+            raise KeyError("Sessions are not saved while JASPER_JOURNAL=0.")
+        session_id = find_session(self.sessions_dir, session_id)
+        self.messages.close()
+        self.session_id = session_id
+        self.messages = self._journal(session_id)
+        self.calls, self.reply_index = [], None
+        self._answer_interrupted()
+        return session_id
+
+    def _answer_interrupted(self, output="Not run: the session was interrupted."):
+        # Function calls the session stopped before answering need responses
+        # before the model can be called again.
+        for index in range(len(self.messages) - 1, -1, -1):
+            content = self.messages[index]
+            if content.role == "model":
+                calls = [part.function_call for part in content.parts or [] if part.function_call]
+                if calls:
+                    self.reply_index, self.calls = index, calls
+                    self.messages.append(self._function_responses([output] * len(calls)))
+                return
+            if any(part.function_response for part in content.parts or []):
+                return
+
+    def _resumed_content(self, content):
+        # Uploaded files expire after 48 hours; a resumed session refers to
+        # the ones that have by name only.
+        if not any(part.file_data for part in content.parts or []):
+            return content
+        parts = [
+            types.Part(text = f"[Attachment {part.file_data.file_uri} has expired. Attach the file again if you need it.]")
+            if part.file_data and self.uploader.expired(part.file_data.file_uri) else part
+            for part in content.parts
+        ]
+        return content.model_copy(update = {"parts": parts})
+
+    def _model_content(self, output):
+        return types.Content(
             role = "model",
             parts = [
                 types.Part(text = output)
             ],
-        ))
-        commands = self._process_output(output)
-        while commands:
-            self.callback({"message": self._strip_codeblocks(output)})
-            responses = "SYSTEM: Command Output:\n\n"
-            for command in commands:
-                try:
-                    res = self._execute_code(command)
-                except Exception as e:
-                    res = f"Error executing: {e}"
-                responses += res + "\n"
-            responses += "All commands executed. Remember that the user cannot see this output and cannot see your command(s) either, so you must explain it to them if necessary."
-            if DEBUG: print(responses)
-            
-            self.messages.append(types.Content(role="user", parts=[types.Part(text=responses)]))
-            self.callback({"state":"thinking"})
-            res = self.client.models.generate_content(
-                model=self.model,
-                contents=self.messages,
-                config=self.generation_config,
-            )
-            self.callback({"state":"idle"})
-            output = res.text
-            if DEBUG: print(output)
-            self.messages.append(types.Content(
-                role = "model",
-                parts = [
-                    types.Part(text = output)
-                ],
-            ))
-            commands = self._process_output(output)
-        self.callback({"message": self._strip_codeblocks(output)})
\ No newline at end of file
+        )
+
+    def _user_content(self, message):
+        parts = [types.Part(text = message)]
+        if relevant := self._relevant_memory(message):
+            parts.append(types.Part(text = relevant))
+        return types.Content(
+            role = "user",
+            parts = parts,
+        )
+
+    def _tool_content(self, results):
+        if self.function_calling:
+            return self._function_responses(results)
+        responses = "SYSTEM: Command Output:\n\n"
+        for res in results:
+            responses += res + "\n"
+        responses += "All commands executed. Remember that the user cannot see this output and cannot see your command(s) either, so you must explain it to them if necessary."
+        if DEBUG: print(responses)
+        return types.Content(role="user", parts=[types.Part(text=responses)])
+
+    def _function_responses(self, results):
+        # Function responses have to directly follow the calls, so files
+        # attached by analyse since the reply are moved in after them.
+        attached = self.messages[self.reply_index + 1:]
+        del self.messages[self.reply_index + 1:]
+        parts = [tools.response_part(call, output) for call, output in zip(self.calls, results)]
+        parts += [part for content in attached for part in content.parts or []]
+        if DEBUG: print(results)
+        return types.Content(role="user", parts=parts)
+
+    async def _turn(self, message):
+        with self.tracer.turn(message_bytes = len(message.encode())) as turn:
+            try:
+                self.messages.append(self._user_content(message))
+                output, results = await self._respond()
+                while results:
+                    self.messages.append(self._tool_content(results))
+                    output, results = await self._respond()
+                turn.set(messages = len(self.messages))
+            finally:
+                self.response_cache.refreshing = False
+                await asyncio.to_thread(self._end_turn)
+
+    def _end_turn(self):
+        # Memory stores are committed once per turn, in one transaction.
+        with self.tracer.span("memory.flush"):
+            memory.flush()
+        self.messages.commit()
+
+    def close(self):
+        # Closes the journal and the event loop; a shared python_pool is
+        # left to its owner.
+        self.messages.close()
+        if self.loop is not None:
+            self.loop.close()
+            self.loop = None
+
+    def send_message(self, message):
+        # Runs a turn to completion on this Jasper's own event loop, from any
+        # one thread at a time. Code already on a loop should use AsyncJasper.
+        if self.loop is None:
+            self.loop = asyncio.new_event_loop()
+        return self.loop.run_until_complete(self._turn(message))
@@ -0,0 +1,67 @@
+# On-disk cache of models converted to Panda3D's native BAM format, so GLB
+# files are only parsed once. Entries are keyed by the source file's content
+# hash; the manifest remembers each source's mtime and size so unchanged files
+# are not re-hashed on every start.
+
+import json
+import os
+import threading
+
+from files import file_hash
+
+ASSET_CACHE_DIR = "models/cache"
+
+
+class AssetCache:
+    def __init__(self, directory: str = ASSET_CACHE_DIR):
+        self.directory = directory
+        self.manifest_path = os.path.join(directory, "manifest.json")
+        self.lock = threading.Lock()
+        self.manifest = {}
+        os.makedirs(directory, exist_ok=True)
+        if os.path.exists(self.manifest_path):
+            try:
+                with open(self.manifest_path) as f:
+                    self.manifest = json.load(f)
+            except (ValueError, OSError):
+                pass
+
+    def _key(self, path):
+        # Content hash of `path`, reusing the manifest entry while mtime and size match.
+        stat = os.stat(path)
+        source = os.path.abspath(path)
+        with self.lock:
+            entry = self.manifest.get(source)
+        if entry and entry["mtime"] == stat.st_mtime and entry["size"] == stat.st_size:
+            return entry["hash"]
+        digest = file_hash(path)
+        with self.lock:
+            self.manifest[source] = {"mtime": stat.st_mtime, "size": stat.st_size, "hash": digest}
+            self._save()
+        return digest
+
+    def _bam_path(self, digest):
+        return os.path.join(self.directory, f"{digest}.bam")
+
+    def lookup(self, path):
+        # The cached BAM file for `path`, or None if it has not been converted yet.
+        bam = self._bam_path(self._key(path))
+        return bam if os.path.exists(bam) else None
+
+    def resolve(self, path):
+        # The file to load for `path`: its cached BAM file if there is one.
+        return self.lookup(path) or path
+
+    def store(self, path, node_path):
+        # Writes a loaded model to the cache.
+        bam = self._bam_path(self._key(path))
+        temp = f"{bam}.tmp.bam"
+        if node_path.writeBamFile(temp):
+            os.replace(temp, bam)
+        return bam
+
+    def _save(self):
+        temp = f"{self.manifest_path}.tmp"
+        with open(temp, "w") as f:
+            json.dump(self.manifest, f)
+        os.replace(temp, self.manifest_path)
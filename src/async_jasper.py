@@ -0,0 +1,57 @@
+import asyncio
+
+from actions import Jasper
+
+
+class AsyncJasper(Jasper):
+    # Jasper for code that runs its own event loop: send_message() is a
+    # coroutine running the same turn Jasper.send_message() does. Messages
+    # passed to submit() are handled one turn at a time by serve(); cancel()
+    # stops the current turn and kills the processes it started.
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.inbox = None
+        self.turn = None
+
+    @property
+    def busy(self):
+        return self.turn is not None and not self.turn.done()
+
+    async def send_message(self, message):
+        await self._turn(message)
+
+    def submit(self, message):
+        # Queues a message for serve(); returns a future for its turn.
+        if self.inbox is None:
+            self.inbox = asyncio.Queue()
+        future = asyncio.get_running_loop().create_future()
+        # Errors are also reported through the callback, so don't warn if
+        # nobody awaits the future.
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self.inbox.put_nowait((message, future))
+        return future
+
+    def cancel(self):
+        if self.busy:
+            self.turn.cancel()
+
+    async def serve(self):
+        if self.inbox is None:
+            self.inbox = asyncio.Queue()
+        while True:
+            message, future = await self.inbox.get()
+            self.turn = asyncio.create_task(self.send_message(message))
+            await asyncio.wait({self.turn})
+            if self.turn.cancelled():
+                self._answer_interrupted("Cancelled by the user.")
+                await asyncio.to_thread(self.messages.commit)
+                self.callback({"state": "idle"})
+                self.callback({"cancelled": True})
+                future.cancel()
+            elif self.turn.exception():
+                self.callback({"state": "idle"})
+                self.callback({"message": f"Error: {self.turn.exception()}"})
+                future.set_exception(self.turn.exception())
+            else:
+                future.set_result(None)
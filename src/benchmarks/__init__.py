@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The fake model client the benchmarks run against lives with the tests.
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "tests"))
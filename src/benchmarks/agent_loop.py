@@ -0,0 +1,276 @@
+# End-to-end benchmark of the agent loop. Replays scripted transcripts
+# (benchmarks/transcripts/*.json) through Jasper.send_message with a fake
+# model, running the execute blocks for real, and measures turn latency, time
+# spent per kind of block, history growth, memory store throughput and parser
+# cost on large outputs. Results are written as a flat JSON report that can be
+# compared against an earlier one to catch regressions.
+#
+# Run from src/:
+#   python -m benchmarks.agent_loop [--output report.json] [--compare baseline.json]
+#
+# A transcript is {"name", "description", "turns": [{"user": ..., "model": [...]}]},
+# where "model" lists the model's replies for that turn in order: one per
+# model call, so a reply with execute blocks is followed by the next reply.
+
+import argparse
+import glob
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+import actions
+from actions import Jasper
+from fake_genai import FakeClient, FakeModels
+from memory import MemoryStore
+from retrieval import MemoryRetriever
+from search import SearchCache, SearchEngine, StubBackend
+from streaming import StreamParser
+from tracing import Tracer
+
+TRANSCRIPTS = os.path.join(os.path.dirname(__file__), "transcripts")
+
+
+class SpanCollector:
+    def __init__(self):
+        self.spans = []
+
+    def export(self, spans):
+        self.spans.extend(spans)
+
+    def flush(self):
+        pass
+
+
+class Script:
+    # Model replies in transcript order; a fake model that answers off script
+    # is a broken transcript, not a slow one.
+
+    def __init__(self, replies):
+        self.replies = list(replies)
+        self.position = 0
+
+    def __call__(self, contents):
+        if self.position >= len(self.replies):
+            raise RuntimeError("The transcript has no more model replies; it does not match the agent loop.")
+        self.position += 1
+        return self.replies[self.position - 1]
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else 0.0
+
+def union_seconds(intervals):
+    total = 0.0
+    end = None
+    for start, stop in sorted(intervals):
+        if end is None or start > end:
+            total += stop - start
+            end = stop
+        elif stop > end:
+            total += stop - end
+            end = stop
+    return total
+
+def run_transcript(transcript, stream, latency):
+    script = Script(reply for turn in transcript["turns"] for reply in turn["model"])
+    payloads = []
+    jasper = Jasper(
+        FakeClient(FakeModels(script, latency=latency)),
+        stream = stream,
+        callback = lambda info: payloads.append(info["payload"]) if "payload" in info else None,
+    )
+    collector = SpanCollector()
+    jasper.tracer = Tracer([collector])
+    jasper.search = SearchEngine(backend=StubBackend(), cache=SearchCache(path=None))
+    # Prompt rendering is part of startup (see benchmarks.startup), not of a turn.
+    jasper._config()
+
+    turns = []
+    history = []
+    try:
+        for turn in transcript["turns"]:
+            expected = script.position + len(turn["model"])
+            start = time.perf_counter()
+            jasper.send_message(turn["user"])
+            turns.append(time.perf_counter() - start)
+            if script.position != expected:
+                raise RuntimeError(f"{transcript['name']}: turn {turn['user']!r} used {script.position - expected + len(turn['model'])} replies, expected {len(turn['model'])}.")
+            history.append(payloads[-1])
+    finally:
+        if jasper.python_pool:
+            jasper.python_pool.close()
+        jasper.close()
+
+    spans = {}
+    for span in collector.spans:
+        key = span.name if span.name != "execute" else f"execute.{span.attributes['lang'].split(':')[0]}"
+        spans.setdefault(key, []).append(span.duration)
+
+    name = transcript["name"]
+    metrics = {
+        f"{name}.turn_p50_ms": statistics.median(turns) * 1000,
+        f"{name}.turn_p95_ms": percentile(turns, 0.95) * 1000,
+        f"{name}.turn_total_ms": sum(turns) * 1000,
+        f"{name}.history_messages": len(jasper.messages),
+        f"{name}.history_bytes": history[-1]["bytes"],
+        f"{name}.history_tokens": history[-1]["tokens"],
+        f"{name}.history_bytes_per_turn": (history[-1]["bytes"] - history[0]["bytes"]) / max(len(history) - 1, 1),
+    }
+    for key, durations in spans.items():
+        if key != "turn":
+            metrics[f"{name}.{key}_p50_ms"] = statistics.median(durations) * 1000
+            metrics[f"{name}.{key}_total_ms"] = sum(durations) * 1000
+    # Time in turns outside model calls and blocks (which may overlap):
+    # parsing, history, scheduling.
+    busy = union_seconds(
+        (span.start_ns / 1e9, span.start_ns / 1e9 + span.duration)
+        for span in collector.spans if span.name in ("model_call", "execute")
+    )
+    metrics[f"{name}.loop_overhead_ms"] = max(sum(turns) - busy, 0) * 1000
+    return metrics
+
+
+def bench_memory(entries):
+    with tempfile.TemporaryDirectory() as directory:
+        store = MemoryStore(os.path.join(directory, "memory.db"), legacy=os.path.join(directory, "memory.json"))
+        start = time.perf_counter()
+        for i in range(entries):
+            store.set(f"topic_{i % 50}.item_{i}", f"value number {i}")
+        store.flush()
+        stored = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for i in range(entries):
+            store.find(f"topic_{i % 50}.item_{i}")
+        found = time.perf_counter() - start
+
+        index = MemoryRetriever(store)
+        start = time.perf_counter()
+        for i in range(200):
+            index.search(f"value number {i}", 5)
+        searched = time.perf_counter() - start
+        store.close()
+    return {
+        "memory.store_per_s": entries / stored,
+        "memory.find_per_s": entries / found,
+        "memory.search_per_s": 200 / searched,
+    }
+
+
+def large_output(size):
+    # Prose with execute blocks scattered through it, about `size` bytes.
+    chunk = "Here is some explanation of what I am going to do next, and why.\n" * 20
+    block = "```execute:sh\necho " + "x" * 200 + "\n```\n"
+    text = ""
+    while len(text) < size:
+        text += chunk + block
+    return text
+
+def bench_parser(size, chunk_size):
+    text = large_output(size)
+    megabytes = len(text) / 1e6
+
+    start = time.perf_counter()
+    parser = StreamParser()
+    events = 0
+    for i in range(0, len(text), chunk_size):
+        events += len(parser.feed(text[i:i + chunk_size]))
+    events += len(parser.close())
+    streamed = time.perf_counter() - start
+
+    jasper = Jasper.__new__(Jasper)
+    start = time.perf_counter()
+    jasper._process_output(text)
+    jasper._strip_codeblocks(text)
+    regex = time.perf_counter() - start
+    return {
+        "parser.stream_mb_per_s": megabytes / streamed,
+        "parser.regex_mb_per_s": megabytes / regex,
+    }
+
+
+def lower_is_better(key):
+    return not key.endswith("_per_s")
+
+def compare(report, baseline, threshold, min_delta_ms):
+    # Returns the metrics that got worse by more than `threshold`.
+    regressions = []
+    for key, old in baseline["metrics"].items():
+        new = report["metrics"].get(key)
+        if new is None or not old:
+            continue
+        change = (new - old) / abs(old)
+        worse = change if lower_is_better(key) else -change
+        if key.endswith("_ms") and abs(new - old) < min_delta_ms:
+            continue
+        if worse > threshold:
+            regressions.append((key, old, new, change))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--transcripts", default=os.path.join(TRANSCRIPTS, "*.json"))
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per transcript; the median of each metric is reported.")
+    parser.add_argument("--stream", action="store_true", help="Use the streaming code path.")
+    parser.add_argument("--latency", type=float, default=0, help="Fake model latency in seconds.")
+    parser.add_argument("--memory-entries", type=int, default=2000)
+    parser.add_argument("--parser-bytes", type=int, default=2_000_000)
+    parser.add_argument("--output", help="Write the JSON report here.")
+    parser.add_argument("--compare", help="Baseline report to compare against; exits with 1 on regressions.")
+    parser.add_argument("--threshold", type=float, default=0.25, help="Relative change counted as a regression.")
+    parser.add_argument("--min-delta-ms", type=float, default=2.0, help="Ignore timing changes smaller than this.")
+    args = parser.parse_args()
+
+    # Keep the user's memory and sessions out of it.
+    workdir = tempfile.mkdtemp(prefix="jasper-bench-")
+    actions.memory = MemoryStore(os.path.join(workdir, "memory.db"), legacy=os.path.join(workdir, "memory.json"))
+    os.environ["JASPER_SESSIONS_DIR"] = os.path.join(workdir, "sessions")
+    actions.memory_index = MemoryRetriever(actions.memory)
+
+    runs = []
+    for _ in range(args.repeat):
+        metrics = {}
+        for path in sorted(glob.glob(args.transcripts)):
+            with open(path) as f:
+                metrics.update(run_transcript(json.load(f), args.stream, args.latency))
+        metrics.update(bench_memory(args.memory_entries))
+        metrics.update(bench_parser(args.parser_bytes, 64))
+        runs.append(metrics)
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "repeat": args.repeat,
+            "stream": args.stream,
+            "latency": args.latency,
+        },
+        "metrics": {key: round(statistics.median(run[key] for run in runs if key in run), 3) for key in runs[0]},
+    }
+
+    for key, value in report["metrics"].items():
+        print(f"{key:<45} {value:>14,.3f}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+            f.write("\n")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold, args.min_delta_ms)
+        for key, old, new, change in regressions:
+            print(f"REGRESSION {key}: {old:,.3f} -> {new:,.3f} ({change:+.0%})")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions against {args.compare}.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+# Time to the GUI's first frame, and the 3D view's frame rate and CPU usage
+# while the avatar idles. Starts main.py as it is run normally (it needs a
+# display, Panda3D and the models), so the numbers include everything the
+# user waits for.
+#
+# Startup modes:
+#   before - every animation loaded before the first frame, from a fresh
+#            asset cache each run, like the GUI did before the BAM cache
+#            (plus the time to write the BAM files)
+#   cold   - only idle loaded before the first frame, fresh asset cache
+#   warm   - only idle loaded before the first frame, converted models
+#            loaded from the asset cache
+#
+# With --idle SECONDS, main.py is also left idle that long after the first
+# frame, once rendering at a fixed 60 fps (JASPER_IDLE_FPS=60, what the
+# render loop used to do) and once at the default idle rate, and its frame
+# reports are averaged. Keep the window focused and uncovered meanwhile.
+#
+# Run from src/: python -m benchmarks.gui_startup [--runs 3] [--idle 20]
+
+import argparse
+import os
+import queue
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+FIRST_FRAME = "Time to first frame:"
+FRAMES = "[frames]"
+
+def run_gui(env, idle = 0, timeout = 120):
+    # Time to first frame (ms) of one run of main.py, and the frame reports
+    # it printed in the `idle` seconds after.
+    process = subprocess.Popen(
+        [sys.executable, "-u", "main.py"],
+        stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True,
+        env={**os.environ, "JASPER_PROFILE_STARTUP": "1", "JASPER_PROFILE_FRAMES": "1", **env},
+    )
+    lines = queue.Queue()
+    def read():
+        for line in process.stdout:
+            lines.put(line)
+    threading.Thread(target=read, daemon=True).start()
+    first_frame = None
+    reports = []
+    output = []
+    deadline = time.monotonic() + timeout
+    try:
+        while time.monotonic() < deadline and process.poll() is None:
+            try:
+                line = lines.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            output.append(line)
+            if line.startswith(FIRST_FRAME):
+                first_frame = float(line[len(FIRST_FRAME):].split()[0])
+                deadline = time.monotonic() + idle
+            elif line.startswith(FRAMES) and first_frame is not None:
+                reports.append(line)
+    finally:
+        process.terminate()
+        process.wait()
+    if first_frame is None:
+        raise RuntimeError("main.py did not render a frame:\n" + "".join(output[-40:]))
+    return first_frame, reports
+
+def parse_report(line):
+    # "[frames] target 15 fps, actual 14.9 fps, frame 1.2 ms avg / 3.4 ms max, CPU 2.1%"
+    words = line.replace(",", "").replace("%", "").split()
+    return {"fps": float(words[5]), "frame_ms": float(words[8]), "cpu_percent": float(words[-1])}
+
+def startup(mode, runs):
+    times = []
+    cache = tempfile.mkdtemp(prefix="jasper-assets-")
+    try:
+        if mode == "warm":
+            run_gui({"JASPER_ASSET_CACHE": cache})
+            # The first run converts the clips in the background after the first frame.
+            run_gui({"JASPER_ASSET_CACHE": cache}, idle=5)
+        for _ in range(runs):
+            env = {"JASPER_ASSET_CACHE": cache}
+            if mode == "before":
+                env["JASPER_EAGER_ANIMATIONS"] = "1"
+            if mode in ("before", "cold"):
+                shutil.rmtree(cache)
+                os.makedirs(cache)
+            times.append(run_gui(env)[0])
+    finally:
+        shutil.rmtree(cache, ignore_errors=True)
+    return times
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--modes", default="before,cold,warm")
+    parser.add_argument("--idle", type=float, default=0, help="Seconds to measure the idle frame rate for.")
+    args = parser.parse_args()
+
+    print(f"{'mode':>8} {'first frame (ms)':>17} {'min (ms)':>9}")
+    for mode in args.modes.split(","):
+        times = startup(mode, args.runs)
+        print(f"{mode:>8} {statistics.median(times):>17.0f} {min(times):>9.0f}")
+
+    if args.idle:
+        print(f"\n{'render loop':>12} {'fps':>6} {'frame (ms)':>11} {'CPU (%)':>8}")
+        for name, env in [("fixed 60", {"JASPER_IDLE_FPS": "60"}), ("adaptive", {})]:
+            _, reports = run_gui(env, idle=args.idle)
+            # The first report includes startup.
+            stats = [parse_report(line) for line in reports[1:] or reports]
+            if not stats:
+                print(f"{name:>12} no frame reports; use --idle 10 or more")
+                continue
+            print(f"{name:>12} {statistics.mean(s['fps'] for s in stats):>6.1f} {statistics.mean(s['frame_ms'] for s in stats):>11.2f} {statistics.mean(s['cpu_percent'] for s in stats):>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
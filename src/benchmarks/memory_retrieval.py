@@ -0,0 +1,62 @@
+# Prompt size and lookup latency as memory grows: dumping the whole memory
+# into the prompt vs attaching the top-k entries found by the BM25 index,
+# and the cost of a memory:store, which updates the index and the prompt.
+# Run from src/: python -m benchmarks.memory_retrieval [--sizes 10,100,1000,10000]
+
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from memory import MemoryStore
+from retrieval import MemoryRetriever, format_entries
+
+WORDS = "coffee birthday dentist python project meeting sister laptop password wifi garden movie flight hotel budget recipe".split()
+
+def fill(store, size, rng):
+    for i in range(size):
+        topic = rng.choice(WORDS)
+        store.set(f"{topic}.item_{i}", " ".join(rng.choice(WORDS) for _ in range(8)))
+    store.flush()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="10,100,1000,10000")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--stores", type=int, default=50)
+    args = parser.parse_args()
+    rng = random.Random(0)
+
+    print(f"{'entries':>8} {'full prompt (chars)':>20} {'top-k (chars)':>14} {'index build (ms)':>17} {'search (ms)':>12} {'store (ms)':>11}")
+    for size in [int(size) for size in args.sizes.split(",")]:
+        with tempfile.TemporaryDirectory() as directory:
+            store = MemoryStore(os.path.join(directory, "memory.db"), legacy=None, batch_size=1000)
+            fill(store, size, rng)
+            retriever = MemoryRetriever(store)
+
+            full = len(str(store.get()))
+            start = time.perf_counter()
+            len(retriever)
+            build = (time.perf_counter() - start) * 1000
+
+            queries = [" ".join(rng.choice(WORDS) for _ in range(3)) for _ in range(args.queries)]
+            start = time.perf_counter()
+            attached = [len(format_entries(retriever.search(query, args.top_k))) for query in queries]
+            search = (time.perf_counter() - start) * 1000 / len(queries)
+
+            # What a memory:store costs Jasper: the write, then the index
+            # and the prompt's list of top-level keys.
+            start = time.perf_counter()
+            for i in range(args.stores):
+                store.set(f"{rng.choice(WORDS)}.item_{rng.randrange(size)}", " ".join(rng.choice(WORDS) for _ in range(8)))
+                len(retriever)
+                store.keys()
+            stored = (time.perf_counter() - start) * 1000 / args.stores
+            store.close()
+
+        print(f"{size:>8} {full:>20} {sum(attached) // len(attached):>14} {build:>17.1f} {search:>12.3f} {stored:>11.3f}")
+
+if __name__ == "__main__":
+    main()
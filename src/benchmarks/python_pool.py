@@ -0,0 +1,47 @@
+# Compares execute:py latency: a fresh interpreter per block vs the warm worker pool.
+# Run from src/: python -m benchmarks.python_pool [--runs N] [--preload requests,bs4]
+
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+
+from pypool import PythonPool
+
+SNIPPETS = {
+    "print": "print('Hello!')",
+    "json": "import json; print(json.dumps({'a': 1}))",
+    "requests": "import requests; print(requests.__version__)",
+}
+
+def per_call(code):
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, timeout=10)
+    return result.stdout + result.stderr
+
+def measure(run, code, runs):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        run(code)
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times), max(times)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--preload", default="json,requests")
+    args = parser.parse_args()
+
+    pool = PythonPool(size=1, preload=[name for name in args.preload.split(",") if name])
+    pool.run("pass") # wait for the worker to finish starting
+
+    print(f"{'snippet':<10} {'subprocess (ms)':>18} {'pool (ms)':>18}")
+    for name, code in SNIPPETS.items():
+        cold = measure(per_call, code, args.runs)
+        warm = measure(pool.run, code, args.runs)
+        print(f"{name:<10} {cold[0]:>10.1f} (max {cold[1]:>5.0f}) {warm[0]:>10.1f} (max {warm[1]:>5.0f})")
+    pool.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+# Load test for server.py against a stub model backend: N sessions each send
+# M messages (one at a time) and wait for the turn to finish over SSE.
+# Run from src/: python -m benchmarks.server_load [--sessions 50] [--messages 5]
+
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import statistics
+import tempfile
+import time
+
+import actions
+from fake_genai import FakeClient, FakeModels
+from memory import MemoryStore
+from retrieval import MemoryRetriever
+from server import JasperServer
+
+REPLIES = [
+    "Let me check.\n```execute:sh\necho hello\n```",
+    "All done, the command printed hello.",
+]
+
+async def request(port, token, method, path, body=None):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    payload = b"" if body is None else json.dumps(body).encode()
+    writer.write(f"{method} {path} HTTP/1.1\r\nHost: localhost:{port}\r\nAuthorization: Bearer {token}\r\nContent-Type: application/json\r\nContent-Length: {len(payload)}\r\n\r\n".encode() + payload)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    data = await reader.read()
+    writer.close()
+    body = data.split(b"\r\n\r\n", 1)[1] if b"\r\n\r\n" in data else b""
+    return status, json.loads(body) if body else None
+
+async def run_session(port, token, messages, latencies):
+    _, created = await request(port, token, "POST", "/sessions")
+    session_id = created["id"]
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(f"GET /sessions/{session_id}/events HTTP/1.1\r\nHost: localhost:{port}\r\nAuthorization: Bearer {token}\r\n\r\n".encode())
+    await writer.drain()
+    while (await reader.readline()).strip():
+        pass
+
+    for i in range(messages):
+        start = time.perf_counter()
+        await request(port, token, "POST", f"/sessions/{session_id}/messages", {"message": f"message {i}"})
+        while True:
+            line = await reader.readline()
+            if line.startswith(b"data: ") and json.loads(line[6:]).get("done"):
+                break
+        latencies.append(time.perf_counter() - start)
+    await request(port, token, "DELETE", f"/sessions/{session_id}")
+    await reader.read()
+    writer.close()
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=50)
+    parser.add_argument("--messages", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.05, help="Stub model latency in seconds.")
+    parser.add_argument("--max-model-calls", type=int, default=8)
+    parser.add_argument("--failure-rate", type=float, default=0, help="Fraction of model calls that fail with a 503 and are retried.")
+    args = parser.parse_args()
+
+    # Keep the sessions out of sessions/ and the user's memory.
+    workdir = tempfile.mkdtemp(prefix="jasper-bench-")
+    os.environ["JASPER_JOURNAL"] = "0"
+    actions.memory = MemoryStore(os.path.join(workdir, "memory.db"), legacy=os.path.join(workdir, "memory.json"))
+    actions.memory_index = MemoryRetriever(actions.memory)
+
+    model_client = FakeClient(FakeModels(REPLIES, latency=args.latency, failure_rate=args.failure_rate, seed=0))
+    server = JasperServer(model_client, max_sessions=args.sessions, max_model_calls=args.max_model_calls)
+    server.transport.base_delay = 0.05
+    listener = await server.start("127.0.0.1", 0)
+    port = listener.sockets[0].getsockname()[1]
+
+    latencies = []
+    start = time.perf_counter()
+    try:
+        await asyncio.gather(*(run_session(port, server.token, args.messages, latencies) for _ in range(args.sessions)))
+        elapsed = time.perf_counter() - start
+    finally:
+        listener.close()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    latencies.sort()
+    turns = len(latencies)
+    print(f"sessions: {args.sessions}  turns: {turns}  model calls: {model_client.models.calls}  failed calls retried: {model_client.models.failed}  wall: {elapsed:.2f}s")
+    print(f"throughput: {turns / elapsed:.1f} turns/s")
+    print(f"turn latency: median {statistics.median(latencies) * 1000:.0f} ms, p95 {latencies[int(turns * 0.95) - 1] * 1000:.0f} ms, max {latencies[-1] * 1000:.0f} ms")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,116 @@
+# Benchmarks the session journal: the cost of journaling each message under
+# each fsync policy, and the time to resume sessions of growing length, with
+# snapshots, without them (scanning every record header), and by replaying
+# the whole log (parsing every message), which is what resuming would cost
+# without the lazy load.
+#
+# Run from src/:
+#   python -m benchmarks.session_resume [--sizes 100,1000,10000] [--output report.json]
+
+import argparse
+import json
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import time
+
+from journal import Journal
+from lazy import LazyModule
+
+types = LazyModule("google.genai.types")
+
+WORDS = "the disk file memory search result output python shell error line value user model".split()
+
+
+def make_contents(count, seed=0):
+    # A mix like a real session: short user messages, longer replies and
+    # command output.
+    rng = random.Random(seed)
+    contents = []
+    for index in range(count):
+        kind = index % 3
+        words = rng.randint(5, 30) if kind == 0 else rng.randint(50, 400) if kind == 1 else rng.randint(100, 1500)
+        text = " ".join(rng.choice(WORDS) for _ in range(words))
+        if kind == 2:
+            text = "SYSTEM: Command Output:\n\n" + text
+        contents.append(types.Content(role = "model" if kind == 1 else "user", parts = [types.Part(text = text)]))
+    return contents
+
+def bench_appends(contents, workdir):
+    results = {}
+    for policy in ("never", "turn", "always"):
+        path = os.path.join(workdir, f"append-{policy}.log")
+        journal = Journal(path, fsync = policy)
+        start = time.perf_counter()
+        for index, content in enumerate(contents):
+            journal.append(content)
+            if index % 3 == 2:
+                journal.commit()
+        elapsed = time.perf_counter() - start
+        journal.close()
+        results[policy] = {"us_per_message": elapsed / len(contents) * 1e6, "bytes": os.path.getsize(path)}
+    return results
+
+def _resume(path, read_all):
+    start = time.perf_counter()
+    journal = Journal(path)
+    # Resuming reads the end of the session, e.g. to answer interrupted calls.
+    journal[-1]
+    if read_all:
+        for index in range(len(journal)):
+            journal[index]
+    elapsed = time.perf_counter() - start
+    journal.close()
+    return elapsed
+
+def bench_resume(contents, workdir, repeat):
+    path = os.path.join(workdir, f"resume-{len(contents)}.log")
+    journal = Journal(path, fsync = "never")
+    for content in contents:
+        journal.append(content)
+    journal.close()
+    snapshot = journal.snapshot_path
+    results = {}
+    for name, keep_snapshot, read_all in (("snapshot", True, False), ("scan", False, False), ("replay", False, True)):
+        if not keep_snapshot and os.path.exists(snapshot):
+            os.remove(snapshot)
+        results[name] = statistics.median(_resume(path, read_all) for _ in range(repeat)) * 1000
+    return results
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default = "100,1000,10000", help = "Comma separated session lengths in messages.")
+    parser.add_argument("--appends", type = int, default = 600, help = "Messages journaled per fsync policy.")
+    parser.add_argument("--repeat", type = int, default = 5)
+    parser.add_argument("--output", help = "Write the results as JSON here.")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix = "jasper-bench-")
+    report = {}
+    try:
+        appends = bench_appends(make_contents(args.appends), workdir)
+        report["append"] = appends
+        print(f"{'fsync':<8} {'us/message':>10}")
+        for policy, result in appends.items():
+            print(f"{policy:<8} {result['us_per_message']:>10.1f}")
+
+        print(f"\n{'messages':>8} {'log MB':>7} {'snapshot ms':>11} {'scan ms':>8} {'replay ms':>9}")
+        report["resume"] = {}
+        for size in (int(size) for size in args.sizes.split(",")):
+            contents = make_contents(size)
+            result = bench_resume(contents, workdir, args.repeat)
+            result["log_bytes"] = os.path.getsize(os.path.join(workdir, f"resume-{size}.log"))
+            report["resume"][size] = result
+            print(f"{size:>8} {result['log_bytes'] / 2**20:>7.1f} {result['snapshot']:>11.2f} {result['scan']:>8.2f} {result['replay']:>9.1f}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors = True)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent = 2)
+            f.write("\n")
+
+if __name__ == "__main__":
+    main()
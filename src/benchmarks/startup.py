@@ -0,0 +1,79 @@
+# Time from starting the interpreter to the CLI's first prompt, and the
+# slowest imports on the way there, using python -X importtime.
+# Run from src/: python -m benchmarks.startup [--runs 5] [--eager]
+#
+# --eager also creates the model client and renders the system prompt before
+# the prompt is shown, which is what startup used to do.
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# What cli.py does before showing the first prompt.
+STARTUP = """
+import time
+from prompt_toolkit import PromptSession
+from actions import Jasper, client
+jasper = Jasper(client)
+warming = jasper.warm()
+if EAGER:
+    warming.join()
+print("PROMPT", time.perf_counter(), flush=True)
+warming.join()
+print("READY", time.perf_counter(), flush=True)
+"""
+
+def parse_importtime(stderr):
+    # Cumulative microseconds of each top-level import.
+    imports = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if cumulative.strip().isdigit() and not name.startswith("  "):
+            imports[name.strip()] = int(cumulative)
+    return imports
+
+def run_once(eager):
+    env = {**os.environ, "GEMINI_API_KEY": os.getenv("GEMINI_API_KEY") or "benchmark"}
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-X", "importtime", "-c", f"EAGER = {eager}\n" + STARTUP],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, env=env,
+    )
+    prompt = ready = None
+    for line in process.stdout:
+        if line.startswith("PROMPT"):
+            prompt = time.perf_counter() - start
+        elif line.startswith("READY"):
+            ready = time.perf_counter() - start
+    stderr = process.stderr.read()
+    process.wait()
+    if prompt is None:
+        raise RuntimeError(stderr[-2000:])
+    return prompt, ready, parse_importtime(stderr)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--eager", action="store_true", help="Initialise everything before the prompt, like older versions.")
+    args = parser.parse_args()
+
+    results = [run_once(args.eager) for _ in range(args.runs)]
+    prompts = [prompt for prompt, _, _ in results]
+    readies = [ready for _, ready, _ in results]
+    print(f"mode: {'eager' if args.eager else 'lazy'}  runs: {args.runs}")
+    print(f"time to prompt: median {statistics.median(prompts) * 1000:.0f} ms, min {min(prompts) * 1000:.0f} ms")
+    print(f"time until ready for the first message: median {statistics.median(readies) * 1000:.0f} ms")
+
+    imports = results[-1][2]
+    print("slowest top-level imports (last run):")
+    for name, micros in sorted(imports.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"  {micros / 1000:8.1f} ms  {name}")
+
+if __name__ == "__main__":
+    main()
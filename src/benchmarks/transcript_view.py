@@ -0,0 +1,166 @@
+# Frame rate of the GUI's output pane over a long session. Appends Jasper
+# events (messages, state changes) in bursts while a 60 fps timer stands in
+# for the 3D view's render loop, which shares the Qt event loop with the pane,
+# then scrolls through the whole transcript repainting it. --legacy uses a
+# QTextEdit with one append per event, like the GUI used to.
+#
+# Run from src/ (needs PyQt5; uses the offscreen platform unless
+# QT_QPA_PLATFORM is set):
+#   python -m benchmarks.transcript_view [--messages 10000] [--legacy]
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PyQt5.QtCore import QTimer
+from PyQt5.QtWidgets import QApplication, QTextEdit
+
+from transcript import FRAME_MS, FrameBatcher, TranscriptView
+
+STATUS = {
+    "thinking": "Thinking...",
+    "executing": "Executing code...",
+}
+
+
+def make_message(rng):
+    # Markdown of the kind Jasper writes: prose, lists and code, now and then very long.
+    parts = []
+    for _ in range(rng.choice([1, 1, 2, 3, 8])):
+        kind = rng.random()
+        if kind < 0.5:
+            parts.append(" ".join(rng.choice(["the", "file", "**output**", "`value`", "shows", "that", "a", "command", "ran"]) for _ in range(rng.randint(10, 80))))
+        elif kind < 0.8:
+            parts.append("\n".join(f"- item {i} with *some* detail" for i in range(rng.randint(2, 8))))
+        else:
+            parts.append("```\n" + "\n".join(f"line {i}: " + "x" * rng.randint(10, 100) for i in range(rng.randint(3, 40))) + "\n```")
+    return "\n\n".join(parts)
+
+def make_events(messages, seed):
+    rng = random.Random(seed)
+    events = []
+    for _ in range(messages):
+        events.append({"state": "thinking"})
+        if rng.random() < 0.3:
+            events.append({"state": "executing"})
+            events.append({"progress": {"lang": "sh", "bytes": 100, "lines": 2}})
+            events.append({"state": "idle"})
+        events.append({"message": make_message(rng)})
+        events.append({"state": "idle"})
+    return events
+
+
+class Pane:
+    # What MainWindow does with events, without the 3D view.
+
+    def __init__(self, legacy):
+        self.legacy = legacy
+        if legacy:
+            self.widget = QTextEdit()
+            self.widget.setReadOnly(True)
+        else:
+            self.widget = TranscriptView()
+            self.batcher = FrameBatcher(self.apply)
+        self.widget.resize(500, 700)
+        self.widget.show()
+
+    def add(self, info):
+        if not self.legacy:
+            self.batcher.add(info)
+        elif info.get("message"):
+            self.widget.append(info["message"])
+        elif "state" in info:
+            self.widget.append(STATUS.get(info["state"]))
+
+    def apply(self, events):
+        rows = []
+        for info in events:
+            if info.get("message"):
+                rows.append(("message", info["message"]))
+            elif info.get("state") in STATUS:
+                rows.append(("status", STATUS[info["state"]]))
+        self.widget.extend(rows)
+
+    def scroll(self, steps):
+        # Repaint time at `steps` positions from top to bottom.
+        scrollbar = self.widget.verticalScrollBar()
+        times = []
+        for step in range(steps):
+            scrollbar.setValue(int(scrollbar.maximum() * step / max(steps - 1, 1)))
+            start = time.perf_counter()
+            self.widget.viewport().repaint()
+            times.append(time.perf_counter() - start)
+        return times
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else 0.0
+
+def settle(app, widget):
+    # Lets a batched layout finish: waits until the scroll range stops changing.
+    last, stable = None, 0
+    while stable < 20:
+        app.processEvents()
+        maximum = widget.verticalScrollBar().maximum()
+        stable = stable + 1 if maximum == last else 0
+        last = maximum
+
+def run(args):
+    app = QApplication.instance() or QApplication(sys.argv)
+    pane = Pane(args.legacy)
+    events = make_events(args.messages, args.seed)
+
+    # Stand-in for the 3D view: records the time between its ticks.
+    frames = []
+    last = [time.perf_counter()]
+    def frame():
+        now = time.perf_counter()
+        frames.append(now - last[0])
+        last[0] = now
+    render = QTimer()
+    render.timeout.connect(frame)
+    render.start(FRAME_MS)
+
+    position = [0]
+    def produce():
+        for info in events[position[0]:position[0] + args.burst]:
+            pane.add(info)
+        position[0] += args.burst
+        if position[0] >= len(events):
+            producer.stop()
+            QTimer.singleShot(200, app.quit)
+    producer = QTimer()
+    producer.timeout.connect(produce)
+    producer.start(args.interval)
+
+    start = time.perf_counter()
+    app.exec_()
+    elapsed = time.perf_counter() - start
+    render.stop()
+    settle(app, pane.widget)
+
+    scrolls = pane.scroll(args.scroll_steps)
+    rows = pane.widget.document().blockCount() if args.legacy else pane.widget.transcript.rowCount()
+    print(f"mode: {'legacy QTextEdit' if args.legacy else 'TranscriptView'}  messages: {args.messages}  events: {len(events)}  rows kept: {rows}")
+    print(f"append: {elapsed:.1f} s, {len(frames) / elapsed:.1f} fps of {1000 / FRAME_MS:.0f}")
+    print(f"frame gap: median {statistics.median(frames) * 1000:.1f} ms, p95 {percentile(frames, 0.95) * 1000:.1f} ms, max {max(frames) * 1000:.1f} ms")
+    print(f"scroll repaint: median {statistics.median(scrolls) * 1000:.2f} ms, p95 {percentile(scrolls, 0.95) * 1000:.2f} ms, max {max(scrolls) * 1000:.2f} ms")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=10_000)
+    parser.add_argument("--burst", type=int, default=20, help="Events sent together, as during a busy turn.")
+    parser.add_argument("--interval", type=int, default=5, help="Milliseconds between bursts.")
+    parser.add_argument("--scroll-steps", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--legacy", action="store_true", help="One QTextEdit.append per event, like older versions.")
+    run(parser.parse_args())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+# Compares the two ways Jasper gives the model its commands: execute codeblocks
+# parsed out of the reply, and function calling (JASPER_FUNCTION_CALLING=1).
+# Each task is scripted for both, with a fake model whose prompt token counts
+# include the system instruction and tool declarations like the API's do, and
+# the commands are run for real. Reports round trips and prompt tokens per task.
+#
+# Run from src/:
+#   python -m benchmarks.transports [--stream] [--output report.json]
+#
+# The "mistyped" task is the model writing a malformed fence, which costs the
+# codeblock transport a round trip; function names are checked by the API.
+
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+
+import actions
+from actions import Jasper
+from fake_genai import FakeClient, FakeModels, call
+from memory import MemoryStore
+from retrieval import MemoryRetriever
+from search import SearchCache, SearchEngine, StubBackend
+from lazy import LazyModule
+
+types = LazyModule("google.genai.types")
+
+LOG = os.path.join(tempfile.gettempdir(), "jasper-bench.log")
+
+def text(value):
+    return types.Part(text = value)
+
+TASKS = [
+    {
+        "name": "one_command",
+        "message": "How much disk space is free?",
+        "codeblocks": [
+            "Let me check.\n```execute:sh\ndf -h / | tail -1\n```",
+            "You have plenty of free space on /.",
+        ],
+        "functions": [
+            [text("Let me check."), call("sh", command = "df -h / | tail -1")],
+            "You have plenty of free space on /.",
+        ],
+    },
+    {
+        "name": "parallel",
+        "message": "What's the weather in Paris, and what do you remember about me?",
+        "codeblocks": [
+            "```execute:search\nweather in Paris\n```\n```execute:memory:fetch\n\n```",
+            "It is sunny in Paris. I don't have anything stored about you yet.",
+        ],
+        "functions": [
+            [call("search", query = "weather in Paris"), call("memory", action = "fetch")],
+            "It is sunny in Paris. I don't have anything stored about you yet.",
+        ],
+    },
+    {
+        "name": "file",
+        "message": f"Are there errors in {LOG}?",
+        "codeblocks": [
+            f"```execute:analyse:text/plain:grep\n{LOG}\nERROR\n```",
+            "There are two errors, both about the disk being full.",
+        ],
+        "functions": [
+            [call("analyse", path = LOG, mimetype = "text/plain", grep = "ERROR")],
+            "There are two errors, both about the disk being full.",
+        ],
+    },
+    {
+        "name": "multi_step",
+        "message": "Remember my name is Ann, then count the files in /tmp with Python.",
+        "codeblocks": [
+            "```execute:memory:store:user.name\nAnn\n```",
+            "```execute:py\nimport os\nprint(len(os.listdir('/tmp')))\n```",
+            "Done: I'll remember your name, and /tmp has a handful of files.",
+        ],
+        "functions": [
+            [call("memory", action = "store", path = "user.name", value = "Ann")],
+            [call("py", code = "import os\nprint(len(os.listdir('/tmp')))")],
+            "Done: I'll remember your name, and /tmp has a handful of files.",
+        ],
+    },
+    {
+        "name": "mistyped",
+        "message": "What's in /tmp?",
+        "codeblocks": [
+            "```execute:shell\nls /tmp | head -5\n```",
+            "```execute:sh\nls /tmp | head -5\n```",
+            "A few temporary files.",
+        ],
+        "functions": [
+            [call("sh", command = "ls /tmp | head -5")],
+            "A few temporary files.",
+        ],
+    },
+]
+
+
+def run_task(task, function_calling, stream):
+    replies = list(task["functions" if function_calling else "codeblocks"])
+    calls = []
+
+    def reply(contents):
+        if not replies:
+            raise RuntimeError(f"{task['name']}: the script ran out of replies.")
+        return replies.pop(0)
+
+    def callback(info):
+        if "model_call" in info:
+            calls.append(info["model_call"])
+
+    jasper = Jasper(FakeClient(FakeModels(reply)), stream = stream, function_calling = function_calling, callback = callback)
+    jasper.search = SearchEngine(backend = StubBackend(), cache = SearchCache(path = None))
+    config = jasper._config()
+    fixed = (len(config.system_instruction) + sum(len(tool.model_dump_json(exclude_none = True)) for tool in config.tools or [])) // 4
+
+    start = time.perf_counter()
+    try:
+        jasper.send_message(task["message"])
+    finally:
+        if jasper.python_pool:
+            jasper.python_pool.close()
+        jasper.close()
+    if replies:
+        raise RuntimeError(f"{task['name']}: {len(replies)} scripted replies were not used.")
+    return {
+        "round_trips": len(calls),
+        "prompt_tokens": sum(call.get("prompt_tokens") or 0 for call in calls),
+        "instruction_tokens": fixed,
+        "seconds": time.perf_counter() - start,
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--stream", action = "store_true", help = "Use the streaming code path.")
+    parser.add_argument("--output", help = "Write the results as JSON here.")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix = "jasper-bench-")
+    actions.memory = MemoryStore(os.path.join(workdir, "memory.db"), legacy = os.path.join(workdir, "memory.json"))
+    os.environ["JASPER_SESSIONS_DIR"] = os.path.join(workdir, "sessions")
+    actions.memory_index = MemoryRetriever(actions.memory)
+    with open(LOG, "w") as f:
+        f.write("INFO started\nERROR disk full\nINFO retry\nERROR disk full\n")
+
+    results = {}
+    print(f"{'task':<12} {'transport':<11} {'round trips':>11} {'prompt tokens':>13} {'instructions':>12} {'ms':>8}")
+    for task in TASKS:
+        for name, function_calling in (("codeblocks", False), ("functions", True)):
+            result = run_task(task, function_calling, args.stream)
+            results.setdefault(task["name"], {})[name] = result
+            print(f"{task['name']:<12} {name:<11} {result['round_trips']:>11} {result['prompt_tokens']:>13,} {result['instruction_tokens']:>12,} {result['seconds'] * 1000:>8.1f}")
+
+    for name in ("codeblocks", "functions"):
+        runs = [task[name] for task in results.values()]
+        print(
+            f"{name}: {sum(r['round_trips'] for r in runs)} round trips, "
+            f"{sum(r['prompt_tokens'] for r in runs):,} prompt tokens, "
+            f"{statistics.mean(r['prompt_tokens'] / r['round_trips'] for r in runs):,.0f} per call"
+        )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent = 2)
+            f.write("\n")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+import os
+import signal
+import time
+from typing import Callable
+from lazy import LazyModule
+
+# Python workers import this module for the output limits; they don't need
+# asyncio, so it isn't imported at their startup.
+asyncio = LazyModule("asyncio")
+
+DEFAULT_HEAD = 16 * 1024
+DEFAULT_TAIL = 16 * 1024
+# How long output is still read after the process has exited.
+DRAIN_SECONDS = 0.5
+
+def omitted_marker(omitted):
+    return f"\n[... {omitted} bytes omitted ...]\n"
+
+
+class OutputWindow:
+    # Keeps the first `head` and last `tail` bytes written to it. Everything in
+    # between is only counted, so memory stays bounded however much a
+    # command prints.
+
+    def __init__(self, head: int = DEFAULT_HEAD, tail: int = DEFAULT_TAIL):
+        self.head_limit = head
+        self.tail_limit = tail
+        self.head = bytearray()
+        self.tail = bytearray()
+        self.omitted = 0
+        self.bytes = 0
+        self.lines = 0
+
+    def write(self, data):
+        self.bytes += len(data)
+        self.lines += data.count(b"\n")
+        room = self.head_limit - len(self.head)
+        if room > 0:
+            self.head += data[:room]
+            data = data[room:]
+        if not data:
+            return
+        self.tail += data
+        excess = len(self.tail) - self.tail_limit
+        if excess > 0:
+            # bytearray deletes from the front without copying the rest.
+            del self.tail[:excess]
+            self.omitted += excess
+
+    def getvalue(self):
+        text = self.head.decode(errors="replace")
+        if self.omitted:
+            text += omitted_marker(self.omitted)
+        return text + self.tail.decode(errors="replace")
+
+
+def kill_process_group(process):
+    try:
+        if os.name != "nt":
+            os.killpg(process.pid, signal.SIGKILL)
+        else:
+            process.kill()
+    except (ProcessLookupError, PermissionError, OSError):
+        pass
+
+async def run_streaming(args, shell: bool = False, timeout: float = 10, progress: Callable = None,
+                        head: int = DEFAULT_HEAD, tail: int = DEFAULT_TAIL, interval: float = 0.5):
+    # Like subprocess.run(..., capture_output=True, timeout=timeout) but reads
+    # stdout/stderr as they are produced, reports progress every `interval`
+    # seconds and returns partial output instead of raising on timeout.
+    # On timeout only the process itself is killed, like subprocess.run does,
+    # so programs it started in the background (`xdg-open file &`) keep
+    # running. Cancelling it (the user stopping the turn) kills the process
+    # and everything it started.
+    progress = progress or (lambda *a, **k: None)
+    window = OutputWindow(head, tail)
+    options = dict(
+        stdout = asyncio.subprocess.PIPE,
+        stderr = asyncio.subprocess.STDOUT,
+        start_new_session = os.name != "nt",
+    )
+    if shell:
+        process = await asyncio.create_subprocess_shell(args, **options)
+    else:
+        process = await asyncio.create_subprocess_exec(*args, **options)
+
+    async def read():
+        last = time.monotonic()
+        while chunk := await process.stdout.read(64 * 1024):
+            window.write(chunk)
+            if time.monotonic() - last >= interval:
+                last = time.monotonic()
+                progress({"bytes": window.bytes, "lines": window.lines})
+
+    async def finish():
+        # process.wait() also waits for the output pipe to close, which
+        # programs left running in the background keep open, so the exit
+        # itself is polled for.
+        while not reader.done() and process.returncode is None:
+            await asyncio.wait({reader}, timeout = 0.05)
+        if reader.done():
+            await process.wait()
+        else:
+            await drain()
+
+    async def drain():
+        # What is still in the pipe is read for a moment, not until every
+        # process holding it has exited.
+        await asyncio.wait({reader}, timeout = DRAIN_SECONDS)
+
+    reader = asyncio.ensure_future(read())
+    timed_out = False
+    try:
+        try:
+            await asyncio.wait_for(finish(), timeout)
+        except asyncio.TimeoutError:
+            timed_out = True
+            try:
+                process.kill()
+            except ProcessLookupError:
+                pass
+            await drain()
+    except asyncio.CancelledError:
+        kill_process_group(process)
+        raise
+    finally:
+        reader.cancel()
+        # Closes the pipe if a background process still holds it.
+        process._transport.close()
+    progress({"bytes": window.bytes, "lines": window.lines})
+
+    output = window.getvalue()
+    if timed_out:
+        output += f"\n[Timed out after {timeout:g} seconds]"
+    return output
@@ -1,5 +1,7 @@
+import os
 import sys
 import time
+import asyncio
 import threading
 from prompt_toolkit import PromptSession
 from prompt_toolkit.formatted_text import HTML
@@ -58,38 +60,151 @@ def callback(info: dict):
                 current_spinner[0]()
             current_spinner[0] = spinner(text)
 
-jasper = Jasper(client, callback=callback)
+    if info.get("cancelled"):
+        with patch_stdout():
+            print_formatted_text(HTML('<ansiyellow>Cancelled.</ansiyellow>'))
+
+# Set JASPER_ASYNC=1 to keep the prompt usable while Jasper is working.
+# Messages sent meanwhile are queued, and Ctrl+C or /cancel stops the current turn.
+if os.getenv("JASPER_ASYNC"):
+    from async_jasper import AsyncJasper
+    jasper = AsyncJasper(client, callback=callback)
+else:
+    jasper = Jasper(client, callback=callback)
+# Loads the model client and renders the system prompt while the user types.
+jasper.warm()
 
 # Initialize PromptSession outside the loop
 session = PromptSession()
+placeholder = HTML('<ansigray>Type a message or \'/help\' for options.</ansigray>')
+
+def handle_command(inp):
+    command = inp[1:].strip() # Get command without the leading slash
+    if command == "help":
+        with patch_stdout():
+            print("Available commands:")
+            print("  /help   - Display this help message.")
+            print("  /clear  - Start a new conversation. The current one can be resumed later.")
+            print("  /sessions     - List saved conversations.")
+            print("  /resume <id>  - Continue a saved conversation (the latest if no id is given).")
+            print("  /cache  - Show response cache hits, misses and size.")
+            print("  /cache on|off  - Use or bypass the response cache.")
+            print("  /cache refresh - Answer the next message without the cache, and cache the new results.")
+            print("  /cache clear   - Empty the response cache.")
+            if os.getenv("JASPER_ASYNC"):
+                print("  /cancel - Stop what Jasper is currently doing.")
+            print("  /exit   - Exit the application.")
+    elif command == "clear":
+        with patch_stdout():
+            if getattr(jasper, "busy", False):
+                print_formatted_text(HTML('<ansired>Jasper is busy. Wait for it to finish or /cancel first.</ansired>'))
+                return
+            jasper.new_session()
+            print("Conversation history cleared.")
+    elif command == "sessions":
+        handle_sessions()
+    elif command == "resume" or command.startswith("resume "):
+        handle_resume(command[len("resume"):].strip())
+    elif command == "cache" or command.startswith("cache "):
+        handle_cache(command[len("cache"):].strip())
+    elif command == "cancel" and os.getenv("JASPER_ASYNC"):
+        jasper.cancel()
+    elif command == "exit":
+        with patch_stdout():
+            print("Exiting application. Goodbye!")
+        sys.exit(0) # Exit the script
+    else:
+        with patch_stdout():
+            print_formatted_text(HTML(f'<ansired>Command not found: \'{inp}\'. Type \'/help\' for a list of commands.</ansired>'))
 
-while True:
-    # Use prompt_toolkit for input with placeholder text and patch stdout
+def handle_sessions():
+    sessions = jasper.sessions()
     with patch_stdout():
-        inp = session.prompt(">> ", placeholder=HTML('<ansigray>Type a message or \'/help\' for options.</ansigray>'))
-    
-    # Only send message if input is not empty after stripping whitespace
-    if inp.strip() == "":
-        continue # Skip empty input
-
-    if inp.startswith('/'):
-        command = inp[1:].strip() # Get command without the leading slash
-        if command == "help":
-            with patch_stdout():
-                print("Available commands:")
-                print("  /help   - Display this help message.")
-                print("  /clear  - Clear the conversation history.")
-                print("  /exit   - Exit the application.")
-        elif command == "clear":
-            jasper.messages = [] # Clear the message history
-            with patch_stdout():
-                print("Conversation history cleared.")
-        elif command == "exit":
-            with patch_stdout():
-                print("Exiting application. Goodbye!")
-            sys.exit(0) # Exit the script
+        if not sessions:
+            print("No saved conversations.")
+        for session in sessions[:20]:
+            current = " (current)" if session["id"] == jasper.session_id else ""
+            title = session["title"][:60] + ("..." if len(session["title"]) > 60 else "")
+            modified = time.strftime("%Y-%m-%d %H:%M", time.localtime(session["modified"]))
+            print(f"  {session['id']}  {modified}  {session['messages']:>4} messages  {title}{current}")
+        if len(sessions) > 20:
+            print(f"  ... and {len(sessions) - 20} older.")
+
+def handle_resume(session_id):
+    with patch_stdout():
+        if getattr(jasper, "busy", False):
+            print_formatted_text(HTML('<ansired>Jasper is busy. Wait for it to finish or /cancel first.</ansired>'))
+            return
+        if not session_id:
+            others = [session for session in jasper.sessions() if session["id"] != jasper.session_id]
+            if not others:
+                print("No saved conversations.")
+                return
+            session_id = others[0]["id"]
+        try:
+            session_id = jasper.resume(session_id)
+        except KeyError as e:
+            print_formatted_text(HTML(f'<ansired>{e.args[0]}</ansired>'))
+            return
+        print(f"Resumed {session_id} ({len(jasper.messages)} messages).")
+
+def handle_cache(action):
+    cache = jasper.response_cache
+    with patch_stdout():
+        if action == "":
+            print(f"Response cache is {'on' if cache.enabled else 'off'}.")
+            for level, stats in cache.stats().items():
+                total = stats["hits"] + stats["misses"]
+                rate = f" ({stats['hits'] / total:.0%})" if total else ""
+                print(f"  {level + 's:':<10} {stats['hits']} hits, {stats['misses']} misses{rate}; {stats['entries']} entries, {stats['bytes'] / 1024:.0f} KB")
+        elif action in ("on", "off"):
+            cache.enabled = action == "on"
+            print(f"Response cache {'enabled' if cache.enabled else 'bypassed'}.")
+        elif action == "refresh":
+            cache.refreshing = True
+            print("The next message will not use cached results.")
+        elif action == "clear":
+            cache.clear()
+            print("Response cache cleared.")
         else:
-            with patch_stdout():
-                print_formatted_text(HTML(f'<ansired>Command not found: \'{inp}\'. Type \'/help\' for a list of commands.</ansired>'))
-    else:
-        jasper.send_message(inp)
+            print_formatted_text(HTML(f'<ansired>Unknown cache command: \'{action}\'. Use on, off, refresh or clear.</ansired>'))
+
+def run():
+    while True:
+        # Use prompt_toolkit for input with placeholder text and patch stdout
+        with patch_stdout():
+            inp = session.prompt(">> ", placeholder=placeholder)
+        
+        # Only send message if input is not empty after stripping whitespace
+        if inp.strip() == "":
+            continue # Skip empty input
+
+        if inp.startswith('/'):
+            handle_command(inp)
+        else:
+            jasper.send_message(inp)
+
+async def run_async():
+    asyncio.create_task(jasper.serve())
+    while True:
+        with patch_stdout():
+            try:
+                inp = await session.prompt_async(">> ", placeholder=placeholder)
+            except KeyboardInterrupt:
+                if not jasper.busy:
+                    raise
+                jasper.cancel()
+                continue
+
+        if inp.strip() == "":
+            continue
+
+        if inp.startswith('/'):
+            handle_command(inp)
+        else:
+            jasper.submit(inp)
+
+if os.getenv("JASPER_ASYNC"):
+    asyncio.run(run_async())
+else:
+    run()
@@ -0,0 +1,124 @@
+import hashlib
+import time
+from lazy import LazyModule
+from history import estimate_tokens, CHARS_PER_TOKEN
+
+types = LazyModule("google.genai.types")
+
+# The API rejects caches smaller than this (the limit is higher for pro models).
+MIN_TOKENS = 1024
+# Inline attachments at least this large are moved into the cache.
+ATTACHMENT_BYTES = 256 * 1024
+
+def _attachments(content):
+    return [part for part in content.parts or [] if part.inline_data and len(part.inline_data.data or b"") >= ATTACHMENT_BYTES]
+
+
+class ContextCache:
+    # Keeps the system instruction (and large attachments from execute:analyse)
+    # in a Gemini cached content, so each request only sends a reference to it.
+    # The cache is keyed by a hash of everything in it: when memory changes the
+    # rendered prompt, or a new attachment arrives, a new cache is created and
+    # the old one deleted. The TTL is extended when the cache is about to expire.
+
+    def __init__(self, client, model: str, ttl: int = 3600, refresh: int = 300, min_tokens: int = MIN_TOKENS):
+        self.client = client
+        self.model = model
+        self.ttl = ttl
+        self.refresh = refresh
+        self.min_tokens = min_tokens
+        self.key = None
+        self.name = None
+        self.expires = 0
+        self.failed = set()
+        # id(part) -> (part, digest). The part is kept so its id can't be
+        # reused by another attachment while the digest is cached.
+        self.digests = {}
+
+    def _digest(self, part):
+        # Attachments never change once added, so hash each one only once.
+        known = self.digests.get(id(part))
+        if known is not None and known[0] is part:
+            return known[1]
+        digest = hashlib.sha256(part.inline_data.data).hexdigest()
+        self.digests[id(part)] = (part, digest)
+        return digest
+
+    def _cache_key(self, config, attachments):
+        key = hashlib.sha256(self.model.encode())
+        key.update(config.model_dump_json(exclude_none=True).encode())
+        for content in attachments:
+            for part in _attachments(content):
+                key.update(self._digest(part).encode())
+        return key.hexdigest()
+
+    def _ensure(self, key, config, attachments):
+        now = time.time()
+        if key == self.key:
+            if self.expires - now < self.refresh:
+                self.client.caches.update(
+                    name = self.name,
+                    config = types.UpdateCachedContentConfig(ttl = f"{self.ttl}s"),
+                )
+                self.expires = now + self.ttl
+            return
+        self.invalidate()
+        cache = self.client.caches.create(
+            model = self.model,
+            config = types.CreateCachedContentConfig(
+                display_name = f"jasper-{key[:16]}",
+                system_instruction = config.system_instruction,
+                tools = config.tools,
+                contents = attachments or None,
+                ttl = f"{self.ttl}s",
+            ),
+        )
+        self.key, self.name, self.expires = key, cache.name, now + self.ttl
+
+    def invalidate(self):
+        if self.name:
+            try:
+                self.client.caches.delete(name = self.name)
+            except Exception:
+                pass
+        self.key, self.name, self.expires = None, None, 0
+
+    def prepare(self, config, messages):
+        # Returns the (contents, config) to send. Falls back to sending
+        # everything inline if the context is too small or caching fails.
+        attachments = [content for content in messages if _attachments(content)]
+        current = {id(part) for content in attachments for part in _attachments(content)}
+        self.digests = {k: v for k, v in self.digests.items() if k in current}
+
+        tokens = len(str(config.system_instruction or "")) // CHARS_PER_TOKEN + estimate_tokens(attachments)
+        tokens += sum(len(tool.model_dump_json(exclude_none=True)) for tool in config.tools or []) // CHARS_PER_TOKEN
+        if tokens < self.min_tokens:
+            return messages, config
+        key = self._cache_key(config, attachments)
+        if key in self.failed:
+            return messages, config
+        try:
+            self._ensure(key, config, attachments)
+        except Exception as e:
+            self.failed.add(key)
+            self.invalidate()
+            print(f"[!] Context caching unavailable: {e}")
+            return messages, config
+
+        cached = {id(content) for content in attachments}
+        contents = []
+        for content in messages:
+            if id(content) not in cached:
+                contents.append(content)
+                continue
+            notes = [part.text for part in content.parts if part.text]
+            # Function responses the attachment was sent with stay in place.
+            responses = [part for part in content.parts if part.function_response]
+            contents.append(types.Content(role = content.role, parts = responses + [
+                types.Part(text = "[Attached in the cached context] " + " ".join(notes))
+            ]))
+        return contents, config.model_copy(update = {
+            "system_instruction": None,
+            "tools": None,
+            "cached_content": self.name,
+        })
@@ -0,0 +1,150 @@
+import hashlib
+import json
+import mmap
+import os
+import re
+import threading
+import time
+from lazy import LazyModule
+
+types = LazyModule("google.genai.types")
+
+# Text files up to this size are returned whole.
+TEXT_INLINE_BYTES = 64 * 1024
+# Size of the head/tail windows shown for larger text files, and default page size.
+TEXT_WINDOW_BYTES = 16 * 1024
+GREP_MAX_MATCHES = 200
+# Binary files above this size go through the Files API instead of inline.
+INLINE_BYTES = 8 * 1024 * 1024
+
+UPLOADS_FILE = "uploads.json"
+
+
+def _decode(data):
+    return data.decode("utf-8", errors="replace")
+
+def _mapped(path):
+    f = open(path, "rb")
+    if os.fstat(f.fileno()).st_size == 0:
+        f.close()
+        return None, None
+    return f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+def _count_newlines(m, start, end, chunk=1024 * 1024):
+    count = 0
+    for position in range(start, end, chunk):
+        count += m[position:min(position + chunk, end)].count(b"\n")
+    return count
+
+def read_text(path):
+    # The whole file if it is small, otherwise its first and last windows.
+    size = os.path.getsize(path)
+    if size <= TEXT_INLINE_BYTES:
+        with open(path, "rb") as f:
+            return _decode(f.read())
+    f, m = _mapped(path)
+    with f, m:
+        return (
+            f"[File is {size} bytes. Showing the first and last {TEXT_WINDOW_BYTES} bytes. "
+            f"Use analyse:text/plain:<offset>:<length> to read any part, or analyse:text/plain:grep to search it.]\n\n"
+            + _decode(m[:TEXT_WINDOW_BYTES])
+            + f"\n\n[... {size - 2 * TEXT_WINDOW_BYTES} bytes omitted ...]\n\n"
+            + _decode(m[size - TEXT_WINDOW_BYTES:])
+        )
+
+def read_range(path, offset, length):
+    size = os.path.getsize(path)
+    f, m = _mapped(path)
+    if m is None:
+        return "[File is empty.]"
+    with f, m:
+        end = min(offset + length, size)
+        return f"[Bytes {offset}-{end} of {size}.]\n\n" + _decode(m[offset:end])
+
+def grep(path, pattern, max_matches: int = GREP_MAX_MATCHES):
+    # Matching lines with their line numbers, scanning the mapped file
+    # without reading it into memory.
+    f, m = _mapped(path)
+    if m is None:
+        return "No matches."
+    regex = re.compile(pattern.encode(), re.MULTILINE)
+    lines = []
+    with f, m:
+        line_number = 1
+        position = 0
+        last_line = -1
+        for match in regex.finditer(m):
+            start = m.rfind(b"\n", 0, match.start()) + 1
+            if start == last_line:
+                continue
+            line_number += _count_newlines(m, position, start)
+            position = start
+            last_line = start
+            end = m.find(b"\n", match.end())
+            lines.append(f"{line_number}: {_decode(m[start:end if end != -1 else len(m)])[:500]}")
+            if len(lines) >= max_matches:
+                lines.append(f"[Stopped after {max_matches} matches.]")
+                break
+    return "\n".join(lines) or "No matches."
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(1024 * 1024):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class FileUploader:
+    # Uploads files through client.files, at most once per content hash.
+    # Uploads expire after 48 hours; the record of them is kept in `path`.
+
+    def __init__(self, client, path: str = UPLOADS_FILE, processing_timeout: float = 300):
+        self.client = client
+        self.path = path
+        self.processing_timeout = processing_timeout
+        self.lock = threading.Lock()
+        self.uploads = {}
+        if path and os.path.exists(path):
+            try:
+                with open(path) as f:
+                    self.uploads = json.load(f)
+            except (ValueError, OSError):
+                pass
+
+    def _save(self):
+        if not self.path:
+            return
+        temp = f"{self.path}.tmp"
+        with open(temp, "w") as f:
+            json.dump(self.uploads, f)
+        os.replace(temp, self.path)
+
+    def expired(self, uri):
+        # Whether `uri` is not a current upload of this uploader.
+        now = time.time()
+        with self.lock:
+            return not any(known["uri"] == uri and known["expires"] > now for known in self.uploads.values())
+
+    def upload(self, filepath, mime_type):
+        # Returns (uri, mime_type) of the uploaded file.
+        digest = file_hash(filepath)
+        with self.lock:
+            known = self.uploads.get(digest)
+            # Leave an hour of margin before the file expires.
+            if known and known["expires"] - time.time() > 3600:
+                return known["uri"], known["mime_type"]
+
+        uploaded = self.client.files.upload(file=filepath, config=types.UploadFileConfig(mime_type=mime_type))
+        deadline = time.monotonic() + self.processing_timeout
+        while uploaded.state and uploaded.state.name == "PROCESSING" and time.monotonic() < deadline:
+            time.sleep(1)
+            uploaded = self.client.files.get(name=uploaded.name)
+        if uploaded.state and uploaded.state.name == "FAILED":
+            raise RuntimeError(f"Processing of {filepath} failed.")
+
+        expires = uploaded.expiration_time.timestamp() if uploaded.expiration_time else time.time() + 47 * 3600
+        with self.lock:
+            self.uploads[digest] = {"name": uploaded.name, "uri": uploaded.uri, "mime_type": uploaded.mime_type or mime_type, "expires": expires}
+            self._save()
+        return uploaded.uri, uploaded.mime_type or mime_type
@@ -0,0 +1,119 @@
+from typing import Callable
+from lazy import LazyModule
+
+types = LazyModule("google.genai.types")
+
+CHARS_PER_TOKEN = 4
+# Gemini bills an image as a flat 258 tokens; other media are estimated by size.
+IMAGE_TOKENS = 258
+BYTES_PER_TOKEN = 32
+
+TOOL_OUTPUT_PREFIX = "SYSTEM: Command Output"
+
+def _function_text(part):
+    # What a function call or response costs, roughly: its arguments or result.
+    if part.function_call:
+        return part.function_call.name + str(part.function_call.args or "")
+    if part.function_response:
+        return part.function_response.name + str(part.function_response.response or "")
+    return None
+
+def estimate_part(part):
+    if part.text:
+        return len(part.text) // CHARS_PER_TOKEN + 1
+    if (text := _function_text(part)) is not None:
+        return len(text) // CHARS_PER_TOKEN + 1
+    if part.inline_data:
+        if (part.inline_data.mime_type or "").startswith("image/"):
+            return IMAGE_TOKENS
+        return len(part.inline_data.data or b"") // BYTES_PER_TOKEN + 1
+    return IMAGE_TOKENS
+
+def estimate_tokens(contents):
+    return sum(estimate_part(part) for content in contents for part in content.parts or [])
+
+def payload_bytes(contents):
+    size = 0
+    for content in contents:
+        for part in content.parts or []:
+            if part.text:
+                size += len(part.text.encode())
+            elif part.inline_data:
+                size += len(part.inline_data.data or b"")
+            elif (text := _function_text(part)) is not None:
+                size += len(text.encode())
+    return size
+
+def is_tool_output(content):
+    return content.role == "user" and bool(content.parts) and (
+        (content.parts[0].text or "").startswith(TOOL_OUTPUT_PREFIX) or bool(content.parts[0].function_response)
+    )
+
+
+class History:
+    # Builds the contents actually sent for a request from Jasper.messages.
+    # The last `keep_recent` messages go out verbatim; older command output is
+    # cut down to its start and end, older inline attachments are replaced by
+    # a short note, and if that is still over `budget` tokens the oldest
+    # messages are left out. Jasper.messages itself is never modified.
+
+    def __init__(self, budget: int = 100_000, keep_recent: int = 8, tool_output_chars: int = 4000, count_tokens: Callable = None):
+        self.budget = budget
+        self.keep_recent = keep_recent
+        self.tool_output_chars = tool_output_chars
+        self.count_tokens = count_tokens
+
+    def _truncate(self, text):
+        if len(text) <= self.tool_output_chars:
+            return text
+        keep = self.tool_output_chars // 2
+        omitted = len(text) - keep * 2
+        return f"{text[:keep]}\n[... {omitted} characters of old command output omitted ...]\n{text[-keep:]}"
+
+    def _shrink(self, content):
+        parts = []
+        changed = False
+        for part in content.parts or []:
+            if part.inline_data:
+                parts.append(types.Part(text = f"[Attachment ({part.inline_data.mime_type}, {len(part.inline_data.data or b'')} bytes) no longer included. Analyse the file again if you need it.]"))
+                changed = True
+            elif part.text and is_tool_output(content) and len(part.text) > self.tool_output_chars:
+                parts.append(types.Part(text = self._truncate(part.text)))
+                changed = True
+            elif part.function_response and len(str((part.function_response.response or {}).get("output", ""))) > self.tool_output_chars:
+                response = part.function_response
+                parts.append(types.Part(function_response = types.FunctionResponse(
+                    id = response.id,
+                    name = response.name,
+                    response = {**response.response, "output": self._truncate(str(response.response["output"]))},
+                )))
+                changed = True
+            else:
+                parts.append(part)
+        return types.Content(role = content.role, parts = parts) if changed else content
+
+    def compact(self, messages):
+        split = max(len(messages) - self.keep_recent, 0)
+        contents = [self._shrink(content) for content in messages[:split]] + list(messages[split:])
+
+        dropped = 0
+        tokens = estimate_tokens(contents)
+        while tokens > self.budget and dropped < split:
+            tokens -= estimate_tokens(contents[:1])
+            contents.pop(0)
+            dropped += 1
+        # The conversation has to start with a user turn, and not with
+        # function responses whose calls were dropped.
+        while dropped < split and contents and (contents[0].role != "user" or contents[0].parts and contents[0].parts[0].function_response):
+            tokens -= estimate_tokens(contents[:1])
+            contents.pop(0)
+            dropped += 1
+
+        if self.count_tokens:
+            tokens = self.count_tokens(contents)
+        return contents, {
+            "messages": len(contents),
+            "dropped": dropped,
+            "tokens": tokens,
+            "bytes": payload_bytes(contents),
+        }
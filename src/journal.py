@@ -0,0 +1,331 @@
+# Session journal. Jasper.messages is a Journal: a list of types.Content that
+# appends every change to sessions/<id>.log as it happens, so a conversation
+# survives a crash or restart and can be resumed with /resume.
+#
+# The log is a sequence of length-prefixed records, each a content as JSON or
+# a truncation (when messages are inserted or removed other than at the end,
+# the changed tail is truncated and written again). Nothing is ever rewritten
+# in place, so a crash can at most leave a partial record at the end, which
+# is dropped on the next open.
+#
+# Resuming does not replay the log. A snapshot, written every `snapshot_every`
+# records, holds the offsets of the live contents; only records after it are
+# scanned, by their headers. The log is memory-mapped and each content is
+# parsed the first time it is read, so resuming takes about as long for a
+# long session as for a short one.
+
+import array
+import mmap
+import os
+import secrets
+import struct
+import threading
+import time
+import zlib
+from collections.abc import MutableSequence
+from typing import Callable
+from lazy import LazyModule
+
+types = LazyModule("google.genai.types")
+
+SESSIONS_DIR = "sessions"
+MAGIC = b"JSJ1"
+SNAPSHOT_MAGIC = b"JSS1"
+# Payload length, CRC-32 of the payload, record kind.
+HEADER = struct.Struct("<IIB")
+CONTENT = 1
+TRUNCATE = 2
+COUNT = struct.Struct("<I")
+# Log size covered and number of contents, followed by their offsets and lengths.
+SNAPSHOT = struct.Struct("<QI")
+# "always" syncs every record to disk, "turn" once at the end of each turn
+# and "never" leaves it to the OS. Records reach the OS as they are written,
+# so only a power loss or OS crash can lose the ones not yet synced.
+FSYNC_POLICIES = ("always", "turn", "never")
+
+
+def new_id():
+    return time.strftime("%Y%m%d-%H%M%S-") + secrets.token_hex(2)
+
+def session_path(directory, session_id):
+    return os.path.join(directory, f"{session_id}.log")
+
+
+class Journal(MutableSequence):
+    # Without a path, a plain in-memory list.
+
+    def __init__(self, path: str = None, fsync: str = "turn", snapshot_every: int = 256, on_load: Callable = None):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"Unknown fsync policy {fsync!r}; use one of {', '.join(FSYNC_POLICIES)}.")
+        self.path = path
+        self.fsync = fsync
+        self.snapshot_every = snapshot_every
+        # Applied to each content read back from the log.
+        self.on_load = on_load
+        self.lock = threading.RLock()
+        # Parsed contents, or None for ones not read from the log yet.
+        self.contents = []
+        # (offset, length) of each content's record payload in the log.
+        self.records = []
+        self.file = None
+        self.map = None
+        self.size = 0
+        self.since_snapshot = 0
+        self.dirty = False
+        if path and os.path.exists(path):
+            self._open()
+
+    @property
+    def snapshot_path(self):
+        return self.path[:-len(".log")] + ".snap" if self.path.endswith(".log") else self.path + ".snap"
+
+    def _open(self):
+        # Opened for reading; _write() reopens it for writing when needed.
+        self.file = open(self.path, "rb")
+        size = os.fstat(self.file.fileno()).st_size
+        if size < len(MAGIC):
+            self.file.close()
+            self.file = None
+            return
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.map[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError(f"{self.path} is not a session journal.")
+        self.size = size
+        # Anything past the last complete record was cut short by a crash,
+        # and is overwritten by the next record.
+        self.size = self._scan(self._load_snapshot())
+        self.contents = [None] * len(self.records)
+
+    def _load_snapshot(self):
+        # Returns the log offset to scan from.
+        try:
+            with open(self.snapshot_path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return len(MAGIC)
+        if data[:len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC or len(data) < len(SNAPSHOT_MAGIC) + SNAPSHOT.size:
+            return len(MAGIC)
+        covered, count = SNAPSHOT.unpack_from(data, len(SNAPSHOT_MAGIC))
+        start = len(SNAPSHOT_MAGIC) + SNAPSHOT.size
+        offsets, lengths = array.array("Q"), array.array("I")
+        if covered > self.size or len(data) != start + count * (offsets.itemsize + lengths.itemsize):
+            # The log lost records the snapshot refers to.
+            return len(MAGIC)
+        offsets.frombytes(data[start:start + count * offsets.itemsize])
+        lengths.frombytes(data[start + count * offsets.itemsize:])
+        self.records = list(zip(offsets, lengths))
+        return covered
+
+    def _scan(self, position):
+        # Reads the record headers from `position` on. Returns the end of the
+        # last complete record.
+        while position + HEADER.size <= self.size:
+            length, crc, kind = HEADER.unpack_from(self.map, position)
+            start = position + HEADER.size
+            if start + length > self.size or zlib.crc32(self.map[start:start + length]) != crc:
+                break
+            if kind == CONTENT:
+                self.records.append((start, length))
+            elif kind == TRUNCATE:
+                del self.records[COUNT.unpack_from(self.map, start)[0]:]
+            else:
+                break
+            position = start + length
+            self.since_snapshot += 1
+        return position
+
+    def _write(self, kind, payload):
+        if self.file is None and not self.size:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self.file = open(self.path, "w+b")
+            self.file.write(MAGIC)
+            self.size = len(MAGIC)
+        elif self.file is None or not self.file.writable():
+            # Opened for reading, or closed.
+            if self.file is not None:
+                self.file.close()
+            self.file = open(self.path, "r+b")
+            self.file.truncate(self.size)
+        self.file.seek(self.size)
+        self.file.write(HEADER.pack(len(payload), zlib.crc32(payload), kind) + payload)
+        self.file.flush()
+        offset = self.size + HEADER.size
+        self.size = offset + len(payload)
+        self.dirty = True
+        if self.fsync == "always":
+            self.sync()
+        self.since_snapshot += 1
+        return offset
+
+    def _mapped(self):
+        # Mapped again when used after close().
+        if self.map is None:
+            with open(self.path, "rb") as f:
+                self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self.map
+
+    def _payload(self, index):
+        offset, length = self.records[index]
+        return self._mapped()[offset:offset + length]
+
+    def _replace(self, start, entries):
+        # Replaces everything from `start` on with `entries`, which are
+        # contents or ("raw", index) for an unread content to copy across.
+        if not self.path:
+            del self.contents[start:]
+            self.contents.extend(entries)
+            return
+        # Unread contents keep pointing at their old record, which is still
+        # in the log and in the map; the new record is only for resuming.
+        entries = [(None, self.records[entry[1]], self._payload(entry[1])) if isinstance(entry, tuple) else (entry, None, entry.model_dump_json(exclude_none=True).encode()) for entry in entries]
+        if start < len(self.records):
+            self._write(TRUNCATE, COUNT.pack(start))
+        del self.contents[start:]
+        del self.records[start:]
+        for content, record, payload in entries:
+            offset = self._write(CONTENT, payload)
+            self.records.append(record or (offset, len(payload)))
+            self.contents.append(content)
+        if self.since_snapshot >= self.snapshot_every:
+            self.snapshot()
+
+    def _tail(self, start):
+        return [("raw", index) if self.contents[index] is None else self.contents[index] for index in range(start, len(self.contents))]
+
+    def _load(self, index):
+        content = self.contents[index]
+        if content is None:
+            offset, length = self.records[index]
+            content = types.Content.model_validate_json(self._mapped()[offset:offset + length])
+            if self.on_load:
+                content = self.on_load(content)
+            self.contents[index] = content
+        return content
+
+    def __len__(self):
+        return len(self.contents)
+
+    def __getitem__(self, index):
+        with self.lock:
+            if isinstance(index, slice):
+                return [self._load(i) for i in range(*index.indices(len(self.contents)))]
+            if index < 0:
+                index += len(self.contents)
+            if not 0 <= index < len(self.contents):
+                raise IndexError("journal index out of range")
+            return self._load(index)
+
+    def _splice(self, change):
+        # Applies `change` to a list of the entries, and writes the entries
+        # from the first one that changed on.
+        entries = self._tail(0)
+        changed = list(entries)
+        change(changed)
+        start = next((i for i, (a, b) in enumerate(zip(entries, changed)) if a is not b), min(len(entries), len(changed)))
+        if start < len(entries) or start < len(changed):
+            self._replace(start, changed[start:])
+
+    def __setitem__(self, index, value):
+        with self.lock:
+            self._splice(lambda entries: entries.__setitem__(index, value))
+
+    def __delitem__(self, index):
+        with self.lock:
+            self._splice(lambda entries: entries.__delitem__(index))
+
+    def insert(self, index, value):
+        with self.lock:
+            index = min(max(index + len(self.contents) if index < 0 else index, 0), len(self.contents))
+            self._replace(index, [value] + self._tail(index))
+
+    def append(self, value):
+        with self.lock:
+            self._replace(len(self.contents), [value])
+
+    def clear(self):
+        with self.lock:
+            self._replace(0, [])
+
+    def __repr__(self):
+        return f"Journal({self.path!r}, {len(self)} messages)"
+
+    def sync(self):
+        if self.file is not None and self.dirty:
+            os.fsync(self.file.fileno())
+            self.dirty = False
+
+    def commit(self):
+        # End of a turn.
+        with self.lock:
+            if self.fsync == "turn":
+                self.sync()
+
+    def snapshot(self):
+        with self.lock:
+            if self.file is None:
+                return
+            if self.fsync != "never":
+                # The snapshot must not refer to records that aren't on disk.
+                self.sync()
+            offsets = array.array("Q", (offset for offset, _ in self.records))
+            lengths = array.array("I", (length for _, length in self.records))
+            temp = f"{self.snapshot_path}.tmp"
+            with open(temp, "wb") as f:
+                f.write(SNAPSHOT_MAGIC + SNAPSHOT.pack(self.size, len(self.records)) + offsets.tobytes() + lengths.tobytes())
+            os.replace(temp, self.snapshot_path)
+            self.since_snapshot = 0
+
+    def close(self):
+        # Releases the log; it is opened again if the journal is used after.
+        with self.lock:
+            if self.file is not None and self.fsync != "never":
+                self.sync()
+            if self.map is not None:
+                self.map.close()
+                self.map = None
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+
+def _title(journal):
+    for index in range(len(journal)):
+        content = journal[index]
+        if content.role == "user":
+            for part in content.parts or []:
+                if part.text and not part.text.startswith("SYSTEM:"):
+                    return " ".join(part.text.split())
+    return ""
+
+def list_sessions(directory: str = SESSIONS_DIR):
+    # Saved sessions, most recently changed first.
+    sessions = []
+    if not os.path.isdir(directory):
+        return sessions
+    for name in os.listdir(directory):
+        if not name.endswith(".log"):
+            continue
+        path = os.path.join(directory, name)
+        try:
+            journal = Journal(path, fsync="never")
+        except (OSError, ValueError):
+            continue
+        try:
+            sessions.append({
+                "id": name[:-len(".log")],
+                "messages": len(journal),
+                "modified": os.path.getmtime(path),
+                "title": _title(journal),
+            })
+        finally:
+            journal.close()
+    sessions.sort(key=lambda session: session["modified"], reverse=True)
+    return sessions
+
+def find_session(directory, prefix):
+    # The id of the session starting with `prefix`, which must be unique.
+    matches = [name[:-len(".log")] for name in os.listdir(directory) if name.endswith(".log") and name.startswith(prefix)] if os.path.isdir(directory) else []
+    if len(matches) != 1:
+        raise KeyError(f"No session matches '{prefix}'." if not matches else f"'{prefix}' matches {len(matches)} sessions.")
+    return matches[0]
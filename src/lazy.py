@@ -0,0 +1,62 @@
+# Deferred imports and objects, so starting Jasper does not wait for
+# google.genai, jinja2 and friends until they are actually used.
+
+import importlib
+import threading
+
+
+class LazyModule:
+    # Imports `name` on first attribute access.
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    self._module = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        return f"<lazy module {self._name!r}{' (loaded)' if self._module else ''}>"
+
+
+class Lazy:
+    # Proxy for the object returned by `factory`, created on first attribute
+    # access or by warm(), which creates it on a background thread.
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._object = None
+        self._lock = threading.Lock()
+
+    def _resolve(self):
+        if self._object is None:
+            with self._lock:
+                if self._object is None:
+                    self._object = self._factory()
+        return self._object
+
+    def _warm(self):
+        try:
+            self._resolve()
+        except Exception:
+            # Raised again on first use.
+            pass
+
+    def warm(self):
+        thread = threading.Thread(target=self._warm, daemon=True)
+        thread.start()
+        return thread
+
+    def __getattr__(self, attr):
+        return getattr(self._resolve(), attr)
+
+    def __len__(self):
+        return len(self._resolve())
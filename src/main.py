@@ -1,48 +1,59 @@
+import os
 import sys
+import time
+import asyncio
 import threading
-from PyQt5.QtWidgets import QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QLineEdit, QPushButton, QLabel, QTextEdit
-from PyQt5.QtCore import QThread, pyqtSignal, QTimer
+from functools import partial
+
+STARTED = time.perf_counter()
+
+from PyQt5.QtWidgets import QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QLineEdit, QPushButton, QLabel
+from PyQt5.QtCore import QThread, pyqtSignal, QTimer, QEvent, Qt
 
 from QPanda3D.Panda3DWorld import Panda3DWorld
-from QPanda3D.QPanda3DWidget import QPanda3DWidget, QPanda3DSynchronizer
+from QPanda3D.QPanda3DWidget import QPanda3DWidget
 
 from direct.actor.Actor import Actor
 from panda3d.core import loadPrcFileData
+from panda3d.core import NodePath
 
 from jinja2 import Template
 
 from actions import Jasper, client
+from async_jasper import AsyncJasper
+from asset_cache import AssetCache, ASSET_CACHE_DIR
+from transcript import FrameBatcher, TranscriptView
+import render_loop
 
-def patched_synchronizer_init(self, qPanda3DWidget, FPS=60):
-    QTimer.__init__(self)
-    self.qPanda3DWidget = qPanda3DWidget
-    dt = 1000. / FPS
-    self.setInterval(int(dt))
-    self.timeout.connect(self.tick)
-
-QPanda3DSynchronizer.__init__ = patched_synchronizer_init
+render_loop.install()
 
 loadPrcFileData("", "load-file-type gltf panda3d_gltf.core:GltfLoader")
+# Converted models are cached by AssetCache, so Panda's own model cache stays off.
 loadPrcFileData("", "model-cache-dir /dev/null")
-
-animations_to_load = {
-    "idle":                "models/animations/idle.glb",
-    "jump":                "models/animations/jump.glb",
-    "left_strafe":         "models/animations/left strafe.glb",
-    "left_strafe_walking": "models/animations/left strafe walking.glb",
-    "left_turn_90":        "models/animations/left turn 90.glb",
-    "left_turn":           "models/animations/left turn.glb",
-    "right_strafe":        "models/animations/right strafe.glb",
-    "right_strafe_walking":"models/animations/right strafe walking.glb",
-    "right_turn_90":       "models/animations/right turn 90.glb",
-    "right_turn":          "models/animations/right turn.glb",
-    "run":                 "models/animations/running.glb",
-    "walk":                "models/animations/walking.glb",
-    "thinking":            "models/animations/Thinking.glb",
-    "executing":           "models/animations/Searching Files High.glb",
-    "searching":           "models/animations/Rummaging.glb",
-    "analysing":           "models/animations/Searching Files High.glb",
-}
+asset_cache_dir = os.getenv("JASPER_ASSET_CACHE") or ASSET_CACHE_DIR
+
+try:
+    # Written by models/pipeline.py.
+    from animation_registry import animations_to_load
+except ImportError:
+    animations_to_load = {
+        "idle":                "models/animations/idle.glb",
+        "jump":                "models/animations/jump.glb",
+        "left_strafe":         "models/animations/left strafe.glb",
+        "left_strafe_walking": "models/animations/left strafe walking.glb",
+        "left_turn_90":        "models/animations/left turn 90.glb",
+        "left_turn":           "models/animations/left turn.glb",
+        "right_strafe":        "models/animations/right strafe.glb",
+        "right_strafe_walking":"models/animations/right strafe walking.glb",
+        "right_turn_90":       "models/animations/right turn 90.glb",
+        "right_turn":          "models/animations/right turn.glb",
+        "run":                 "models/animations/running.glb",
+        "walk":                "models/animations/walking.glb",
+        "thinking":            "models/animations/Thinking.glb",
+        "executing":           "models/animations/Searching Files High.glb",
+        "searching":           "models/animations/Rummaging.glb",
+        "analysing":           "models/animations/Searching Files High.glb",
+    }
 
 class JasperPandaWorld(Panda3DWorld):
     def __init__(self):
@@ -51,9 +62,19 @@ class JasperPandaWorld(Panda3DWorld):
         self.setBackgroundColor(0.5, 0.5, 0.5)
 
         model_path = "models/animations/eric-rigged-001-rigged-3d-business-man.glb"
-        
+
+        self.asset_cache = AssetCache(asset_cache_dir)
+        # Loaded clips by file, shared by animations that use the same file.
+        self.clips = {}
+        self.pending = set()
+        self.ready = set()
+        self.anim_lock = threading.RLock()
+
         try:
-            self.actor = Actor(model_path, animations_to_load)
+            # Only idle is loaded before the first frame; other clips are
+            # loaded in the background afterwards, or when first played.
+            self.actor = Actor(self._load_cached(model_path), {"idle": self._load_clip(animations_to_load["idle"])})
+            self.ready.add("idle")
             self.actor.reparent_to(self.render)
             self.actor.setPos(0, 0, 0)
             self.actor.loop("idle")
@@ -65,11 +86,84 @@ class JasperPandaWorld(Panda3DWorld):
             
             self.cam.setPos(0, -4, 1)
             self.cam.setHpr(0, 0, 0)
+
+            # Set JASPER_EAGER_ANIMATIONS=1 to load every clip before the first frame.
+            if os.getenv("JASPER_EAGER_ANIMATIONS"):
+                for name in animations_to_load:
+                    self.ensure_anim(name)
             
         except Exception as e:
             print(f"FATAL: Could not load models/animations. Error: {e}")
             raise e
 
+        # Runs after the frame has been rendered (igLoop has sort 50).
+        self.taskMgr.add(self._first_frame, "first-frame", sort = 100)
+
+    def _load_cached(self, path):
+        # Loads `path` from the BAM cache, converting it on the first load.
+        cached = self.asset_cache.lookup(path)
+        if cached:
+            return self.loader.loadModel(cached)
+        model = self.loader.loadModel(path)
+        self.asset_cache.store(path, model)
+        return model
+
+    def _load_clip(self, path):
+        with self.anim_lock:
+            if path not in self.clips:
+                self.clips[path] = self._load_cached(path)
+            return self.clips[path]
+
+    def _bind(self, name, clip):
+        # Uses the clip's own animation if the file has one, otherwise lets
+        # the Actor load it from the file when it is first played.
+        if clip.find("**/+AnimBundleNode").isEmpty():
+            self.actor.loadAnims({name: self.asset_cache.resolve(animations_to_load[name])})
+        else:
+            self.actor.loadAnims({name: clip})
+        self.ready.add(name)
+
+    def ensure_anim(self, name):
+        # Makes sure `name` is loaded, loading it now if the background loader
+        # has not got to it yet. Returns False for unknown animations.
+        if name in self.ready:
+            return True
+        if name not in animations_to_load:
+            return False
+        with self.anim_lock:
+            if name not in self.ready:
+                self._bind(name, self._load_clip(animations_to_load[name]))
+        return True
+
+    def warm_animations(self):
+        # Queues every clip that is not loaded yet on Panda3D's background loader.
+        for path in set(animations_to_load.values()):
+            with self.anim_lock:
+                if path in self.clips or path in self.pending:
+                    continue
+                self.pending.add(path)
+            cached = self.asset_cache.lookup(path)
+            self.loader.loadModel(cached or path, callback = partial(self._clip_loaded, path, cached is None))
+
+    def _clip_loaded(self, path, convert, model):
+        with self.anim_lock:
+            self.pending.discard(path)
+            if not isinstance(model, NodePath) or model.isEmpty():
+                return
+            if path not in self.clips:
+                self.clips[path] = model
+                if convert:
+                    self.asset_cache.store(path, model)
+            for name, clip_path in animations_to_load.items():
+                if clip_path == path and name not in self.ready:
+                    self._bind(name, self.clips[path])
+
+    def _first_frame(self, task):
+        if os.getenv("DEBUG") or os.getenv("JASPER_PROFILE_STARTUP"):
+            print(f"Time to first frame: {(time.perf_counter() - STARTED) * 1000:.0f} ms")
+        self.warm_animations()
+        return task.done
+
 
 class JasperWorker(QThread):
     info_received = pyqtSignal(dict)
@@ -86,8 +180,35 @@ class JasperWorker(QThread):
         self.info_received.emit(info)
 
 
+class AsyncJasperThread(QThread):
+    # Runs an AsyncJasper on its own asyncio loop, so the GUI can queue
+    # messages and cancel turns without starting a thread per message.
+    info_received = pyqtSignal(dict)
+    def __init__(self, jasper_instance):
+        super().__init__()
+        self.jasper = jasper_instance
+        self.jasper.callback = self.info_received.emit
+        self.loop = None
+        self.ready = threading.Event()
+
+    def run(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.loop.create_task(self.jasper.serve())
+        self.ready.set()
+        self.loop.run_forever()
+
+    def submit(self, message):
+        self.ready.wait()
+        self.loop.call_soon_threadsafe(self.jasper.submit, message)
+
+    def cancel(self):
+        self.ready.wait()
+        self.loop.call_soon_threadsafe(self.jasper.cancel)
+
+
 class MainWindow(QMainWindow):
-    animation_request_signal = pyqtSignal(str, int)
+    animation_request_signal = pyqtSignal(str)
 
     def __init__(self):
         super().__init__()
@@ -102,6 +223,10 @@ class MainWindow(QMainWindow):
         
         self.panda_widget = QPanda3DWidget(self.world)
         layout.addWidget(self.panda_widget, 1)
+        self.frames = self.panda_widget.synchronizer
+        QApplication.instance().applicationStateChanged.connect(
+            lambda state: self.frames.set_focused(state == Qt.ApplicationActive)
+        )
 
         io_layout = QVBoxLayout()
 
@@ -114,12 +239,19 @@ class MainWindow(QMainWindow):
         self.send_button = QPushButton("Send")
         self.send_button.clicked.connect(self.send_from_gui)
         controls_layout.addWidget(self.send_button)
+
+        # Set JASPER_ASYNC=1 to queue messages while Jasper is busy and allow cancelling.
+        self.use_async = bool(os.getenv("JASPER_ASYNC"))
+        if self.use_async:
+            self.stop_button = QPushButton("Stop")
+            self.stop_button.clicked.connect(self.cancel_jasper)
+            controls_layout.addWidget(self.stop_button)
         
-        self.output_text_edit = QTextEdit()
-        self.output_text_edit.setReadOnly(True)
-        self.output_text_edit.setAcceptRichText(True)
-        self.output_text_edit.setStyleSheet("font-size: 14px; padding: 5px;")
-        io_layout.addWidget(self.output_text_edit)
+        self.output_view = TranscriptView()
+        self.output_view.setStyleSheet("font-size: 14px;")
+        io_layout.addWidget(self.output_view)
+        # Jasper's events are applied to the GUI at most once per frame.
+        self.events = FrameBatcher(self.apply_jasper_info, parent = self)
         io_layout.addLayout(controls_layout)
 
         layout.addLayout(io_layout)
@@ -128,11 +260,20 @@ class MainWindow(QMainWindow):
         animations_to_ignore = ["idle", "thinking", "executing", "searching"]
         animations = [animation for animation in animations_to_load.keys() if animation not in animations_to_ignore]
         animation_prompt = Template(animation_prompt).render(
-            animations = '\n- '.join(animations)
+            animations = '\n- '.join(animations),
+            function_calling = bool(os.getenv("JASPER_FUNCTION_CALLING")),
         )
 
-        self.jasper = Jasper(client, overrides={"sys_prompt": animation_prompt, "execute": {"animation": self.handle_animation}}) 
+        overrides = {"sys_prompt": animation_prompt, "execute": {"animation": self.handle_animation}}
         self.jasper_worker = None
+        if self.use_async:
+            self.jasper = AsyncJasper(client, overrides=overrides)
+            self.jasper_thread = AsyncJasperThread(self.jasper)
+            self.jasper_thread.info_received.connect(self.handle_jasper_info)
+            self.jasper_thread.start()
+        else:
+            self.jasper = Jasper(client, overrides=overrides)
+        self.jasper.warm()
 
         self.is_custom_animation_active = False
         self.custom_animation_timer = QTimer(self)
@@ -142,78 +283,109 @@ class MainWindow(QMainWindow):
         self.animation_request_signal.connect(self._perform_animation_in_gui_thread)
 
     def handle_jasper_info(self, info: dict):
-        if message := info.get("message"):
-            self.output_text_edit.append(message)
-        if state := info.get("state"):
+        self.events.add(info)
+
+    def apply_jasper_info(self, events):
+        rows = []
+        state = None
+        status = {
+            "thinking": "Thinking...",
+            "executing": "Executing code...",
+            "searching": "Searching the web...",
+            "analysing": "Analysing files...",
+        }
+        for info in events:
+            if message := info.get("message"):
+                rows.append(("message", message))
+            if info.get("cancelled"):
+                rows.append(("status", "Cancelled."))
+            if info.get("state"):
+                state = info["state"]
+                if state in status:
+                    rows.append(("status", status[state]))
+        self.output_view.extend(rows)
+
+        # Only the last state of the batch is shown on the avatar.
+        if state:
+            self.frames.set_active("state", state != "idle")
             if hasattr(self.world, 'actor') and self.world.actor:
-                if not self.is_custom_animation_active:
+                if not self.is_custom_animation_active and self.world.ensure_anim(state):
                     current_animation = self.world.actor.getCurrentAnim()
                     if current_animation != state:
                         self.world.actor.loop(state)
-                map = {
-                    "idle": None,
-                    "thinking": "Thinking...",
-                    "executing": "Executing code...",
-                    "searching": "Searching the web...",
-                    "analysing": "Analysing files...",
-                }
-                text = map.get(info["state"])
-                self.output_text_edit.append(text)
-
-    def _perform_animation_in_gui_thread(self, animation: str, delay_ms: int):
+
+    def _perform_animation_in_gui_thread(self, animation: str):
+        # Loading a clip changes the scene graph, so it happens here on the
+        # GUI thread, which also runs Panda3D's frames.
         try:
             if hasattr(self.world, 'actor') and self.world.actor:
                 if self.custom_animation_timer.isActive():
                     self.custom_animation_timer.stop()
 
+                if not self.world.ensure_anim(animation):
+                    print(f"Warning: Unknown animation {animation}.")
+                    return
+                duration = self.world.actor.getDuration(animation) or 0
+                delay_ms = max(2000, int(float(duration) * 1000))
+
                 self.world.actor.stop()
                 self.is_custom_animation_active = True
+                self.frames.set_active("animation", True)
                 self.world.actor.play(animation)
                 
                 self.custom_animation_timer.start(delay_ms)
-                return "Animation initiated successfully."
-            return "Warning: Actor not yet initialized (GUI thread)."
         except Exception as e:
             self.is_custom_animation_active = False
+            self.frames.set_active("animation", False)
             if self.custom_animation_timer.isActive():
                 self.custom_animation_timer.stop()
-            return f"Error playing animation in GUI thread: {e}"
+            print(f"Error playing animation in GUI thread: {e}")
 
 
     def handle_animation(self, animation):
-        try:
-            if not (hasattr(self.world, 'actor') and self.world.actor):
-                return "Warning: Actor not yet initialized."
-
-            anim_length = 0
-            try:
-                duration_val = self.world.actor.getDuration(animation)
-                if duration_val is not None:
-                    anim_length = duration_val
-                else:
-                    print(f"Warning: getDuration returned None for {animation.strip()}. Defaulting to 0.")
-            except Exception as e:
-                print(f"Warning: Could not get animation length for {animation.strip()}: {e}")
-            
-            effective_anim_length = float(anim_length) if anim_length is not None else 0.0
-            delay_ms = max(2000, int(effective_anim_length * 1000)) if effective_anim_length > 0 else 2000
-
-            self.animation_request_signal.emit(animation, delay_ms)
-            
-            return "Animation Successful."
-        except Exception as e:
-            return f"Error preparing animation: {e}"
+        # Runs on Jasper's worker thread, so the animation is only requested
+        # here and loaded and played by _perform_animation_in_gui_thread.
+        animation = animation.strip()
+        if not (hasattr(self.world, 'actor') and self.world.actor):
+            return "Warning: Actor not yet initialized."
+        if animation not in animations_to_load:
+            return f"Unknown animation: {animation}"
+        self.animation_request_signal.emit(animation)
+        return "Animation Successful."
         
     def return_to_idle(self):
         if hasattr(self.world, 'actor') and self.world.actor:
             if self.is_custom_animation_active:
                 self.world.actor.loop('idle')
         self.is_custom_animation_active = False
+        self.frames.set_active("animation", False)
+
+    def changeEvent(self, event):
+        if event.type() == QEvent.WindowStateChange:
+            self.frames.set_visible(not self.isMinimized())
+        super().changeEvent(event)
+
+    def showEvent(self, event):
+        self.frames.set_visible(not self.isMinimized())
+        super().showEvent(event)
+
+    def hideEvent(self, event):
+        self.frames.set_visible(False)
+        super().hideEvent(event)
+
+    def cancel_jasper(self):
+        self.jasper_thread.cancel()
 
     def send_from_gui(self):
         text_to_send = self.input_field.text()
+        if self.use_async:
+            if text_to_send.strip() != "":
+                self.output_view.append(f">> {text_to_send}", "user")
+                self.jasper_thread.submit(text_to_send)
+                self.input_field.clear()
+            return
         if text_to_send.strip() != "" and (self.jasper_worker is None or not self.jasper_worker.isRunning()):
-            self.output_text_edit.append(f">> {text_to_send}")
+            self.output_view.append(f">> {text_to_send}", "user")
             self.jasper_worker = JasperWorker(text_to_send, self.jasper)
             self.jasper_worker.info_received.connect(self.handle_jasper_info)
             self.jasper_worker.start()
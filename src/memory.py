@@ -0,0 +1,171 @@
+import atexit
+import copy
+import json
+import os
+import re
+import sqlite3
+import threading
+from functools import lru_cache
+
+MEMORY_DB = "memory.db"
+# Older versions kept everything in one JSON file; it is imported on first run.
+LEGACY_FILE = "memory.json"
+MAX_CHANGES = 1024
+
+# Dotted paths like user.age can be looked up directly, without JSONPath.
+SIMPLE_PATH = re.compile(r"^[^.\[\]\*\$@]+(\.[^.\[\]\*\$@]+)*$")
+
+@lru_cache(maxsize=256)
+def compile_path(path):
+    from jsonpath_ng import parse
+    return parse(path)
+
+def set_in_dict(data, path, value):
+    keys = path.split('.')
+    d = data
+    for key in keys[:-1]:
+        if key not in d or not isinstance(d[key], dict):
+            d[key] = {}
+        d = d[key]
+    d[keys[-1]] = value
+
+def flatten(data, prefix=""):
+    # Leaves are non-dict values and empty dicts.
+    for key, value in data.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict) and value:
+            yield from flatten(value, path + ".")
+        else:
+            yield path, value
+
+
+class MemoryStore:
+    # Jasper's persistent memory, stored one leaf per row in SQLite.
+    # The whole tree is also kept in memory, so reads never touch the disk
+    # unless another process (e.g. the GUI while the CLI is running) has
+    # committed since. Writes update the tree at once and are committed in
+    # batches, in a single fsync'd transaction: when flush() is called (Jasper
+    # does at the end of each turn), every `batch_size` writes, and on exit.
+
+    def __init__(self, path: str = MEMORY_DB, legacy: str = LEGACY_FILE, batch_size: int = 32):
+        self.batch_size = batch_size
+        self.lock = threading.RLock()
+        self.pending = []
+
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=FULL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS memory (path TEXT PRIMARY KEY, value TEXT NOT NULL)")
+
+        self.tree = None
+        self.version = None
+        # Bumped on every change, local or from another process.
+        self.revision = 0
+        # (revision, path) of each set() since the tree was last loaded, so
+        # the index can update just those paths.
+        self.changes = []
+        self.loaded = 0
+
+        if legacy and os.path.exists(legacy) and not self.conn.execute("SELECT 1 FROM memory LIMIT 1").fetchone():
+            with open(legacy) as f:
+                for key, value in flatten(json.load(f)):
+                    self.set(key, value)
+            self.flush()
+
+        atexit.register(self.close)
+
+    def _data_version(self):
+        return self.conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def _load(self):
+        version = self._data_version()
+        if self.tree is not None and version == self.version:
+            return self.tree
+        tree = {}
+        for path, value in self.conn.execute("SELECT path, value FROM memory ORDER BY path"):
+            set_in_dict(tree, path, json.loads(value))
+        for path, value in self.pending:
+            set_in_dict(tree, path, value)
+        self.tree, self.version = tree, version
+        self.revision += 1
+        self.loaded = self.revision
+        self.changes = []
+        return tree
+
+    def current_revision(self):
+        with self.lock:
+            self._load()
+            return self.revision
+
+    def changes_since(self, revision):
+        # Returns the paths set since `revision` and the current revision,
+        # or None for the paths if memory was reloaded since.
+        with self.lock:
+            self._load()
+            if revision is None or revision < self.loaded:
+                return None, self.revision
+            return [path for changed, path in self.changes if changed > revision], self.revision
+
+    def keys(self):
+        # The top-level keys, without copying the tree.
+        with self.lock:
+            return sorted(self._load())
+
+    def get(self, path: str = None):
+        # Returns a copy of the whole memory, or the value at a dotted path.
+        with self.lock:
+            data = self._load()
+            for key in path.split(".") if path else []:
+                data = data[key]
+            return copy.deepcopy(data)
+
+    def find(self, path: str):
+        # Returns the list of values matching a dotted path or JSONPath expression.
+        with self.lock:
+            data = self._load()
+            if SIMPLE_PATH.match(path):
+                for key in path.split("."):
+                    if not isinstance(data, dict) or key not in data:
+                        return []
+                    data = data[key]
+                return [copy.deepcopy(data)]
+            return [copy.deepcopy(match.value) for match in compile_path(path).find(data)]
+
+    def set(self, path: str, value):
+        with self.lock:
+            set_in_dict(self._load(), path, value)
+            self.pending.append((path, value))
+            self.revision += 1
+            self.changes.append((self.revision, path))
+            if len(self.changes) > MAX_CHANGES:
+                # Whoever is this far behind rebuilds from the tree.
+                self.changes = []
+                self.loaded = self.revision
+            if len(self.pending) >= self.batch_size:
+                self.flush()
+
+    def flush(self):
+        with self.lock:
+            if not self.pending:
+                return
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                for path, value in self.pending:
+                    # Replace the subtree at path, and any ancestor that was a leaf.
+                    self.conn.execute("DELETE FROM memory WHERE path = ? OR (path >= ? AND path < ?)", (path, path + ".", path + "/"))
+                    keys = path.split(".")
+                    for i in range(1, len(keys)):
+                        self.conn.execute("DELETE FROM memory WHERE path = ?", (".".join(keys[:i]),))
+                    self.conn.execute("INSERT INTO memory (path, value) VALUES (?, ?)", (path, json.dumps(value)))
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.pending = []
+
+    def close(self):
+        with self.lock:
+            if self.conn:
+                self.flush()
+                self.conn.close()
+                self.conn = None
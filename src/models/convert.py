@@ -1,14 +1,18 @@
 # convert.py (Modern GLB Exporter for Blender 4.x)
 # This script converts FBX files to GLB, the format best supported by Panda3D.
+# Pass any number of input/output pairs to convert them in one Blender session:
+#   blender -b --python convert.py -- in1.fbx out1.glb in2.fbx out2.glb ...
 
 import bpy
 import sys
 
+def reset_scene():
+    # Start every file from an empty scene, so actions and armatures from the
+    # previous file are not exported with the next one.
+    bpy.ops.wm.read_factory_settings(use_empty=True)
+
 def convert_file(input_path, output_path):
-    if bpy.ops.object.select_all.poll():
-        bpy.ops.object.select_all(action='SELECT')
-    if bpy.ops.object.delete.poll():
-        bpy.ops.object.delete(use_global=False)
+    reset_scene()
 
     print(f"Importing FBX: {input_path}")
     bpy.ops.import_scene.fbx(filepath=input_path)
@@ -29,11 +33,20 @@ if __name__ == "__main__":
     except ValueError:
         args = []
 
-    if len(args) < 2:
-        print("Error: Missing input and output file paths.")
+    if len(args) < 2 or len(args) % 2:
+        print("Error: Expected pairs of input and output file paths.")
         bpy.ops.wm.quit_blender()
     else:
-        input_file = args[0]
-        output_file = args[1].rsplit('.', 1)[0] + '.glb'
-        convert_file(input_file, output_file)
-        print("Conversion successful.")
\ No newline at end of file
+        failed = 0
+        for input_file, output_file in zip(args[0::2], args[1::2]):
+            output_file = output_file.rsplit('.', 1)[0] + '.glb'
+            try:
+                convert_file(input_file, output_file)
+                # Read by pipeline.py.
+                print(f"CONVERTED: {input_file}")
+            except Exception as e:
+                failed += 1
+                print(f"FAILED: {input_file}: {e}")
+        print("Conversion successful." if not failed else f"{failed} file(s) failed to convert.")
+        if failed:
+            sys.exit(1)
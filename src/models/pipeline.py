@@ -0,0 +1,193 @@
+# Converts Mixamo FBX animations to GLB with Blender and writes the animation
+# registry main.py loads them from.
+#
+# Files are converted in batches, several per Blender session, with a number
+# of Blender processes running in parallel. Files whose source (and convert.py)
+# have not changed since they were last converted are skipped.
+#
+# Run from src/models: python pipeline.py [--workers 4] [--force]
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import struct
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.dirname(HERE)
+CONVERT_SCRIPT = os.path.join(HERE, "convert.py")
+MANIFEST_FILE = os.path.join(HERE, "conversion_manifest.json")
+REGISTRY_FILE = os.path.join(SRC_DIR, "animation_registry.py")
+
+# Clip names main.py and animation_prompt.md use for some Mixamo file names.
+RENAMES = {"running": "run", "walking": "walk"}
+# Jasper's states and the clips played for them.
+STATE_ANIMATIONS = {
+    "executing": "searching_files_high",
+    "analysing": "searching_files_high",
+    "searching": "rummaging",
+}
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(1024 * 1024):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def output_path(output_dir, source):
+    return os.path.join(output_dir, os.path.splitext(os.path.basename(source))[0] + ".glb")
+
+def load_manifest(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (ValueError, OSError):
+        return {}
+
+def save_manifest(path, manifest):
+    temp = f"{path}.tmp"
+    with open(temp, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(temp, path)
+
+
+def plan(sources, output_dir, manifest, script_hash, force=False):
+    # The sources that need converting, with their hashes.
+    todo = []
+    for source in sources:
+        digest = file_hash(source)
+        entry = manifest.get(os.path.basename(source))
+        up_to_date = (
+            entry
+            and entry["hash"] == digest
+            and entry["script"] == script_hash
+            and os.path.exists(output_path(output_dir, source))
+        )
+        if force or not up_to_date:
+            todo.append((source, digest))
+    return todo
+
+def batches(items, workers, batch_size=None):
+    # Splits items into at most `workers` batches, or batches of `batch_size`.
+    if not items:
+        return []
+    size = batch_size or -(-len(items) // workers)
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+def run_batch(blender, batch, output_dir):
+    # Converts a batch in one Blender session. Returns the sources converted.
+    args = [blender, "-b", "--factory-startup", "--python", CONVERT_SCRIPT, "--"]
+    for source, _ in batch:
+        args += [source, output_path(output_dir, source)]
+    process = subprocess.run(args, capture_output=True, text=True)
+    converted = {line[len("CONVERTED: "):].strip() for line in process.stdout.splitlines() if line.startswith("CONVERTED: ")}
+    for line in process.stdout.splitlines():
+        if line.startswith("FAILED: "):
+            print(f"  {line}")
+    if process.returncode and not converted:
+        print(f"  Blender exited with {process.returncode}: {process.stderr.strip()[-500:]}")
+    return [(source, digest) for source, digest in batch if source in converted]
+
+
+def glb_has_animations(path):
+    # Reads the JSON chunk of a GLB file, without loading the rest.
+    try:
+        with open(path, "rb") as f:
+            magic, _, _ = struct.unpack("<4sII", f.read(12))
+            length, kind = struct.unpack("<I4s", f.read(8))
+            if magic != b"glTF" or kind != b"JSON":
+                return False
+            return bool(json.loads(f.read(length)).get("animations"))
+    except (OSError, ValueError, struct.error):
+        return False
+
+def clip_name(path):
+    name = re.sub(r"\W+", "_", os.path.splitext(os.path.basename(path))[0].lower()).strip("_")
+    return RENAMES.get(name, name)
+
+def build_registry(output_dir):
+    # Maps clip names to GLB paths, relative to src/ where main.py runs.
+    registry = {}
+    for filename in sorted(os.listdir(output_dir)):
+        path = os.path.join(output_dir, filename)
+        if filename.lower().endswith(".glb") and glb_has_animations(path):
+            registry[clip_name(path)] = os.path.relpath(path, SRC_DIR).replace(os.sep, "/")
+    for state, clip in STATE_ANIMATIONS.items():
+        if clip in registry:
+            registry[state] = registry[clip]
+    return registry
+
+def write_registry(registry, path=REGISTRY_FILE):
+    width = max((len(name) for name in registry), default=0) + 3
+    lines = [
+        "# Generated by models/pipeline.py. Rerun it instead of editing this file.",
+        "",
+        "animations_to_load = {",
+        *(f"    {json.dumps(name) + ':':<{width}}{json.dumps(clip)}," for name, clip in registry.items()),
+        "}",
+        "",
+    ]
+    with open(path, "w") as f:
+        f.write("\n".join(lines))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--blender", default=os.getenv("BLENDER_PATH") or "/usr/bin/blender")
+    parser.add_argument("--input", default=os.path.join(HERE, "fbx_animations"))
+    parser.add_argument("--output", default=os.path.join(HERE, "animations"))
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) // 2), help="Blender processes to run at once.")
+    parser.add_argument("--batch-size", type=int, help="Files per Blender session (default: split evenly across workers).")
+    parser.add_argument("--force", action="store_true", help="Convert every file, even if it has not changed.")
+    parser.add_argument("--registry-only", action="store_true", help="Only write animation_registry.py from the existing GLB files.")
+    args = parser.parse_args()
+
+    os.makedirs(args.output, exist_ok=True)
+
+    if not args.registry_only:
+        if not (os.path.isfile(args.blender) and os.access(args.blender, os.X_OK)):
+            print(f"Error: Blender executable not found at '{args.blender}'")
+            print("Set BLENDER_PATH or pass --blender.")
+            sys.exit(1)
+
+        if not os.path.isdir(args.input):
+            print(f"Error: Input folder '{args.input}' not found.")
+            sys.exit(1)
+        sources = sorted(
+            os.path.join(args.input, filename)
+            for filename in os.listdir(args.input)
+            if filename.lower().endswith(".fbx")
+        )
+        manifest = load_manifest(MANIFEST_FILE)
+        script_hash = file_hash(CONVERT_SCRIPT)
+        todo = plan(sources, args.output, manifest, script_hash, args.force)
+        print(f"{len(sources)} FBX files, {len(sources) - len(todo)} up to date, {len(todo)} to convert.")
+
+        start = time.perf_counter()
+        jobs = batches(todo, args.workers, args.batch_size)
+        failed = 0
+        with ThreadPoolExecutor(max_workers=args.workers) as pool:
+            for batch, converted in zip(jobs, pool.map(lambda batch: run_batch(args.blender, batch, args.output), jobs)):
+                failed += len(batch) - len(converted)
+                for source, digest in converted:
+                    manifest[os.path.basename(source)] = {"hash": digest, "script": script_hash}
+                    print(f"  Converted {os.path.basename(source)}")
+                save_manifest(MANIFEST_FILE, manifest)
+        if todo:
+            print(f"Converted {len(todo) - failed} files in {len(jobs)} Blender sessions in {time.perf_counter() - start:.1f}s.")
+        if failed:
+            print(f"{failed} files failed to convert.")
+
+    registry = build_registry(args.output)
+    write_registry(registry)
+    print(f"Wrote {len(registry)} animations to {os.path.relpath(REGISTRY_FILE)}.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,267 @@
+# Pool of long-lived Python worker processes for execute:py.
+# Running this file starts a worker; it should only be started by PythonPool.
+
+import atexit
+import json
+import os
+import queue
+import signal
+import struct
+import subprocess
+import sys
+import threading
+import traceback
+import tempfile
+
+from capture import omitted_marker, DEFAULT_HEAD
+
+HEADER = struct.Struct(">I")
+
+def write_frame(stream, data):
+    payload = json.dumps(data).encode()
+    stream.write(HEADER.pack(len(payload)) + payload)
+    stream.flush()
+
+def _read_exact(stream, size):
+    data = b""
+    while len(data) < size:
+        chunk = stream.read(size - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return data
+
+def read_frame(stream):
+    header = _read_exact(stream, HEADER.size)
+    if header is None:
+        return None
+    payload = _read_exact(stream, HEADER.unpack(header)[0])
+    if payload is None:
+        return None
+    return json.loads(payload)
+
+
+class PythonWorker:
+    def __init__(self, preload=(), persistent=False, memory_limit=None, cwd=None):
+        args = [sys.executable, os.path.abspath(__file__), "--preload", ",".join(preload)]
+        if persistent:
+            args.append("--persistent")
+        if memory_limit:
+            args += ["--memory-limit", str(memory_limit)]
+        self.process = subprocess.Popen(
+            args,
+            stdin = subprocess.PIPE,
+            stdout = subprocess.PIPE,
+            stderr = subprocess.DEVNULL,
+            cwd = cwd,
+            # Own process group, so a timeout also kills anything the code spawned.
+            start_new_session = os.name != "nt",
+        )
+        self.responses = queue.Queue()
+        threading.Thread(target=self._read, daemon=True).start()
+
+    def _read(self):
+        while (frame := read_frame(self.process.stdout)) is not None:
+            self.responses.put(frame)
+        self.responses.put(None)
+
+    def call(self, code, timeout, output_limit=DEFAULT_HEAD):
+        write_frame(self.process.stdin, {"code": code, "output_limit": output_limit})
+        response = self.responses.get(timeout=timeout)
+        if response is None:
+            raise RuntimeError("Python worker exited unexpectedly.")
+        return response["output"]
+
+    def kill(self):
+        try:
+            if os.name != "nt":
+                os.killpg(self.process.pid, signal.SIGKILL)
+            else:
+                self.process.kill()
+        except (ProcessLookupError, PermissionError, OSError):
+            pass
+        self.process.wait()
+
+
+class PythonPool:
+    # Workers are started up front so interpreter startup (and any preloaded
+    # imports) is paid once instead of on every execute:py block.
+    # Each block runs in a fork of a warm worker, so nothing it changes
+    # (globals, os.environ, imported modules, the working directory) is seen
+    # by the next one. Without fork (Windows), os.environ, the working
+    # directory and the set of imported modules are restored after each block.
+    # With persistent=True there is a single worker and everything is kept
+    # between calls, like a REPL session.
+
+    def __init__(self, size: int = 2, preload: list = (), persistent: bool = False, timeout: float = 10, memory_limit: int = None, output_limit: int = DEFAULT_HEAD):
+        self.preload = list(preload)
+        self.persistent = persistent
+        self.timeout = timeout
+        self.memory_limit = memory_limit
+        self.output_limit = output_limit
+        self.cwd = os.getcwd()
+        self.idle = queue.Queue()
+        self.workers = []
+        # Worker running code -> the owner passed to run().
+        self.busy = {}
+        # Calls waiting for a worker -> their owner, and the ones interrupted
+        # while waiting, which must not run once they get one.
+        self.waiting = {}
+        self.interrupted = set()
+        self.lock = threading.Lock()
+        for _ in range(1 if persistent else max(size, 1)):
+            self.idle.put(self._spawn())
+        atexit.register(self.close)
+
+    def _spawn(self):
+        worker = PythonWorker(self.preload, self.persistent, self.memory_limit, self.cwd)
+        self.workers.append(worker)
+        return worker
+
+    def _replace(self, worker):
+        worker.kill()
+        self.busy.pop(worker, None)
+        self.workers.remove(worker)
+        return self._spawn()
+
+    def run(self, code: str, timeout: float = None, owner=None):
+        timeout = timeout or self.timeout
+        call = object()
+        with self.lock:
+            self.waiting[call] = owner
+        worker = self.idle.get()
+        with self.lock:
+            del self.waiting[call]
+            if call in self.interrupted:
+                self.interrupted.discard(call)
+                self.idle.put(worker)
+                return "Python exec error: interrupted"
+            self.busy[worker] = owner
+        try:
+            return worker.call(code, timeout, self.output_limit)
+        except queue.Empty:
+            worker = self._replace(worker)
+            return f"Python exec error: timed out after {timeout:g} seconds"
+        except (OSError, RuntimeError) as e:
+            worker = self._replace(worker)
+            return f"Python exec error: {e}"
+        finally:
+            with self.lock:
+                self.busy.pop(worker, None)
+            self.idle.put(worker)
+
+    def interrupt(self, owner=None):
+        # Kills the workers running code for `owner` (all of them without
+        # one), so a pool shared by several sessions only stops the calls of
+        # the session that was cancelled. They are respawned as the
+        # interrupted calls return. Its calls still waiting for a worker
+        # return without running.
+        with self.lock:
+            self.interrupted.update(call for call, waiting_for in self.waiting.items() if owner is None or waiting_for is owner)
+            running = [worker for worker, running_for in self.busy.items() if owner is None or running_for is owner]
+        for worker in running:
+            worker.kill()
+
+    def close(self):
+        for worker in self.workers:
+            worker.kill()
+        self.workers = []
+
+
+def _run_code(code, namespace, output_limit):
+    with tempfile.TemporaryFile() as capture:
+        saved = os.dup(1), os.dup(2)
+        os.dup2(capture.fileno(), 1)
+        os.dup2(capture.fileno(), 2)
+        try:
+            exec(compile(code, "<string>", "exec"), namespace)
+        except SystemExit as e:
+            if e.code is not None and not isinstance(e.code, int):
+                print(e.code, file=sys.stderr)
+        except BaseException as e:
+            # Drop this frame so the traceback looks like `python -c`.
+            traceback.print_exception(type(e), e, e.__traceback__.tb_next)
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os.dup2(saved[0], 1)
+            os.dup2(saved[1], 2)
+            os.close(saved[0])
+            os.close(saved[1])
+        # Only the first and last output_limit bytes are sent back.
+        size = capture.seek(0, os.SEEK_END)
+        capture.seek(0)
+        if size <= output_limit * 2:
+            return capture.read().decode(errors="replace")
+        head = capture.read(output_limit)
+        capture.seek(size - output_limit)
+        tail = capture.read()
+        return head.decode(errors="replace") + omitted_marker(size - output_limit * 2) + tail.decode(errors="replace")
+
+def _run_forked(code, output_limit):
+    # Runs `code` in a child process, which exits when it is done.
+    read_end, write_end = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_end)
+        try:
+            output = _run_code(code, {"__name__": "__main__"}, output_limit).encode()
+            with os.fdopen(write_end, "wb") as f:
+                f.write(output)
+        finally:
+            os._exit(0)
+    os.close(write_end)
+    with os.fdopen(read_end, "rb") as f:
+        output = f.read()
+    _, status = os.waitpid(pid, 0)
+    if os.WIFSIGNALED(status):
+        output += f"\n[Python exited with signal {os.WTERMSIG(status)}]".encode()
+    return output.decode(errors="replace")
+
+def _restore(cwd, environ, modules):
+    os.chdir(cwd)
+    if dict(os.environ) != environ:
+        os.environ.clear()
+        os.environ.update(environ)
+    for name in [name for name in sys.modules if name not in modules]:
+        del sys.modules[name]
+
+def serve(preload, persistent, memory_limit):
+    # The pipes from the pool become a private channel; fds 0-2 point at
+    # devnull between calls so stray output can't corrupt a frame.
+    channel_in = os.fdopen(os.dup(0), "rb")
+    channel_out = os.fdopen(os.dup(1), "wb")
+    devnull = os.open(os.devnull, os.O_RDWR)
+    for fd in (0, 1, 2):
+        os.dup2(devnull, fd)
+    sys.path[0] = ""
+    sys.argv = ["-c"]
+
+    if memory_limit:
+        import resource
+        limit = memory_limit * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+    for name in preload:
+        try:
+            __import__(name)
+        except Exception:
+            pass
+
+    cwd, environ, modules = os.getcwd(), dict(os.environ), set(sys.modules)
+    namespace = {"__name__": "__main__"}
+    while (request := read_frame(channel_in)) is not None:
+        if persistent:
+            output = _run_code(request["code"], namespace, request["output_limit"])
+        elif hasattr(os, "fork"):
+            output = _run_forked(request["code"], request["output_limit"])
+        else:
+            output = _run_code(request["code"], {"__name__": "__main__"}, request["output_limit"])
+            _restore(cwd, environ, modules)
+        write_frame(channel_out, {"output": output})
+
+if __name__ == "__main__":
+    argv = sys.argv[1:]
+    preload = [name for name in argv[argv.index("--preload") + 1].split(",") if name] if "--preload" in argv else []
+    memory_limit = int(argv[argv.index("--memory-limit") + 1]) if "--memory-limit" in argv else None
+    serve(preload, "--persistent" in argv, memory_limit)
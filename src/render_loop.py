@@ -0,0 +1,126 @@
+# Adaptive replacement for QPanda3D's fixed-rate synchronizer. Renders at
+# full rate while something is happening (a custom animation, a state
+# change), at a low rate while the avatar is idle or the window is not
+# focused, and not at all while the window is minimized, hidden or covered.
+
+import os
+import time
+
+from PyQt5.QtCore import QTimer
+
+import QPanda3D.QPanda3DWidget
+from QPanda3D.QPanda3DWidget import QPanda3DSynchronizer
+
+# How often a covered window is checked for becoming visible again.
+POLL_MS = 500
+
+
+class FrameStats:
+    # Frame count, frame time and process CPU usage since the last report.
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.started = time.perf_counter()
+        self.cpu_started = time.process_time()
+        self.frames = 0
+        self.frame_time = 0.0
+        self.max_frame_time = 0.0
+
+    def frame(self, duration):
+        self.frames += 1
+        self.frame_time += duration
+        self.max_frame_time = max(self.max_frame_time, duration)
+
+    def snapshot(self):
+        elapsed = max(time.perf_counter() - self.started, 1e-9)
+        return {
+            "fps": self.frames / elapsed,
+            "frame_ms": self.frame_time / self.frames * 1000 if self.frames else 0.0,
+            "max_frame_ms": self.max_frame_time * 1000,
+            "cpu_percent": (time.process_time() - self.cpu_started) / elapsed * 100,
+        }
+
+    def report(self, rate):
+        stats = self.snapshot()
+        print(
+            f"[frames] target {rate:g} fps, actual {stats['fps']:.1f} fps, "
+            f"frame {stats['frame_ms']:.1f} ms avg / {stats['max_frame_ms']:.1f} ms max, "
+            f"CPU {stats['cpu_percent']:.1f}%"
+        )
+        self.reset()
+
+
+class AdaptiveSynchronizer(QPanda3DSynchronizer):
+    def __init__(self, qPanda3DWidget, FPS=60):
+        QTimer.__init__(self)
+        self.qPanda3DWidget = qPanda3DWidget
+        self.active_fps = float(os.getenv("JASPER_FPS") or FPS)
+        self.idle_fps = float(os.getenv("JASPER_IDLE_FPS") or 15)
+        # Reasons to render at full rate, e.g. "animation" or "state".
+        self.active = set()
+        self.focused = True
+        self.visible = True
+        self.covered = False
+        self.stats = FrameStats()
+        self.timeout.connect(self.tick)
+
+        # Set JASPER_PROFILE_FRAMES to print frame statistics every 5 seconds.
+        self.report_timer = None
+        if os.getenv("JASPER_PROFILE_FRAMES"):
+            self.report_timer = QTimer()
+            self.report_timer.timeout.connect(lambda: self.stats.report(self.rate()))
+            self.report_timer.start(5000)
+        self._apply()
+
+    def rate(self):
+        if not self.visible or self.covered:
+            return 0
+        if self.active:
+            return self.active_fps
+        return self.idle_fps if self.focused else min(self.idle_fps, 5)
+
+    def _apply(self):
+        fps = self.rate()
+        if not self.visible:
+            # Show/state change events restart the timer.
+            self.stop()
+            return
+        self.setInterval(POLL_MS if fps <= 0 else int(1000 / fps))
+        if not self.isActive():
+            self.start()
+
+    def set_active(self, reason, active: bool):
+        if active:
+            self.active.add(reason)
+        else:
+            self.active.discard(reason)
+        self._apply()
+
+    def set_focused(self, focused: bool):
+        self.focused = focused
+        self._apply()
+
+    def set_visible(self, visible: bool):
+        self.visible = visible
+        self._apply()
+
+    def tick(self):
+        window = self.qPanda3DWidget.window().windowHandle()
+        covered = window is not None and not window.isExposed()
+        if covered != self.covered:
+            self.covered = covered
+            self._apply()
+        if self.covered or self.rate() <= 0:
+            return
+
+        started = time.perf_counter()
+        self.qPanda3DWidget.panda3DWorld.taskMgr.step()
+        self.qPanda3DWidget.update()
+        self.stats.frame(time.perf_counter() - started)
+
+
+def install():
+    # QPanda3DWidget creates its synchronizer by this module-level name.
+    QPanda3D.QPanda3DWidget.QPanda3DSynchronizer = AdaptiveSynchronizer
@@ -0,0 +1,320 @@
+# Two-level cache for repeated requests, kept in SQLite (JASPER_RESPONSE_CACHE=1).
+#
+# Level 1 holds model responses, keyed by the model, the full system prompt and
+# tools, and the conversation since the user message before last, so asking the
+# same thing again (with the same memory, right after the same exchange) skips
+# the model call. Replies that run commands are never cached, since replaying
+# one would run its commands again without the model asking for them.
+#
+# Level 2 holds the output of read-only execute blocks, keyed by (lang, code).
+# A block is read-only if it is marked (execute:sh:readonly, or readonly=true
+# with function calling), if it reads a text file with analyse, or if it is a
+# shell pipeline of commands that only read (cat, grep, wc, ...) from files it
+# names. Unmarked commands are only cached when every path they name is a
+# regular file, since a directory or glob can't tell when its output changes.
+# Entries expire after a TTL, and as soon as a file named in the block changes.
+#
+# Each level is kept under a size limit by evicting least recently used entries.
+
+import hashlib
+import json
+import os
+import re
+import shlex
+import sqlite3
+import threading
+import time
+from typing import Callable
+from lazy import LazyModule
+
+types = LazyModule("google.genai.types")
+
+RESPONSE_CACHE_DB = "response_cache.db"
+READONLY = ":readonly"
+
+# Programs that only read, as long as nothing is redirected to a file and no
+# output file option is given.
+READ_ONLY_PROGRAMS = {
+    "cat", "head", "tail", "less", "ls", "dir", "df", "du", "wc", "grep", "egrep", "fgrep", "rg",
+    "stat", "file", "which", "whereis", "type", "uname", "whoami", "id", "groups", "pwd",
+    "lsblk", "lscpu", "lsusb", "lspci", "nproc", "sw_vers", "printenv", "echo",
+    "sort", "cut", "tr", "column", "md5sum", "sha256sum", "basename", "dirname", "realpath",
+}
+# -o, --output and short option clusters containing o (sort -ro out).
+OUTPUT_OPTION = re.compile(r"^(-[A-Za-z]*o|--output)")
+GLOB = re.compile(r"[*?\[]")
+# find options that write or run other commands.
+FIND_ACTIONS = {"-delete", "-exec", "-execdir", "-ok", "-okdir", "-fprint", "-fprint0", "-fprintf", "-fls"}
+UNSAFE_SHELL = re.compile(r"[<>`]|\$\(|(?<!&)&(?!&)")
+SEPARATORS = re.compile(r"\|\||&&|[|;\n]")
+EXECUTE_BLOCK = re.compile(r"```execute:")
+
+
+def strip_readonly(lang):
+    return lang[:-len(READONLY)] if lang.endswith(READONLY) else lang
+
+def _shell_files(code, marked):
+    # Returns the files a read-only shell command reads, or None if it may
+    # write or (unless `marked`) its output can't be tied to files.
+    if UNSAFE_SHELL.search(code):
+        return None
+    files = []
+    for segment in SEPARATORS.split(code):
+        try:
+            words = shlex.split(segment)
+        except ValueError:
+            return None
+        if not words:
+            continue
+        if words[0] == "find":
+            if FIND_ACTIONS & set(words):
+                return None
+        elif words[0] not in READ_ONLY_PROGRAMS:
+            return None
+        if any(OUTPUT_OPTION.match(word) for word in words[1:]):
+            return None
+        files += [os.path.expanduser(word) for word in words[1:] if not word.startswith("-")]
+    if marked:
+        return [path for path in files if os.path.exists(path)]
+    if not any(os.path.isfile(path) for path in files) or any(GLOB.search(path) or os.path.isdir(path) for path in files):
+        return None
+    # Words that aren't files yet (patterns, or files about to be created)
+    # are stamped as missing, so creating one invalidates the entry.
+    return files
+
+def read_only(lang, code):
+    # Returns the files whose changes invalidate the block's output, or None if
+    # the block's output can't be cached.
+    if lang.startswith("analyse:text/plain"):
+        return [code.split("\n", 1)[0].strip()]
+    marked = lang.endswith(READONLY)
+    lang = strip_readonly(lang)
+    if lang == "sh":
+        files = _shell_files(code, marked)
+        return files if files is not None else ([] if marked else None)
+    return [] if marked else None
+
+def _stamp(path):
+    try:
+        stat = os.stat(path)
+        return [stat.st_mtime_ns, stat.st_size]
+    except OSError:
+        return None
+
+def _runs_commands(response):
+    candidates = response.candidates or []
+    parts = (candidates[0].content.parts or []) if candidates and candidates[0].content else []
+    return any(part.function_call or (part.text and EXECUTE_BLOCK.search(part.text)) for part in parts)
+
+def _is_user_message(content):
+    return content.role == "user" and any(part.text and not part.text.startswith("SYSTEM: Command Output") for part in content.parts or [])
+
+
+class ResponseCache:
+    def __init__(self, path: str = RESPONSE_CACHE_DB, enabled: bool = True, response_ttl: float = 7 * 24 * 3600, tool_ttl: float = 300, response_bytes: int = 64 * 2**20, tool_bytes: int = 16 * 2**20, window: int = 1):
+        self.path = path
+        self.enabled = enabled
+        self.ttl = {"response": response_ttl, "tool": tool_ttl}
+        self.max_bytes = {"response": response_bytes, "tool": tool_bytes}
+        # Earlier user messages whose exchanges are part of the key, so a
+        # short reply like "yes" only matches after the same question.
+        self.window = window
+        # Set by /cache refresh: the next turn skips lookups but stores what it gets.
+        self.refreshing = False
+        self.hits = {"response": 0, "tool": 0}
+        self.misses = {"response": 0, "tool": 0}
+        self.lock = threading.Lock()
+        self.conn = None
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            enabled = bool(os.getenv("JASPER_RESPONSE_CACHE")),
+            response_ttl = float(os.getenv("JASPER_RESPONSE_CACHE_TTL") or 7 * 24 * 3600),
+            tool_ttl = float(os.getenv("JASPER_TOOL_CACHE_TTL") or 300),
+            response_bytes = int(float(os.getenv("JASPER_RESPONSE_CACHE_MB") or 64) * 2**20),
+        )
+
+    def _db(self):
+        # Opened on first use, so a disabled cache costs nothing.
+        if self.conn is None:
+            self.conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=10)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries (level TEXT, key TEXT, value TEXT NOT NULL, files TEXT,"
+                " created REAL, used REAL, size INTEGER, PRIMARY KEY (level, key))"
+            )
+        return self.conn
+
+    def _get(self, level, key):
+        if not self.enabled:
+            return None
+        if self.refreshing:
+            self.misses[level] += 1
+            return None
+        with self.lock:
+            row = self._db().execute("SELECT value, files, created FROM entries WHERE level = ? AND key = ?", (level, key)).fetchone()
+            if row is not None:
+                value, files, created = row
+                stale = time.time() - created > self.ttl[level] or any(_stamp(path) != stamp for path, stamp in json.loads(files or "[]"))
+                if stale:
+                    self._db().execute("DELETE FROM entries WHERE level = ? AND key = ?", (level, key))
+                    row = None
+                else:
+                    self._db().execute("UPDATE entries SET used = ? WHERE level = ? AND key = ?", (time.time(), level, key))
+            if row is None:
+                self.misses[level] += 1
+                return None
+            self.hits[level] += 1
+            return value
+
+    def _put(self, level, key, value, files=()):
+        if not self.enabled:
+            return
+        now = time.time()
+        with self.lock:
+            db = self._db()
+            db.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (level, key, value, json.dumps([[path, _stamp(path)] for path in files]), now, now, len(value)),
+            )
+            total = db.execute("SELECT COALESCE(SUM(size), 0) FROM entries WHERE level = ?", (level,)).fetchone()[0]
+            if total > self.max_bytes[level]:
+                evict = []
+                for old, size in db.execute("SELECT key, size FROM entries WHERE level = ? ORDER BY used", (level,)):
+                    if total <= self.max_bytes[level] * 0.9:
+                        break
+                    evict.append((level, old))
+                    total -= size
+                db.executemany("DELETE FROM entries WHERE level = ? AND key = ?", evict)
+
+    def response_key(self, model, config, contents):
+        start = len(contents)
+        for _ in range(self.window + 1):
+            start -= 1
+            while start > 0 and not _is_user_message(contents[start]):
+                start -= 1
+        key = hashlib.sha256(model.encode())
+        key.update(str(config.system_instruction or "").encode())
+        for tool in config.tools or []:
+            key.update(tool.model_dump_json(exclude_none=True).encode())
+        for content in contents[max(start, 0):]:
+            key.update(content.model_dump_json(exclude_none=True).encode())
+        return key.hexdigest()
+
+    def get_response(self, key):
+        value = self._get("response", key)
+        response = types.GenerateContentResponse.model_validate_json(value) if value is not None else None
+        return None if response is None or _runs_commands(response) else response
+
+    def put_response(self, key, response):
+        # Only complete responses that run no commands are kept.
+        candidates = response.candidates or []
+        if candidates and candidates[0].content and candidates[0].finish_reason in (None, types.FinishReason.STOP) and not _runs_commands(response):
+            self._put("response", key, response.model_dump_json(exclude_none=True))
+
+    def tool_key(self, lang, code):
+        # Returns (key, files) for a read-only block, or None.
+        files = read_only(lang, code)
+        if files is None:
+            return None
+        return hashlib.sha256(f"{strip_readonly(lang)}\n{code}".encode()).hexdigest(), files
+
+    def get_tool(self, key):
+        return self._get("tool", key)
+
+    def put_tool(self, key, files, output):
+        if isinstance(output, str) and "[Timed out after" not in output and not output.startswith("Error executing"):
+            self._put("tool", key, output, files)
+
+    def clear(self):
+        with self.lock:
+            self._db().execute("DELETE FROM entries")
+
+    def stats(self):
+        stats = {}
+        for level in ("response", "tool"):
+            entries, size = (0, 0)
+            if self.conn is not None or os.path.exists(self.path):
+                with self.lock:
+                    entries, size = self._db().execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries WHERE level = ?", (level,)).fetchone()
+            stats[level] = {"hits": self.hits[level], "misses": self.misses[level], "entries": entries, "bytes": size}
+        return stats
+
+
+def _combine(chunks):
+    # One response holding the whole of a streamed one.
+    import tools
+    reply = tools.Reply()
+    for chunk in chunks:
+        reply.add(chunk)
+    last = chunks[-1]
+    candidates = last.candidates or []
+    return types.GenerateContentResponse(
+        candidates = [types.Candidate(content = reply.content(), finish_reason = candidates[0].finish_reason if candidates else None)],
+        usage_metadata = last.usage_metadata,
+    )
+
+
+class CachingTransport:
+    # Puts the response cache in front of a ModelTransport. `config` returns
+    # the full request config (with the system prompt and tools), since the
+    # one sent may refer to a context cache instead.
+
+    def __init__(self, transport, cache: ResponseCache, config: Callable):
+        self.transport = transport
+        self.cache = cache
+        self.config = config
+
+    def __getattr__(self, name):
+        return getattr(self.transport, name)
+
+    def _lookup(self, model, contents, callback):
+        if not self.cache.enabled:
+            return None, None
+        key = self.cache.response_key(model, self.config(), contents)
+        response = self.cache.get_response(key)
+        if response is not None and callback:
+            callback({"cache": {"level": "response", "hit": True}})
+        return key, response
+
+    def generate(self, model, contents, config=None, callback=None):
+        key, response = self._lookup(model, contents, callback)
+        if response is None:
+            response = self.transport.generate(model, contents, config, callback)
+            if key:
+                self.cache.put_response(key, response)
+        return response
+
+    def generate_stream(self, model, contents, config=None, callback=None):
+        key, response = self._lookup(model, contents, callback)
+        if response is not None:
+            yield response
+            return
+        chunks = []
+        for chunk in self.transport.generate_stream(model, contents, config, callback):
+            chunks.append(chunk)
+            yield chunk
+        if key and chunks:
+            self.cache.put_response(key, _combine(chunks))
+
+    async def generate_async(self, model, contents, config=None, callback=None):
+        key, response = self._lookup(model, contents, callback)
+        if response is None:
+            response = await self.transport.generate_async(model, contents, config, callback)
+            if key:
+                self.cache.put_response(key, response)
+        return response
+
+    async def generate_stream_async(self, model, contents, config=None, callback=None):
+        key, response = self._lookup(model, contents, callback)
+        if response is not None:
+            yield response
+            return
+        chunks = []
+        async for chunk in self.transport.generate_stream_async(model, contents, config, callback):
+            chunks.append(chunk)
+            yield chunk
+        if key and chunks:
+            self.cache.put_response(key, _combine(chunks))
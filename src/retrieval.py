@@ -0,0 +1,133 @@
+import bisect
+import heapq
+import math
+import re
+from collections import Counter, defaultdict
+
+from memory import flatten
+
+TOKEN = re.compile(r"[^\W_]+")
+
+def tokenize(text):
+    return TOKEN.findall(str(text).lower())
+
+
+class BM25Index:
+    # Okapi BM25 over (path, value) memory entries. The path is indexed too,
+    # so a query for "age" finds user.age even if the value is just "42".
+    # Entries can be added and removed one at a time.
+
+    def __init__(self, entries=(), k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.entries = {}
+        # Sorted, so a subtree's entries are next to each other.
+        self.paths = []
+        self.terms = {}
+        self.lengths = {}
+        self.postings = defaultdict(dict)
+        self.total_length = 0
+        for path, value in entries:
+            self.add(path, value)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, path, value):
+        self.remove(path)
+        terms = Counter(tokenize(path) + tokenize(value))
+        self.entries[path] = value
+        bisect.insort(self.paths, path)
+        self.terms[path] = terms
+        self.lengths[path] = sum(terms.values())
+        self.total_length += self.lengths[path]
+        for term, count in terms.items():
+            self.postings[term][path] = (count, self.lengths[path])
+
+    def remove(self, path):
+        terms = self.terms.pop(path, None)
+        if terms is None:
+            return
+        del self.entries[path]
+        del self.paths[bisect.bisect_left(self.paths, path)]
+        self.total_length -= self.lengths.pop(path)
+        for term in terms:
+            postings = self.postings[term]
+            del postings[path]
+            if not postings:
+                del self.postings[term]
+
+    def subtree(self, path):
+        # Paths of the entries below `path` ("/" sorts right after ".").
+        return self.paths[bisect.bisect_left(self.paths, path + "."):bisect.bisect_left(self.paths, path + "/")]
+
+    def search(self, query, k: int = 5):
+        scores = defaultdict(float)
+        total = len(self.entries)
+        average = self.total_length / total if total else 0
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+            for path, (count, length) in postings.items():
+                norm = self.k1 * (1 - self.b + self.b * length / average)
+                scores[path] += idf * count * (self.k1 + 1) / (count + norm)
+        best = heapq.nlargest(k, scores, key=scores.get)
+        return [(path, self.entries[path]) for path in best]
+
+
+class MemoryRetriever:
+    # Keeps a BM25Index in step with a MemoryStore. Paths stored since the
+    # last search are re-indexed on their own; the index is only rebuilt when
+    # memory was reloaded, e.g. after another process changed it.
+
+    def __init__(self, store):
+        self.store = store
+        self.index = None
+        self.revision = None
+
+    def _update(self, path):
+        # Makes the index match memory at `path`, below it and at its
+        # ancestors, which is all that memory.set(path, ...) can change.
+        keys = path.split(".")
+        for i in range(1, len(keys)):
+            self.index.remove(".".join(keys[:i]))
+        for child in self.index.subtree(path):
+            self.index.remove(child)
+        self.index.remove(path)
+        # The deepest of path and its ancestors that still exists; a later
+        # store may have replaced one of them with a leaf.
+        for i in range(len(keys), 0, -1):
+            prefix = ".".join(keys[:i])
+            try:
+                value = self.store.get(prefix)
+            except (KeyError, TypeError):
+                continue
+            if isinstance(value, dict) and value:
+                if i == len(keys):
+                    for entry in flatten(value, prefix + "."):
+                        self.index.add(*entry)
+            else:
+                self.index.add(prefix, value)
+            return
+
+    def _current(self):
+        changed, revision = self.store.changes_since(self.revision)
+        if changed is None:
+            self.index = BM25Index(flatten(self.store.get()))
+        else:
+            for path in dict.fromkeys(changed):
+                self._update(path)
+        self.revision = revision
+        return self.index
+
+    def __len__(self):
+        return len(self._current())
+
+    def search(self, query, k: int = 5):
+        return self._current().search(query, k)
+
+
+def format_entries(entries):
+    return "\n".join(f"- {path}: {value}" for path, value in entries)
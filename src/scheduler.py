@@ -0,0 +1,98 @@
+import asyncio
+import time
+from typing import Callable
+from memory import SIMPLE_PATH
+
+# Maximum number of blocks of each kind that may run at once. Languages not
+# listed here (e.g. override handlers such as the GUI's animation) get 1.
+DEFAULT_LIMITS = {
+    "sh": 4,
+    "py": 4,
+    "search": 4,
+    "analyse": 2,
+    "memory": 4,
+}
+
+def command_access(lang):
+    # Returns the (resource, path, writes) accesses of a block; an empty tuple
+    # if it is independent of every other block.
+    command = lang.split(":")
+    group = command[0]
+    if group == "search":
+        return ()
+    if group == "analyse":
+        # Attachments are appended to the conversation, keep them in order,
+        # and after any earlier code block that may have written the file.
+        return (("messages", "", True), ("files", "", False))
+    if group == "memory":
+        verb = command[1] if len(command) > 1 else ""
+        path = command[2] if len(command) > 2 and verb in ("fetch", "store") else ""
+        if verb != "store" and not SIMPLE_PATH.match(path):
+            # Searches and queries such as $.user.name may read any entry.
+            path = ""
+        return (("memory", path, verb == "store"),)
+    # sh, py and override handlers may create or change files or depend on
+    # an earlier block's effects (pip install, then import), so they run one
+    # after another in reply order.
+    return (("files", "", True),)
+
+def _conflict(a, b):
+    resource_a, path_a, writes_a = a
+    resource_b, path_b, writes_b = b
+    if resource_a != resource_b or not (writes_a or writes_b):
+        return False
+    if not path_a or not path_b or path_a == path_b:
+        return True
+    return path_a.startswith(path_b + ".") or path_b.startswith(path_a + ".")
+
+def conflicts(a, b):
+    return any(_conflict(x, y) for x in a for y in b)
+
+
+class Scheduler:
+    # Runs execute blocks as asyncio tasks. A block waits for every earlier
+    # block it conflicts with (e.g. memory:store then memory:fetch on the same
+    # path), so results are the same as running them one after another.
+    # `execute` is a coroutine function.
+
+    def __init__(self, execute: Callable, limits: dict = None, callback: Callable = None):
+        self.execute = execute
+        self.callback = callback or (lambda *a, **k: None)
+        self.limits = {**DEFAULT_LIMITS, **(limits or {})}
+        self.semaphores = {}
+        self.pending = []
+
+    def _semaphore(self, group):
+        if group not in self.semaphores:
+            self.semaphores[group] = asyncio.Semaphore(max(self.limits.get(group, 1), 1))
+        return self.semaphores[group]
+
+    async def _run(self, command, depends_on):
+        lang, _ = command
+        queued = time.perf_counter()
+        if depends_on:
+            await asyncio.wait(depends_on)
+        async with self._semaphore(lang.split(":")[0]):
+            started = time.perf_counter()
+            result = await self.execute(command)
+            finished = time.perf_counter()
+        self.callback({"timing": {
+            "lang": lang,
+            "waited": started - queued,
+            "seconds": finished - started,
+        }})
+        return result
+
+    def submit(self, command):
+        # Must be called from the event loop; returns the block's task.
+        lang, _ = command
+        access = command_access(lang)
+        self.pending = [(a, t) for a, t in self.pending if not t.done()]
+        depends_on = [t for a, t in self.pending if conflicts(a, access)]
+        task = asyncio.create_task(self._run(command, depends_on))
+        self.pending.append((access, task))
+        return task
+
+    async def run(self, commands):
+        # Outputs are returned in the original order.
+        return list(await asyncio.gather(*[self.submit(command) for command in commands]))
@@ -0,0 +1,186 @@
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from html.parser import HTMLParser
+
+SEARCH_CACHE_FILE = "search_cache.json"
+
+def normalize_query(query):
+    # "Weather in  London" and "weather in london" share a cache entry. Word
+    # order is kept, since "flights London to Paris" is a different search.
+    return " ".join(query.lower().split())
+
+
+class GoogleBackend:
+    def search(self, query, num_results):
+        import googlesearch
+        return [
+            {"title": result.title, "url": result.url, "description": result.description}
+            for result in googlesearch.search(query, num_results=num_results, advanced=True)
+        ]
+
+
+class StubBackend:
+    # Offline backend. `results` maps a query to its results; other queries get
+    # generated placeholder results.
+
+    def __init__(self, results: dict = None):
+        self.results = results or {}
+        self.calls = 0
+
+    def search(self, query, num_results):
+        self.calls += 1
+        if query in self.results:
+            return self.results[query][:num_results]
+        return [
+            {"title": f"Result {i + 1} for {query}", "url": f"https://example.com/{i + 1}", "description": f"About {query}."}
+            for i in range(num_results)
+        ]
+
+
+class SearchCache:
+    # Results keyed by normalized query, expired after `ttl` seconds, least
+    # recently used entries evicted past `max_entries`, saved to `path`.
+
+    def __init__(self, path: str = SEARCH_CACHE_FILE, ttl: float = 6 * 3600, max_entries: int = 500):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        if path and os.path.exists(path):
+            try:
+                with open(path) as f:
+                    self.entries = OrderedDict(json.load(f))
+            except (ValueError, OSError):
+                pass
+
+    def get(self, query):
+        key = normalize_query(query)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if time.time() - entry["time"] > self.ttl:
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry["results"]
+
+    def put(self, query, results):
+        with self.lock:
+            self.entries[normalize_query(query)] = {"time": time.time(), "results": results}
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+            self._save()
+
+    def _save(self):
+        if not self.path:
+            return
+        temp = f"{self.path}.tmp"
+        with open(temp, "w") as f:
+            json.dump(self.entries, f)
+        os.replace(temp, self.path)
+
+
+class TextExtractor(HTMLParser):
+    SKIP = {"script", "style", "noscript", "svg", "head", "nav", "footer"}
+
+    def __init__(self):
+        super().__init__()
+        self.depth = 0
+        self.chunks = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP:
+            self.depth += 1
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP and self.depth:
+            self.depth -= 1
+
+    def handle_data(self, data):
+        if not self.depth and data.strip():
+            self.chunks.append(data.strip())
+
+def extract_text(html):
+    parser = TextExtractor()
+    parser.feed(html)
+    return re.sub(r"\s+", " ", " ".join(parser.chunks))
+
+
+class PageFetcher:
+    # Fetches pages concurrently over one pooled requests.Session.
+
+    def __init__(self, workers: int = 4, timeout: float = 5):
+        self.workers = workers
+        self.timeout = timeout
+        self.session = None
+
+    def _session(self):
+        if self.session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            self.session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=self.workers, pool_maxsize=self.workers)
+            self.session.mount("http://", adapter)
+            self.session.mount("https://", adapter)
+            self.session.headers["User-Agent"] = "Mozilla/5.0 (compatible; Jasper)"
+        return self.session
+
+    def _fetch(self, url):
+        try:
+            response = self._session().get(url, timeout=self.timeout)
+            if "html" not in response.headers.get("Content-Type", "html"):
+                return f"(Not an HTML page: {response.headers.get('Content-Type')})"
+            return extract_text(response.text)
+        except Exception as e:
+            return f"(Could not fetch page: {e})"
+
+    def fetch(self, urls):
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            return list(pool.map(self._fetch, urls))
+
+
+class SearchEngine:
+    # execute:search. Results are cached per normalized query; with
+    # fetch_pages > 0 (or execute:search:fetch) the top pages are fetched too,
+    # and an excerpt of each is included in the output.
+
+    def __init__(self, backend=None, cache: SearchCache = None, fetch_pages: int = 0, excerpt_chars: int = 1500, num_results: int = 10):
+        self.backend = backend or GoogleBackend()
+        self.cache = cache or SearchCache()
+        self.fetch_pages = fetch_pages
+        self.excerpt_chars = excerpt_chars
+        self.num_results = num_results
+        self.fetcher = PageFetcher()
+        self.hits = 0
+        self.misses = 0
+
+    def search(self, query, fetch: bool = False):
+        query = query.strip()
+        results = self.cache.get(query)
+        if results is None:
+            self.misses += 1
+            results = self.backend.search(query, self.num_results)
+            # No results may just mean the backend is rate limiting us.
+            if results:
+                self.cache.put(query, results)
+        else:
+            self.hits += 1
+
+        res = "## Search Results"
+        for result in results:
+            res += f"\n### {result['title']}\n{result['url']}\n{result['description']}"
+
+        pages = max(self.fetch_pages, 3 if fetch else 0)
+        if pages and results:
+            top = results[:pages]
+            res += "\n\n## Page Excerpts"
+            for result, text in zip(top, self.fetcher.fetch([result["url"] for result in top])):
+                res += f"\n### {result['url']}\n{text[:self.excerpt_chars]}"
+        return res
@@ -0,0 +1,245 @@
+# Hosts many Jasper sessions in one process over a local HTTP API.
+# Callback events are streamed to clients with Server-Sent Events.
+#
+#   POST   /sessions                 -> {"id": ...}
+#   GET    /sessions                 -> [{"id", "busy", "queued", "messages"}]
+#   DELETE /sessions/<id>
+#   POST   /sessions/<id>/messages   {"message": "..."} -> 202, or 429 if the queue is full
+#   POST   /sessions/<id>/cancel
+#   GET    /sessions/<id>/events     -> text/event-stream of callback events
+#   GET    /metrics                  -> model call metrics (Prometheus text format)
+#   GET    /metrics.json             -> the same as JSON
+#
+# Every request needs the token printed at startup, as an
+# "Authorization: Bearer <token>" header or a ?token= parameter (for
+# EventSource, which can't set headers). Requests must be addressed to the
+# server itself (Host header) and may only come from its own origin, so a web
+# page can't reach it through DNS rebinding, and request bodies must be JSON.
+#
+# Run from src/: python server.py [--port 8765] [--fake]
+
+import argparse
+import asyncio
+import hmac
+import json
+import os
+import secrets
+import sys
+import uuid
+from collections import deque
+from urllib.parse import parse_qs, urlsplit
+from actions import client
+from async_jasper import AsyncJasper
+from pypool import PythonPool
+from transport import ModelTransport
+
+REASONS = {200: "OK", 202: "Accepted", 204: "No Content", 400: "Bad Request", 401: "Unauthorized", 403: "Forbidden", 404: "Not Found", 405: "Method Not Allowed", 415: "Unsupported Media Type", 429: "Too Many Requests"}
+
+
+class Session:
+    def __init__(self, session_id, jasper, max_queue, backlog):
+        self.id = session_id
+        self.jasper = jasper
+        self.max_queue = max_queue
+        self.queued = 0
+        self.subscribers = set()
+        # Recent events, replayed to clients that connect late.
+        self.backlog = deque(maxlen=backlog)
+        self.loop = asyncio.get_running_loop()
+        self.jasper.callback = self.emit
+        self.runner = asyncio.create_task(jasper.serve())
+
+    def emit(self, info):
+        # Called from the event loop and from tool threads.
+        self.loop.call_soon_threadsafe(self._publish, info)
+
+    def _publish(self, info):
+        self.backlog.append(info)
+        for subscriber in self.subscribers:
+            subscriber.put_nowait(info)
+
+    def submit(self, message):
+        if self.queued >= self.max_queue:
+            return False
+        self.queued += 1
+        future = self.jasper.submit(message)
+        future.add_done_callback(self._finished)
+        return True
+
+    def _finished(self, future):
+        self.queued -= 1
+        self._publish({"done": True, "cancelled": future.cancelled()})
+
+    def describe(self):
+        return {"id": self.id, "busy": self.jasper.busy, "queued": self.queued, "messages": len(self.jasper.messages)}
+
+    def close(self):
+        self.jasper.cancel()
+        self.runner.cancel()
+        self.closing = asyncio.create_task(self._close_jasper())
+        # Ends the event streams.
+        for subscriber in self.subscribers:
+            subscriber.put_nowait(None)
+
+    async def _close_jasper(self):
+        # Closes the session journal once the cancelled turn has unwound.
+        await asyncio.wait([task for task in (self.runner, self.jasper.turn) if task is not None])
+        self.jasper.close()
+
+
+class JasperServer:
+    def __init__(self, model_client, max_sessions: int = 32, max_queue: int = 4, max_model_calls: int = 8, backlog: int = 100, token: str = None):
+        self.max_sessions = max_sessions
+        self.max_queue = max_queue
+        self.max_model_calls = max_model_calls
+        self.backlog = backlog
+        self.sessions = {}
+        self.model_client = model_client
+        # Shared by every session, so at most max_model_calls model calls run
+        # at once and metrics cover the whole server.
+        self.transport = ModelTransport(model_client, concurrency = max_model_calls)
+        self.python_pool = None
+        # New for each run unless given.
+        self.token = token or secrets.token_urlsafe(24)
+        # host:port values clients may address the server by; set by start().
+        self.hosts = set()
+
+    def _shared_pool(self):
+        if self.python_pool is None:
+            workers = int(os.getenv("JASPER_PY_WORKERS") or 2)
+            self.python_pool = PythonPool(size = workers) if workers > 0 else None
+        return self.python_pool
+
+    async def _send(self, writer, status, body=None):
+        payload = b"" if body is None else json.dumps(body).encode()
+        head = f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\nContent-Length: {len(payload)}\r\nContent-Type: application/json\r\nConnection: close\r\n\r\n"
+        writer.write(head.encode() + payload)
+        await writer.drain()
+
+    async def _send_text(self, writer, status, text, content_type="text/plain; version=0.0.4"):
+        payload = text.encode()
+        head = f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\nContent-Length: {len(payload)}\r\nContent-Type: {content_type}\r\nConnection: close\r\n\r\n"
+        writer.write(head.encode() + payload)
+        await writer.drain()
+
+    async def _events(self, writer, session):
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\nConnection: close\r\n\r\n")
+        queue = asyncio.Queue()
+        for info in session.backlog:
+            queue.put_nowait(info)
+        session.subscribers.add(queue)
+        try:
+            while (info := await queue.get()) is not None:
+                writer.write(f"data: {json.dumps(info, default=str)}\n\n".encode())
+                await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            session.subscribers.discard(queue)
+
+    async def handle(self, reader, writer):
+        try:
+            request = (await reader.readline()).decode().split()
+            headers = {}
+            while (line := (await reader.readline()).decode().strip()):
+                key, _, value = line.partition(":")
+                headers[key.strip().lower()] = value.strip()
+            body = await reader.readexactly(int(headers.get("content-length") or 0))
+            if len(request) < 2:
+                return await self._send(writer, 400, {"error": "Bad request."})
+            url = urlsplit(request[1])
+            host = headers.get("host")
+            # Browsers send an Origin with cross-site requests.
+            if host not in self.hosts or headers.get("origin", f"http://{host}") != f"http://{host}":
+                return await self._send(writer, 403, {"error": "Forbidden."})
+            if not self._authorized(headers, url.query):
+                return await self._send(writer, 401, {"error": "Missing or wrong token."})
+            if body and headers.get("content-type", "").split(";")[0].strip() != "application/json":
+                return await self._send(writer, 415, {"error": "Expected a JSON body."})
+            await self.route(writer, request[0], url.path.rstrip("/").split("/")[1:], body)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    def _authorized(self, headers, query):
+        scheme, _, token = headers.get("authorization", "").partition(" ")
+        if scheme.lower() != "bearer":
+            token = (parse_qs(query).get("token") or [""])[0]
+        return hmac.compare_digest(token.encode(), self.token.encode())
+
+    async def route(self, writer, method, path, body):
+        if path == ["metrics"] and method == "GET":
+            return await self._send_text(writer, 200, self.transport.metrics.prometheus())
+        if path == ["metrics.json"] and method == "GET":
+            return await self._send(writer, 200, self.transport.metrics.snapshot())
+        if path == ["sessions"]:
+            if method == "GET":
+                return await self._send(writer, 200, [session.describe() for session in self.sessions.values()])
+            if method == "POST":
+                if len(self.sessions) >= self.max_sessions:
+                    return await self._send(writer, 429, {"error": "Too many sessions."})
+                session_id = uuid.uuid4().hex[:12]
+                jasper = AsyncJasper(self.model_client, python_pool = self._shared_pool(), transport = self.transport)
+                self.sessions[session_id] = Session(session_id, jasper, self.max_queue, self.backlog)
+                return await self._send(writer, 200, {"id": session_id})
+            return await self._send(writer, 405, {"error": "Method not allowed."})
+
+        if len(path) < 2 or path[0] != "sessions" or path[1] not in self.sessions:
+            return await self._send(writer, 404, {"error": "No such session."})
+        session = self.sessions[path[1]]
+        action = path[2] if len(path) > 2 else None
+
+        if action is None and method == "DELETE":
+            self.sessions.pop(session.id).close()
+            return await self._send(writer, 204)
+        if action is None and method == "GET":
+            return await self._send(writer, 200, session.describe())
+        if action == "messages" and method == "POST":
+            try:
+                message = json.loads(body)["message"]
+            except (ValueError, KeyError, TypeError):
+                return await self._send(writer, 400, {"error": "Expected {\"message\": ...}."})
+            if not session.submit(message):
+                return await self._send(writer, 429, {"error": "Too many queued messages."})
+            return await self._send(writer, 202, {"queued": session.queued})
+        if action == "cancel" and method == "POST":
+            session.jasper.cancel()
+            return await self._send(writer, 202, {})
+        if action == "events" and method == "GET":
+            return await self._events(writer, session)
+        return await self._send(writer, 404, {"error": "Not found."})
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8765):
+        listener = await asyncio.start_server(self.handle, host, port)
+        port = listener.sockets[0].getsockname()[1]
+        self.hosts = {f"{name}:{port}" for name in ("127.0.0.1", "localhost", "[::1]", host)}
+        return listener
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--max-sessions", type=int, default=32)
+    parser.add_argument("--max-queue", type=int, default=4)
+    parser.add_argument("--max-model-calls", type=int, default=8)
+    parser.add_argument("--fake", action="store_true", help="Use a stub model instead of the Gemini API.")
+    args = parser.parse_args()
+
+    model_client = client
+    if args.fake:
+        # The stub client lives with the tests.
+        sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tests"))
+        from fake_genai import FakeClient
+        model_client = FakeClient()
+
+    server = JasperServer(model_client, args.max_sessions, args.max_queue, args.max_model_calls)
+    listener = await server.start(args.host, args.port)
+    print(f"[+] Jasper server listening on http://{args.host}:{args.port}")
+    print(f"[+] Token: {server.token}")
+    async with listener:
+        await listener.serve_forever()
+
+if __name__ == "__main__":
+    asyncio.run(main())
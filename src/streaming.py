@@ -0,0 +1,63 @@
+FENCE = "```"
+EXECUTE_FENCE = "```execute:"
+
+
+class StreamParser:
+    # Incremental version of Jasper._process_output / Jasper._strip_codeblocks.
+    # Text is fed in as it arrives from the model; feed() returns a list of
+    # ("message", text) and ("execute", (lang, code)) events. Prose is only
+    # released a full line at a time so a half-written fence is never shown.
+
+    def __init__(self, commands: bool = True):
+        # With commands=False execute fences are left in the prose, for
+        # function calling, where commands come as function calls instead.
+        self.commands = commands
+        self.buffer = ""
+        self.lang = None
+
+    def feed(self, text):
+        self.buffer += text
+        events = []
+        while True:
+            if self.lang is None:
+                start = self.buffer.find(EXECUTE_FENCE) if self.commands else -1
+                if start == -1:
+                    cut = self.buffer.rfind("\n")
+                    if cut != -1:
+                        self._message(events, self.buffer[:cut + 1])
+                        self.buffer = self.buffer[cut + 1:]
+                    break
+                self._message(events, self.buffer[:start])
+                self.buffer = self.buffer[start:]
+                header_end = self.buffer.find("\n")
+                if header_end == -1:
+                    break
+                if header_end == len(EXECUTE_FENCE):
+                    self._message(events, self.buffer[:header_end + 1])
+                    self.buffer = self.buffer[header_end + 1:]
+                    continue
+                self.lang = self.buffer[len(EXECUTE_FENCE):header_end]
+                self.buffer = self.buffer[header_end + 1:]
+            else:
+                end = self.buffer.find(FENCE)
+                if end == -1:
+                    break
+                events.append(("execute", (self.lang, self.buffer[:end])))
+                self.buffer = self.buffer[end + len(FENCE):]
+                self.lang = None
+        return events
+
+    def close(self):
+        # An unterminated block is not a command, same as the regex path.
+        events = []
+        if self.lang is not None:
+            self.buffer = f"{EXECUTE_FENCE}{self.lang}\n{self.buffer}"
+            self.lang = None
+        self._message(events, self.buffer)
+        self.buffer = ""
+        return events
+
+    def _message(self, events, text):
+        text = text.strip()
+        if text:
+            events.append(("message", text))
@@ -0,0 +1,151 @@
+# Jasper's commands as Gemini function declarations, for function calling
+# instead of execute codeblocks (JASPER_FUNCTION_CALLING=1). Function calls are
+# turned into the same (lang, code) commands the codeblocks give, so both run
+# through Jasper._execute_code and the scheduler.
+
+import inspect
+from lazy import LazyModule
+
+types = LazyModule("google.genai.types")
+
+MEMORY_ACTIONS = ["store", "fetch", "search"]
+READONLY = {"type": "BOOLEAN", "description": "Set if the code only reads and changes nothing, so its output can be reused for a few minutes."}
+
+
+def _schema(properties, required=()):
+    return types.Schema(
+        type = "OBJECT",
+        properties = {name: types.Schema(**spec) for name, spec in properties.items()},
+        required = list(required),
+    )
+
+def declarations(overrides: dict = None):
+    functions = [
+        types.FunctionDeclaration(
+            name = "sh",
+            description = "Runs a shell command or multiline script and returns its output.",
+            parameters = _schema({"command": {"type": "STRING"}, "readonly": READONLY}, ["command"]),
+        ),
+        types.FunctionDeclaration(
+            name = "py",
+            description = "Runs Python code and returns what it prints.",
+            parameters = _schema({"code": {"type": "STRING"}, "readonly": READONLY}, ["code"]),
+        ),
+        types.FunctionDeclaration(
+            name = "search",
+            description = "Searches the web.",
+            parameters = _schema({
+                "query": {"type": "STRING"},
+                "fetch": {"type": "BOOLEAN", "description": "Also return the text of the top few result pages."},
+            }, ["query"]),
+        ),
+        types.FunctionDeclaration(
+            name = "analyse",
+            description = "Attaches a file for you to view, listen to or watch. Large text files are shown as their first and last parts; give offset and length to read another part, or grep to find matching lines.",
+            parameters = _schema({
+                "path": {"type": "STRING"},
+                "mimetype": {"type": "STRING"},
+                "offset": {"type": "INTEGER", "description": "Byte offset to read from (text/plain only)."},
+                "length": {"type": "INTEGER", "description": "Bytes to read from offset."},
+                "grep": {"type": "STRING", "description": "Regular expression; returns matching lines with line numbers (text/plain only)."},
+            }, ["path", "mimetype"]),
+        ),
+        types.FunctionDeclaration(
+            name = "memory",
+            description = "Your persistent memory, a nested dictionary addressed by dotted paths such as user.age. store sets path to value; fetch returns path, or all of memory without one; search finds entries related to query.",
+            parameters = _schema({
+                "action": {"type": "STRING", "enum": MEMORY_ACTIONS},
+                "path": {"type": "STRING"},
+                "value": {"type": "STRING"},
+                "query": {"type": "STRING"},
+            }, ["action"]),
+        ),
+    ]
+    for name, handler in ((overrides or {}).get("execute") or {}).items():
+        functions.append(types.FunctionDeclaration(
+            name = name,
+            description = inspect.getdoc(handler) or f"Runs the {name} command described in your instructions.",
+            parameters = _schema({"input": {"type": "STRING"}}, ["input"]),
+        ))
+    return functions
+
+def tool(overrides: dict = None):
+    return types.Tool(function_declarations = declarations(overrides))
+
+
+def command(call):
+    # The (lang, code) command for a function call.
+    args = dict(call.args or {})
+    name = call.name
+    readonly = ":readonly" if args.get("readonly") else ""
+    if name == "sh":
+        return f"sh{readonly}", str(args.get("command", ""))
+    if name == "py":
+        return f"py{readonly}", str(args.get("code", ""))
+    if name == "search":
+        return "search:fetch" if args.get("fetch") else "search", str(args.get("query", ""))
+    if name == "analyse":
+        lang = f"analyse:{args.get('mimetype', '')}"
+        path = str(args.get("path", ""))
+        if args.get("grep"):
+            return f"{lang}:grep", f"{path}\n{args['grep']}"
+        if args.get("offset") is not None and args.get("length") is not None:
+            return f"{lang}:{int(args['offset'])}:{int(args['length'])}", path
+        return lang, path
+    if name == "memory":
+        action = args.get("action")
+        if action == "search":
+            return "memory:search", str(args.get("query") or args.get("path") or "")
+        if action == "fetch":
+            return ("memory:fetch:" + args["path"]) if args.get("path") else "memory:fetch", ""
+        if action == "store":
+            return f"memory:store:{args.get('path', '')}", str(args.get("value", ""))
+        return f"memory:{action}", ""
+    return name, str(args.get("input", ""))
+
+def response_part(call, output):
+    return types.Part(function_response = types.FunctionResponse(
+        id = call.id,
+        name = call.name,
+        response = {"output": output},
+    ))
+
+
+class Reply:
+    # Collects a model reply from a response or from stream chunks: its text,
+    # its function calls, and the parts to keep in the history. The parts are
+    # kept as sent, so thought signatures go back to the model unchanged.
+
+    def __init__(self):
+        self.parts = []
+        self.calls = []
+
+    @property
+    def text(self):
+        return "".join(part.text for part in self.parts if part.text and not part.thought)
+
+    def add(self, response):
+        # Returns the text and function calls in `response`.
+        text = ""
+        calls = []
+        candidates = response.candidates or []
+        for part in (candidates[0].content.parts or []) if candidates and candidates[0].content else []:
+            if part.function_call:
+                calls.append(part.function_call)
+                self.parts.append(part)
+            elif part.text is not None:
+                if not part.thought:
+                    text += part.text
+                last = self.parts[-1] if self.parts else None
+                if last is not None and last.text is not None and not last.function_call and bool(last.thought) == bool(part.thought) and not part.thought_signature:
+                    # Stream chunks split the text; keep it as one part.
+                    self.parts[-1] = last.model_copy(update = {"text": last.text + part.text})
+                else:
+                    self.parts.append(part)
+            else:
+                self.parts.append(part)
+        self.calls.extend(calls)
+        return text, calls
+
+    def content(self):
+        return types.Content(role = "model", parts = self.parts or [types.Part(text = "")])
@@ -0,0 +1,245 @@
+# Spans for turns, model calls, executed blocks and memory operations, with
+# wall time and attributes such as payload bytes and token counts.
+#
+# Finished spans go to a JSONL file (JASPER_TRACE) and/or an OpenTelemetry
+# collector over OTLP/HTTP JSON (JASPER_OTLP_ENDPOINT, e.g.
+# http://localhost:4318). JASPER_PROFILE=cprofile or pyinstrument also
+# profiles each turn and saves the profile next to the trace.
+
+import contextvars
+import json
+import os
+import secrets
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager
+
+PROFILE_DIR = "profiles"
+
+_current = contextvars.ContextVar("jasper_span", default=None)
+
+
+class Span:
+    def __init__(self, name, trace_id, parent_id=None, attributes=None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.attributes = dict(attributes or {})
+        self.start_ns = time.time_ns()
+        self.started = time.perf_counter()
+        self.end_ns = None
+        self.duration = None
+        self.error = None
+
+    def set(self, **attributes):
+        self.attributes.update({key: value for key, value in attributes.items() if value is not None})
+
+    def finish(self, error=None):
+        self.duration = time.perf_counter() - self.started
+        self.end_ns = self.start_ns + int(self.duration * 1e9)
+        if error is not None:
+            self.error = f"{type(error).__name__}: {error}"
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start": self.start_ns / 1e9,
+            "duration": self.duration,
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+class JsonlExporter:
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+
+    def export(self, spans):
+        with self.lock, open(self.path, "a") as f:
+            for span in spans:
+                f.write(json.dumps(span.to_dict(), default=str) + "\n")
+
+    def flush(self):
+        pass
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class OtlpExporter:
+    # Sends spans to an OpenTelemetry collector as OTLP/HTTP JSON, in batches
+    # on a background thread so turns never wait for the collector.
+
+    def __init__(self, endpoint, service_name: str = "jasper", timeout: float = 5):
+        self.url = endpoint.rstrip("/") + ("" if endpoint.rstrip("/").endswith("/v1/traces") else "/v1/traces")
+        self.service_name = service_name
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.pending = []
+
+    def export(self, spans):
+        with self.lock:
+            self.pending.extend(spans)
+
+    def payload(self, spans):
+        return {"resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": self.service_name}}]},
+            "scopeSpans": [{
+                "scope": {"name": "jasper"},
+                "spans": [{
+                    "traceId": span.trace_id,
+                    "spanId": span.span_id,
+                    **({"parentSpanId": span.parent_id} if span.parent_id else {}),
+                    "name": span.name,
+                    "kind": 1,
+                    "startTimeUnixNano": str(span.start_ns),
+                    "endTimeUnixNano": str(span.end_ns),
+                    "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in span.attributes.items()],
+                    "status": {"code": 2, "message": span.error} if span.error else {"code": 1},
+                } for span in spans],
+            }],
+        }]}
+
+    def _send(self, spans):
+        request = urllib.request.Request(
+            self.url,
+            data = json.dumps(self.payload(spans)).encode(),
+            headers = {"Content-Type": "application/json"},
+            method = "POST",
+        )
+        try:
+            urllib.request.urlopen(request, timeout=self.timeout).close()
+        except OSError:
+            # A missing collector should not break Jasper.
+            pass
+
+    def flush(self):
+        with self.lock:
+            spans, self.pending = self.pending, []
+        if spans:
+            threading.Thread(target=self._send, args=(spans,), daemon=True).start()
+
+
+class Profiler:
+    # Profiles one turn with cProfile or pyinstrument. Both only see the
+    # thread the turn runs on, not tool threads or worker processes.
+
+    def __init__(self, kind, directory: str = PROFILE_DIR):
+        self.kind = kind
+        self.directory = directory
+        self.profiler = None
+
+    def start(self):
+        if self.kind == "pyinstrument":
+            try:
+                from pyinstrument import Profiler as Pyinstrument
+                self.profiler = Pyinstrument(async_mode="enabled")
+            except ImportError:
+                print("[+] pyinstrument is not installed; profiling with cProfile instead.")
+                self.kind = "cprofile"
+        if self.kind != "pyinstrument":
+            import cProfile
+            self.profiler = cProfile.Profile()
+        self.profiler.start() if self.kind == "pyinstrument" else self.profiler.enable()
+
+    def stop(self, name):
+        # Saves the profile and returns its path.
+        os.makedirs(self.directory, exist_ok=True)
+        if self.kind == "pyinstrument":
+            self.profiler.stop()
+            path = os.path.join(self.directory, f"{name}.html")
+            with open(path, "w") as f:
+                f.write(self.profiler.output_html())
+        else:
+            self.profiler.disable()
+            path = os.path.join(self.directory, f"{name}.prof")
+            self.profiler.dump_stats(path)
+        return path
+
+
+class Tracer:
+    # Spans opened on other threads (the scheduler's tool threads) without a
+    # current span are attached to the turn being traced.
+
+    def __init__(self, exporters=None, callback=None, profile: str = None):
+        self.exporters = list(exporters or [])
+        self.callback = callback
+        self.profile = profile
+        self.turn_span = None
+        self.lock = threading.Lock()
+        self.finished = []
+
+    @classmethod
+    def from_env(cls, callback=None):
+        exporters = []
+        if trace := os.getenv("JASPER_TRACE"):
+            exporters.append(JsonlExporter("traces.jsonl" if trace == "1" else trace))
+        if endpoint := os.getenv("JASPER_OTLP_ENDPOINT"):
+            exporters.append(OtlpExporter(endpoint))
+        return cls(exporters, callback, (os.getenv("JASPER_PROFILE") or "").lower() or None)
+
+    @property
+    def enabled(self):
+        return bool(self.exporters or self.profile)
+
+    @contextmanager
+    def span(self, name, **attributes):
+        parent = _current.get() or self.turn_span
+        span = Span(name, parent.trace_id if parent else secrets.token_hex(16), parent.span_id if parent else None, attributes)
+        token = _current.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.finish(e)
+            raise
+        else:
+            span.finish()
+        finally:
+            _current.reset(token)
+            self._finished(span)
+
+    @contextmanager
+    def turn(self, **attributes):
+        # The root span of a turn. Spans are exported when the turn ends.
+        profiler = Profiler(self.profile) if self.profile else None
+        try:
+            with self.span("turn", **attributes) as span:
+                self.turn_span = span
+                if profiler:
+                    profiler.start()
+                try:
+                    yield span
+                finally:
+                    if profiler:
+                        span.set(profile = profiler.stop(f"turn-{span.trace_id}"))
+                    self.turn_span = None
+        finally:
+            self.flush()
+
+    def _finished(self, span):
+        if self.exporters:
+            with self.lock:
+                self.finished.append(span)
+        if self.enabled and self.callback:
+            self.callback({"span": span.to_dict()})
+
+    def flush(self):
+        with self.lock:
+            spans, self.finished = self.finished, []
+        for exporter in self.exporters:
+            if spans:
+                exporter.export(spans)
+            exporter.flush()
@@ -0,0 +1,228 @@
+# Output pane of the GUI. Messages are kept in a list model with a row limit
+# and shown in a QListView, so only the rows on screen are laid out and
+# painted. Each row's Markdown is rendered the first time the row is drawn;
+# rows that have not been drawn yet get an estimated height. Events from
+# Jasper are queued and applied together, at most once per frame.
+
+import math
+import os
+from collections import OrderedDict
+
+from PyQt5.QtCore import QAbstractListModel, QModelIndex, QObject, QRectF, QSize, Qt, QTimer
+from PyQt5.QtGui import QAbstractTextDocumentLayout, QKeySequence, QPalette, QTextDocument
+from PyQt5.QtWidgets import QAbstractItemView, QApplication, QListView, QStyle, QStyledItemDelegate
+
+MAX_ROWS = int(os.getenv("JASPER_TRANSCRIPT_ROWS") or 5000)
+FRAME_MS = 16
+PADDING = 5
+
+ID_ROLE = Qt.UserRole
+KIND_ROLE = Qt.UserRole + 1
+
+
+class FrameBatcher(QObject):
+    # Collects items and passes them to `flush` in one list, at most once per
+    # frame, however many arrive in between.
+
+    def __init__(self, flush, interval: int = FRAME_MS, parent=None):
+        super().__init__(parent)
+        self.flush = flush
+        self.pending = []
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(interval)
+        self.timer.timeout.connect(self._flush)
+
+    def add(self, item):
+        self.pending.append(item)
+        if not self.timer.isActive():
+            self.timer.start()
+
+    def _flush(self):
+        items, self.pending = self.pending, []
+        if items:
+            self.flush(items)
+
+
+class TranscriptModel(QAbstractListModel):
+    # Rows are (id, kind, text), where kind is "user", "message" or "status".
+    # Past `max_rows` the oldest rows are dropped, a tenth at a time so the
+    # view is not laid out again on every append. Ids never repeat, so the
+    # delegate can cache by id while rows are removed from the top.
+
+    def __init__(self, max_rows: int = MAX_ROWS, parent=None):
+        super().__init__(parent)
+        self.max_rows = max_rows
+        self.rows = []
+        self.next_id = 0
+        self.dropped = 0
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row_id, kind, text = self.rows[index.row()]
+        if role == Qt.DisplayRole:
+            return text
+        if role == ID_ROLE:
+            return row_id
+        if role == KIND_ROLE:
+            return kind
+        return None
+
+    def first_id(self):
+        return self.rows[0][0] if self.rows else self.next_id
+
+    def extend(self, rows):
+        # Appends (kind, text) pairs with a single insert.
+        rows = rows[-self.max_rows:]
+        if not rows:
+            return
+        overflow = len(self.rows) + len(rows) - self.max_rows
+        if overflow > 0:
+            overflow = min(max(overflow, self.max_rows // 10), len(self.rows))
+            self.beginRemoveRows(QModelIndex(), 0, overflow - 1)
+            del self.rows[:overflow]
+            self.dropped += overflow
+            self.endRemoveRows()
+        first = len(self.rows)
+        self.beginInsertRows(QModelIndex(), first, first + len(rows) - 1)
+        for kind, text in rows:
+            self.rows.append((self.next_id, kind, text))
+            self.next_id += 1
+        self.endInsertRows()
+
+
+class MarkdownDelegate(QStyledItemDelegate):
+    # Renders rows as Markdown with QTextDocument. Documents are built when a
+    # row is painted and kept for the most recently painted `cache_size` rows.
+
+    def __init__(self, view, cache_size: int = 300):
+        super().__init__(view)
+        self.view = view
+        self.cache_size = cache_size
+        self.documents = OrderedDict()
+        # Measured heights by row id, as (width, height).
+        self.heights = {}
+
+    def _width(self, option):
+        width = option.rect.width() if option.rect.isValid() else self.view.viewport().width()
+        return max(width - 2 * PADDING, 50)
+
+    def _document(self, index, width):
+        row_id = index.data(ID_ROLE)
+        document = self.documents.get(row_id)
+        if document is None:
+            document = QTextDocument()
+            document.setDocumentMargin(0)
+            font = self.view.font()
+            kind = index.data(KIND_ROLE)
+            text = index.data(Qt.DisplayRole)
+            if kind == "status":
+                font.setItalic(True)
+            document.setDefaultFont(font)
+            if kind == "message" and hasattr(document, "setMarkdown"):
+                document.setMarkdown(text)
+            else:
+                document.setPlainText(text)
+            self.documents[row_id] = document
+            if len(self.documents) > self.cache_size:
+                self.documents.popitem(last=False)
+        else:
+            self.documents.move_to_end(row_id)
+        if document.textWidth() != width:
+            document.setTextWidth(width)
+        return document
+
+    def _estimate(self, text, width):
+        # Height of `text` wrapped at `width`, without laying it out.
+        metrics = self.view.fontMetrics()
+        per_line = max(int(width / max(metrics.averageCharWidth(), 1)), 1)
+        lines = sum(max(math.ceil(len(line) / per_line), 1) for line in text.split("\n"))
+        return lines * metrics.lineSpacing()
+
+    def sizeHint(self, option, index):
+        width = self._width(option)
+        measured = self.heights.get(index.data(ID_ROLE))
+        if measured and measured[0] == width:
+            height = measured[1]
+        else:
+            height = self._estimate(index.data(Qt.DisplayRole), width)
+        return QSize(width + 2 * PADDING, math.ceil(height) + 2 * PADDING)
+
+    def paint(self, painter, option, index):
+        width = self._width(option)
+        document = self._document(index, width)
+        height = document.size().height()
+        row_id = index.data(ID_ROLE)
+        if self.heights.get(row_id) != (width, height):
+            self.heights[row_id] = (width, height)
+            # The estimate was off; lay the view out again with the real height.
+            self.sizeHintChanged.emit(index)
+
+        painter.save()
+        selected = option.state & QStyle.State_Selected
+        if selected:
+            painter.fillRect(option.rect, option.palette.highlight())
+        painter.translate(option.rect.left() + PADDING, option.rect.top() + PADDING)
+        context = QAbstractTextDocumentLayout.PaintContext()
+        context.clip = QRectF(0, 0, width, option.rect.height())
+        if selected:
+            color = option.palette.color(QPalette.HighlightedText)
+        elif index.data(KIND_ROLE) == "status":
+            color = option.palette.color(QPalette.Disabled, QPalette.Text)
+        else:
+            color = option.palette.color(QPalette.Text)
+        context.palette.setColor(QPalette.Text, color)
+        painter.setClipRect(context.clip)
+        document.documentLayout().draw(painter, context)
+        painter.restore()
+
+    def forget(self, first_id):
+        # Drops cached heights and documents of rows before `first_id`.
+        self.heights = {row_id: height for row_id, height in self.heights.items() if row_id >= first_id}
+        for row_id in [row_id for row_id in self.documents if row_id < first_id]:
+            del self.documents[row_id]
+
+
+class TranscriptView(QListView):
+    def __init__(self, max_rows: int = MAX_ROWS, parent=None):
+        super().__init__(parent)
+        self.transcript = TranscriptModel(max_rows, self)
+        self.setModel(self.transcript)
+        self.delegate = MarkdownDelegate(self)
+        self.setItemDelegate(self.delegate)
+        self.transcript.rowsRemoved.connect(lambda *_: self.delegate.forget(self.transcript.first_id()))
+
+        self.setVerticalScrollMode(QAbstractItemView.ScrollPerPixel)
+        self.setHorizontalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
+        self.setSelectionMode(QAbstractItemView.ExtendedSelection)
+        self.setResizeMode(QListView.Adjust)
+        self.setWordWrap(True)
+        # Lays out long transcripts a batch at a time instead of all at once.
+        self.setLayoutMode(QListView.Batched)
+        self.setBatchSize(200)
+
+    def at_bottom(self):
+        scrollbar = self.verticalScrollBar()
+        return scrollbar.value() >= scrollbar.maximum() - 4
+
+    def extend(self, rows):
+        # Appends (kind, text) pairs, following the end of the transcript
+        # unless the user has scrolled up.
+        follow = self.at_bottom()
+        self.transcript.extend(rows)
+        if follow:
+            self.scrollToBottom()
+
+    def append(self, text, kind: str = "message"):
+        self.extend([(kind, text)])
+
+    def keyPressEvent(self, event):
+        if event.matches(QKeySequence.Copy):
+            rows = sorted(self.selectionModel().selectedRows(), key=lambda index: index.row())
+            QApplication.clipboard().setText("\n\n".join(index.data(Qt.DisplayRole) for index in rows))
+            return
+        super().keyPressEvent(event)
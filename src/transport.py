@@ -0,0 +1,405 @@
+# Model calls with retries, a concurrency limit, a circuit breaker and an
+# optional fallback model, recording latency and token usage for each call.
+#
+# Transient errors (429, 5xx, dropped connections) are retried with
+# exponential backoff and full jitter, waiting at least as long as the server
+# asks for. Streams are only retried until their first chunk has arrived.
+# After `failure_threshold` consecutive failed calls the circuit opens and
+# calls fail immediately (or go to the fallback model) for `reset_timeout`
+# seconds, after which one trial call is let through.
+
+import asyncio
+import os
+import random
+import re
+import threading
+import time
+
+RETRYABLE_CODES = {408, 429, 500, 502, 503, 504}
+
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+TOKEN_BUCKETS = (100, 500, 1000, 5000, 10_000, 50_000, 100_000, 500_000, 1_000_000)
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+def is_retryable(error):
+    code = getattr(error, "code", None)
+    if isinstance(code, int):
+        return code in RETRYABLE_CODES
+    return isinstance(error, (ConnectionError, TimeoutError)) or type(error).__module__.startswith(("httpx", "httpcore", "aiohttp"))
+
+def retry_after(error):
+    # Seconds the server asked us to wait, from a Retry-After header or the
+    # RetryInfo detail Gemini includes with 429 responses.
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except (TypeError, ValueError):
+        pass
+    details = getattr(error, "details", None)
+    if isinstance(details, dict):
+        for detail in (details.get("error") or {}).get("details") or []:
+            if isinstance(detail, dict) and (match := re.fullmatch(r"([\d.]+)s", str(detail.get("retryDelay", "")))):
+                return float(match.group(1))
+    return None
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                return
+        self.counts[-1] += 1
+
+    def quantile(self, q):
+        # Upper bound of the bucket the q-th observation falls in.
+        if not self.count:
+            return 0.0
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= q * self.count:
+                return bound
+        return float("inf")
+
+    def snapshot(self):
+        return {"count": self.count, "sum": self.sum, "p50": self.quantile(0.5), "p95": self.quantile(0.95)}
+
+
+class Metrics:
+    # Per-model call metrics, shared by every transport by default.
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latency = {}
+        self.prompt_tokens = {}
+        self.output_tokens = {}
+        self.counters = {}
+
+    def count(self, name, model, n=1):
+        with self.lock:
+            self.counters[(name, model)] = self.counters.get((name, model), 0) + n
+
+    def observe_call(self, model, seconds, prompt_tokens, output_tokens):
+        with self.lock:
+            self.latency.setdefault(model, Histogram(LATENCY_BUCKETS)).observe(seconds)
+            if prompt_tokens is not None:
+                self.prompt_tokens.setdefault(model, Histogram(TOKEN_BUCKETS)).observe(prompt_tokens)
+            if output_tokens is not None:
+                self.output_tokens.setdefault(model, Histogram(TOKEN_BUCKETS)).observe(output_tokens)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "latency_seconds": {model: h.snapshot() for model, h in self.latency.items()},
+                "prompt_tokens": {model: h.snapshot() for model, h in self.prompt_tokens.items()},
+                "output_tokens": {model: h.snapshot() for model, h in self.output_tokens.items()},
+                "counters": {f"{name}{{{model}}}": n for (name, model), n in self.counters.items()},
+            }
+
+    def prometheus(self):
+        # Prometheus text exposition format.
+        lines = []
+        with self.lock:
+            for name, histograms in (
+                ("jasper_model_latency_seconds", self.latency),
+                ("jasper_model_prompt_tokens", self.prompt_tokens),
+                ("jasper_model_output_tokens", self.output_tokens),
+            ):
+                lines.append(f"# TYPE {name} histogram")
+                for model, h in histograms.items():
+                    cumulative = 0
+                    for bound, count in zip(h.buckets, h.counts):
+                        cumulative += count
+                        lines.append(f'{name}_bucket{{model="{model}",le="{bound}"}} {cumulative}')
+                    lines.append(f'{name}_bucket{{model="{model}",le="+Inf"}} {h.count}')
+                    lines.append(f'{name}_sum{{model="{model}"}} {h.sum}')
+                    lines.append(f'{name}_count{{model="{model}"}} {h.count}')
+            names = sorted({name for name, _ in self.counters})
+            for name in names:
+                lines.append(f"# TYPE jasper_model_{name}_total counter")
+                for (counter, model), n in self.counters.items():
+                    if counter == name:
+                        lines.append(f'jasper_model_{name}_total{{model="{model}"}} {n}')
+        return "\n".join(lines) + "\n"
+
+METRICS = Metrics()
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.lock = threading.Lock()
+        self.failures = 0
+        self.opened = None
+        self.trial = False
+
+    @property
+    def state(self):
+        if self.opened is None:
+            return "closed"
+        return "half-open" if time.monotonic() - self.opened >= self.reset_timeout else "open"
+
+    def allow(self):
+        with self.lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half-open" and not self.trial:
+                self.trial = True
+                return True
+            return False
+
+    def success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened = None
+            self.trial = False
+
+    def failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.trial or self.failures >= self.failure_threshold:
+                self.opened = time.monotonic()
+            self.trial = False
+
+
+def _usage(response):
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return None, None
+    return usage.prompt_token_count, usage.candidates_token_count
+
+
+class ModelTransport:
+    # Wraps client.models and client.aio.models. One transport can be shared
+    # by several Jasper instances, which then share its limit and breakers.
+
+    def __init__(self, client, fallback_model: str = None, max_attempts: int = None, base_delay: float = 1.0, max_delay: float = 30.0, concurrency: int = None, failure_threshold: int = 5, reset_timeout: float = 30, metrics: Metrics = None):
+        self.client = client
+        self.fallback_model = fallback_model if fallback_model is not None else os.getenv("GEMINI_FALLBACK_MODEL")
+        self.max_attempts = max_attempts or int(os.getenv("JASPER_MODEL_RETRIES") or 4)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.concurrency = concurrency or int(os.getenv("JASPER_MODEL_CONCURRENCY") or 4)
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.metrics = metrics or METRICS
+        self.semaphore = threading.BoundedSemaphore(self.concurrency)
+        self.async_semaphore = None
+        self.breakers = {}
+        self.lock = threading.Lock()
+
+    def _breaker(self, model):
+        with self.lock:
+            if model not in self.breakers:
+                self.breakers[model] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+            return self.breakers[model]
+
+    def _delay(self, attempt, error):
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        return max(delay, retry_after(error) or 0)
+
+    def _models(self, model):
+        # The primary model, then the fallback if there is one.
+        return [model] + ([self.fallback_model] if self.fallback_model and self.fallback_model != model else [])
+
+    def _record(self, callback, model, started, attempts, response, status, first_chunk=None):
+        seconds = time.perf_counter() - started
+        prompt_tokens, output_tokens = _usage(response)
+        self.metrics.observe_call(model, seconds, prompt_tokens, output_tokens)
+        self.metrics.count("calls", model)
+        if attempts > 1:
+            self.metrics.count("retries", model, attempts - 1)
+        info = {"model": model, "seconds": seconds, "attempts": attempts, "status": status, "prompt_tokens": prompt_tokens, "output_tokens": output_tokens}
+        if first_chunk is not None:
+            info["first_chunk_seconds"] = first_chunk - started
+        if callback:
+            callback({"model_call": info})
+
+    def _attempts(self, model, callback):
+        # Yields attempt numbers while the breaker allows calls to `model`.
+        breaker = self._breaker(model)
+        for attempt in range(self.max_attempts):
+            if not breaker.allow():
+                self.metrics.count("circuit_open", model)
+                raise CircuitOpenError(f"Too many failed calls to {model}; not retrying for {self.reset_timeout:g} seconds.")
+            yield attempt
+
+    def _failed(self, model, attempt, error, callback):
+        # Returns how long to wait before retrying, or raises `error`.
+        self.metrics.count("errors", model)
+        if not is_retryable(error):
+            # The service is up; this request is just wrong.
+            self._breaker(model).success()
+            raise error
+        self._breaker(model).failure()
+        if attempt + 1 >= self.max_attempts:
+            raise error
+        delay = self._delay(attempt, error)
+        if callback:
+            callback({"retry": {"model": model, "attempt": attempt + 1, "delay": delay, "error": str(error)[:200]}})
+        return delay
+
+    def _call(self, model, callback, attempt_call, limited=True):
+        # Runs attempt_call(model) with retries, then on the fallback model.
+        # With limited=False, attempt_call takes the concurrency slot itself.
+        last_error = None
+        for candidate in self._models(model):
+            if candidate != model:
+                self.metrics.count("fallbacks", candidate)
+                if callback:
+                    callback({"fallback": {"from": model, "to": candidate, "error": str(last_error)[:200]}})
+            started = time.perf_counter()
+            try:
+                for attempt in self._attempts(candidate, callback):
+                    try:
+                        if limited:
+                            with self.semaphore:
+                                result = attempt_call(candidate)
+                        else:
+                            result = attempt_call(candidate)
+                        self._breaker(candidate).success()
+                        return candidate, started, attempt + 1, result
+                    except Exception as e:
+                        time.sleep(self._failed(candidate, attempt, e, callback))
+            except Exception as e:
+                if not (is_retryable(e) or isinstance(e, CircuitOpenError)):
+                    raise
+                last_error = e
+        raise last_error
+
+    async def _call_async(self, model, callback, attempt_call, limited=True):
+        self._async_limit()
+        last_error = None
+        for candidate in self._models(model):
+            if candidate != model:
+                self.metrics.count("fallbacks", candidate)
+                if callback:
+                    callback({"fallback": {"from": model, "to": candidate, "error": str(last_error)[:200]}})
+            started = time.perf_counter()
+            try:
+                for attempt in self._attempts(candidate, callback):
+                    try:
+                        if limited:
+                            async with self.async_semaphore:
+                                result = await attempt_call(candidate)
+                        else:
+                            result = await attempt_call(candidate)
+                        self._breaker(candidate).success()
+                        return candidate, started, attempt + 1, result
+                    except asyncio.CancelledError:
+                        raise
+                    except Exception as e:
+                        await asyncio.sleep(self._failed(candidate, attempt, e, callback))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if not (is_retryable(e) or isinstance(e, CircuitOpenError)):
+                    raise
+                last_error = e
+        raise last_error
+
+    def _async_limit(self):
+        if self.async_semaphore is None:
+            self.async_semaphore = asyncio.Semaphore(self.concurrency)
+        return self.async_semaphore
+
+    def _failed_call(self, callback, model, started, error):
+        self.metrics.count("failed_calls", model)
+        if callback:
+            callback({"model_call": {"model": model, "seconds": time.perf_counter() - started, "status": "error", "error": str(error)[:200]}})
+
+    def generate(self, model, contents, config=None, callback=None):
+        started = time.perf_counter()
+        try:
+            used, started, attempts, response = self._call(model, callback, lambda m: self.client.models.generate_content(model=m, contents=contents, config=config))
+        except Exception as e:
+            self._failed_call(callback, model, started, e)
+            raise
+        self._record(callback, used, started, attempts, response, "ok")
+        return response
+
+    def generate_stream(self, model, contents, config=None, callback=None):
+        # Yields chunks; the call is retried until the first chunk arrives. The
+        # concurrency slot is held until the stream ends.
+        def first_chunk(m):
+            self.semaphore.acquire()
+            try:
+                stream = iter(self.client.models.generate_content_stream(model=m, contents=contents, config=config))
+                return stream, next(stream, None), time.perf_counter()
+            except BaseException:
+                self.semaphore.release()
+                raise
+        started = time.perf_counter()
+        try:
+            used, started, attempts, (stream, chunk, first) = self._call(model, callback, first_chunk, limited=False)
+        except Exception as e:
+            self._failed_call(callback, model, started, e)
+            raise
+        try:
+            last = chunk
+            if chunk is not None:
+                yield chunk
+            for chunk in stream:
+                last = chunk
+                yield chunk
+        finally:
+            self.semaphore.release()
+        self._record(callback, used, started, attempts, last, "ok", first)
+
+    async def generate_async(self, model, contents, config=None, callback=None):
+        started = time.perf_counter()
+        try:
+            used, started, attempts, response = await self._call_async(model, callback, lambda m: self.client.aio.models.generate_content(model=m, contents=contents, config=config))
+        except Exception as e:
+            self._failed_call(callback, model, started, e)
+            raise
+        self._record(callback, used, started, attempts, response, "ok")
+        return response
+
+    async def generate_stream_async(self, model, contents, config=None, callback=None):
+        semaphore = self._async_limit()
+        async def first_chunk(m):
+            await semaphore.acquire()
+            try:
+                stream = (await self.client.aio.models.generate_content_stream(model=m, contents=contents, config=config)).__aiter__()
+                try:
+                    chunk = await stream.__anext__()
+                except StopAsyncIteration:
+                    chunk = None
+                return stream, chunk, time.perf_counter()
+            except BaseException:
+                semaphore.release()
+                raise
+        started = time.perf_counter()
+        try:
+            used, started, attempts, (stream, chunk, first) = await self._call_async(model, callback, first_chunk, limited=False)
+        except Exception as e:
+            self._failed_call(callback, model, started, e)
+            raise
+        try:
+            last = chunk
+            if chunk is not None:
+                yield chunk
+            async for chunk in stream:
+                last = chunk
+                yield chunk
+        finally:
+            semaphore.release()
+        self._record(callback, used, started, attempts, last, "ok", first)
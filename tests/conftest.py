@@ -0,0 +1,6 @@
+import os
+import sys
+
+# Jasper's modules live flat in src/ and are imported by name, as when running
+# from src/.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
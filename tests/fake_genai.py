@@ -0,0 +1,207 @@
+# In-memory stand-ins for parts of google.genai.Client, for exercising Jasper
+# without network access or an API key.
+
+import asyncio
+import datetime
+import itertools
+import random
+import time
+from types import SimpleNamespace
+import httpx
+from google.genai import errors, types
+
+from history import CHARS_PER_TOKEN, estimate_part, estimate_tokens
+
+
+def make_response(reply, prompt_tokens=0):
+    # `reply` is the response text, or a list of parts (e.g. function calls).
+    parts = [types.Part(text = reply)] if isinstance(reply, str) else list(reply)
+    output_tokens = sum(estimate_part(part) for part in parts)
+    return types.GenerateContentResponse(
+        candidates = [types.Candidate(
+            content = types.Content(role = "model", parts = parts),
+            finish_reason = types.FinishReason.STOP,
+        )],
+        usage_metadata = types.GenerateContentResponseUsageMetadata(
+            prompt_token_count = prompt_tokens,
+            candidates_token_count = output_tokens,
+            total_token_count = prompt_tokens + output_tokens,
+        ),
+    )
+
+
+def call(name, **args):
+    # A function call part, for replies to function calling requests.
+    return types.Part(function_call = types.FunctionCall(name = name, args = args))
+
+
+def prompt_tokens(contents, config=None):
+    # Like the API, counts the system instruction and tools as prompt tokens.
+    tokens = estimate_tokens(contents)
+    if config is not None:
+        tokens += len(str(config.system_instruction or "")) // CHARS_PER_TOKEN
+        tokens += sum(len(tool.model_dump_json(exclude_none=True)) for tool in config.tools or []) // CHARS_PER_TOKEN
+    return tokens
+
+
+def make_error(code, retry_after=None):
+    # An APIError like the ones the SDK raises for HTTP errors.
+    status = {429: "RESOURCE_EXHAUSTED", 500: "INTERNAL", 503: "UNAVAILABLE", 504: "DEADLINE_EXCEEDED"}.get(code, "FAILED_PRECONDITION")
+    details = []
+    if retry_after is not None:
+        details.append({"@type": "type.googleapis.com/google.rpc.RetryInfo", "retryDelay": f"{retry_after}s"})
+    return errors.APIError(
+        code,
+        {"error": {"code": code, "status": status, "message": "Injected failure.", "details": details}},
+        httpx.Response(code, headers={"retry-after": str(retry_after)} if retry_after is not None else {}),
+    )
+
+
+class FakeModels:
+    # Stub backend for client.models / client.aio.models. `reply` is either a
+    # list of responses, used in order and then repeated from the start, or a
+    # function of the request contents returning the response. A response is
+    # its text, or a list of parts such as call(...).
+    #
+    # Failures can be injected: `failures` is a list of HTTP status codes (or
+    # None for success) used for the first calls, and after that each call
+    # fails with `failure_code` with probability `failure_rate`.
+
+    def __init__(self, reply=("OK.",), latency: float = 0, chunk_size: int = 16, failures=(), failure_rate: float = 0, failure_code: int = 503, retry_after: float = None, seed: int = None):
+        self.reply = reply
+        self.latency = latency
+        self.chunk_size = chunk_size
+        self.failures = list(failures)
+        self.failure_rate = failure_rate
+        self.failure_code = failure_code
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.calls = 0
+        self.failed = 0
+        # Models passed to each call, including failed ones.
+        self.models = []
+        self.aio = SimpleNamespace(
+            generate_content = self._generate_content_async,
+            generate_content_stream = self._generate_content_stream_async,
+        )
+
+    def _inject(self, model):
+        self.models.append(model)
+        code = self.failures.pop(0) if self.failures else (self.failure_code if self.random.random() < self.failure_rate else None)
+        if code:
+            self.failed += 1
+            raise make_error(code, self.retry_after)
+
+    def _text(self, contents):
+        self.calls += 1
+        if callable(self.reply):
+            return self.reply(contents)
+        return self.reply[(self.calls - 1) % len(self.reply)]
+
+    def _chunks(self, reply, contents, config):
+        # Text is split into chunks; other parts come in a chunk of their own.
+        tokens = prompt_tokens(contents, config)
+        for part in [types.Part(text = reply)] if isinstance(reply, str) else reply:
+            if part.text is None:
+                yield make_response([part], tokens)
+                continue
+            for i in range(0, len(part.text), self.chunk_size):
+                yield make_response(part.text[i:i + self.chunk_size], tokens)
+
+    def generate_content(self, model, contents, config=None):
+        time.sleep(self.latency)
+        self._inject(model)
+        return make_response(self._text(contents), prompt_tokens(contents, config))
+
+    def generate_content_stream(self, model, contents, config=None):
+        time.sleep(self.latency)
+        self._inject(model)
+        yield from self._chunks(self._text(contents), contents, config)
+
+    def count_tokens(self, model, contents, config=None):
+        return types.CountTokensResponse(total_tokens = estimate_tokens(contents))
+
+    async def _generate_content_async(self, model, contents, config=None):
+        await asyncio.sleep(self.latency)
+        self._inject(model)
+        return make_response(self._text(contents), prompt_tokens(contents, config))
+
+    async def _generate_content_stream_async(self, model, contents, config=None):
+        await asyncio.sleep(self.latency)
+        self._inject(model)
+        chunks = list(self._chunks(self._text(contents), contents, config))
+        async def stream():
+            for chunk in chunks:
+                yield chunk
+        return stream()
+
+
+class FakeCaches:
+    # Implements the parts of client.caches used by context_cache.ContextCache.
+
+    def __init__(self):
+        self.caches = {}
+        self.ids = itertools.count(1)
+        self.created = 0
+
+    def _expiry(self, ttl):
+        return datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=float(ttl.rstrip("s")))
+
+    def create(self, model, config):
+        self.created += 1
+        name = f"cachedContents/fake-{next(self.ids)}"
+        self.caches[name] = types.CachedContent(
+            name = name,
+            model = model,
+            display_name = config.display_name,
+            expire_time = self._expiry(config.ttl or "3600s"),
+        )
+        return self.caches[name]
+
+    def get(self, name):
+        return self.caches[name]
+
+    def update(self, name, config):
+        self.caches[name].expire_time = self._expiry(config.ttl)
+        return self.caches[name]
+
+    def delete(self, name):
+        del self.caches[name]
+
+    def list(self):
+        return list(self.caches.values())
+
+
+class FakeFiles:
+    # Implements the parts of client.files used by files.FileUploader.
+
+    def __init__(self):
+        self.files = {}
+        self.ids = itertools.count(1)
+        self.uploaded = 0
+
+    def upload(self, file, config=None):
+        self.uploaded += 1
+        name = f"files/fake-{next(self.ids)}"
+        self.files[name] = types.File(
+            name = name,
+            uri = f"https://generativelanguage.googleapis.com/v1beta/{name}",
+            mime_type = config.mime_type if config else None,
+            state = types.FileState.ACTIVE,
+            expiration_time = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours=48),
+        )
+        return self.files[name]
+
+    def get(self, name):
+        return self.files[name]
+
+    def delete(self, name):
+        del self.files[name]
+
+
+class FakeClient:
+    def __init__(self, models=None):
+        self.models = models or FakeModels()
+        self.aio = SimpleNamespace(models = getattr(self.models, "aio", None))
+        self.caches = FakeCaches()
+        self.files = FakeFiles()
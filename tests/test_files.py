@@ -0,0 +1,75 @@
+import hashlib
+
+import pytest
+
+import files
+from fake_genai import FakeClient
+from files import FileUploader, file_hash
+
+
+@pytest.fixture
+def client():
+    return FakeClient()
+
+@pytest.fixture
+def video(tmp_path):
+    path = tmp_path / "video.mp4"
+    path.write_bytes(b"\x00video" * 1000)
+    return path
+
+
+def test_file_hash_is_the_sha256_of_the_content(video):
+    assert file_hash(str(video)) == hashlib.sha256(video.read_bytes()).hexdigest()
+
+def test_same_content_is_uploaded_once(client, video, tmp_path):
+    copy = tmp_path / "copy.mp4"
+    copy.write_bytes(video.read_bytes())
+    uploader = FileUploader(client, path=None)
+    first = uploader.upload(str(video), "video/mp4")
+    assert uploader.upload(str(copy), "video/mp4") == first
+    assert client.files.uploaded == 1
+
+def test_changed_content_is_uploaded_again(client, video):
+    uploader = FileUploader(client, path=None)
+    first, _ = uploader.upload(str(video), "video/mp4")
+    video.write_bytes(b"\x01other" * 1000)
+    second, _ = uploader.upload(str(video), "video/mp4")
+    assert second != first
+    assert client.files.uploaded == 2
+
+def test_uploads_are_remembered_across_sessions(client, video, tmp_path):
+    path = str(tmp_path / "uploads.json")
+    uri, mime_type = FileUploader(client, path=path).upload(str(video), "video/mp4")
+    assert FileUploader(client, path=path).upload(str(video), "video/mp4") == (uri, mime_type)
+    assert client.files.uploaded == 1
+
+def test_uploads_close_to_expiring_are_replaced(client, video, monkeypatch):
+    uploader = FileUploader(client, path=None)
+    first, _ = uploader.upload(str(video), "video/mp4")
+    expires = uploader.uploads[file_hash(str(video))]["expires"]
+    # Within the last hour of the upload's 48.
+    monkeypatch.setattr(files.time, "time", lambda: expires - 1800)
+    second, _ = uploader.upload(str(video), "video/mp4")
+    assert second != first
+    assert client.files.uploaded == 2
+
+def test_expired_reports_unknown_and_lapsed_uploads(client, video, monkeypatch):
+    uploader = FileUploader(client, path=None)
+    uri, _ = uploader.upload(str(video), "video/mp4")
+    assert not uploader.expired(uri)
+    assert uploader.expired("https://generativelanguage.googleapis.com/v1beta/files/other")
+    expires = uploader.uploads[file_hash(str(video))]["expires"]
+    monkeypatch.setattr(files.time, "time", lambda: expires + 1)
+    assert uploader.expired(uri)
+
+def test_failed_processing_is_an_error(client, video, monkeypatch):
+    upload = client.files.upload
+    def failing(file, config=None):
+        uploaded = upload(file, config)
+        uploaded.state = files.types.FileState.FAILED
+        return uploaded
+    monkeypatch.setattr(client.files, "upload", failing)
+    uploader = FileUploader(client, path=None)
+    with pytest.raises(RuntimeError):
+        uploader.upload(str(video), "video/mp4")
+    assert uploader.uploads == {}
@@ -0,0 +1,147 @@
+import os
+
+import pytest
+from google.genai import types
+
+from journal import Journal, find_session, list_sessions
+
+
+def user(text):
+    return types.Content(role="user", parts=[types.Part(text=text)])
+
+def texts(journal):
+    return [content.parts[0].text for content in journal]
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "session.log")
+
+def reopen(journal, **options):
+    journal.close()
+    return Journal(journal.path, **options)
+
+
+def test_without_a_path_it_is_a_list():
+    journal = Journal()
+    journal.append(user("a"))
+    journal.insert(0, user("b"))
+    del journal[1]
+    assert texts(journal) == ["b"]
+
+def test_appends_survive_a_restart(path):
+    journal = Journal(path)
+    for text in "abc":
+        journal.append(user(text))
+    assert texts(reopen(journal)) == ["a", "b", "c"]
+
+def test_inserts_deletes_and_replacements_survive_a_restart(path):
+    journal = Journal(path)
+    journal.extend(user(text) for text in "abcd")
+    journal.insert(1, user("x"))
+    del journal[3]
+    journal[0] = user("y")
+    journal.insert(-1, user("z"))
+    expected = ["y", "x", "b", "z", "d"]
+    assert texts(journal) == expected
+    assert texts(reopen(journal)) == expected
+
+def test_clear_survives_a_restart(path):
+    journal = Journal(path)
+    journal.extend(user(text) for text in "ab")
+    journal.clear()
+    journal.append(user("c"))
+    assert texts(reopen(journal)) == ["c"]
+
+def test_resumed_contents_are_read_lazily(path):
+    journal = Journal(path)
+    journal.extend(user(text) for text in "abc")
+    loaded = []
+    journal = reopen(journal, on_load=lambda content: loaded.append(content) or content)
+    assert len(journal) == 3 and loaded == []
+    assert journal[-1].parts[0].text == "c"
+    assert len(loaded) == 1
+
+def test_unread_contents_are_kept_when_earlier_ones_change(path):
+    journal = Journal(path)
+    journal.extend(user(text) for text in "abcd")
+    journal = reopen(journal)
+    # b, c and d have not been read, and are copied across unparsed.
+    journal.insert(1, user("x"))
+    del journal[0]
+    assert journal.contents[1:] == [None, None, None]
+    assert texts(journal) == ["x", "b", "c", "d"]
+    assert texts(reopen(journal)) == ["x", "b", "c", "d"]
+
+def test_resuming_from_a_snapshot_scans_only_later_records(path):
+    journal = Journal(path, snapshot_every=4)
+    journal.extend(user(str(i)) for i in range(10))
+    del journal[2]
+    journal.append(user("last"))
+    assert os.path.exists(journal.snapshot_path)
+    resumed = reopen(journal)
+    assert resumed.since_snapshot < 4
+    assert texts(resumed) == ["0", "1"] + [str(i) for i in range(3, 10)] + ["last"]
+
+def test_snapshot_behind_the_log_is_ignored(path):
+    journal = Journal(path, snapshot_every=2)
+    journal.extend(user(text) for text in "abc")
+    journal.close()
+    # The log lost records the snapshot refers to.
+    with open(path, "r+b") as f:
+        f.truncate(8)
+    assert len(Journal(path)) == 0
+
+def test_a_record_cut_short_by_a_crash_is_dropped(path):
+    journal = Journal(path)
+    journal.extend(user(text) for text in "abc")
+    journal.close()
+    with open(path, "r+b") as f:
+        f.truncate(os.path.getsize(path) - 3)
+    journal = Journal(path)
+    assert texts(journal) == ["a", "b"]
+    # The partial record is overwritten by the next one.
+    journal.append(user("d"))
+    assert texts(reopen(journal)) == ["a", "b", "d"]
+
+def test_a_corrupted_record_ends_the_log(path):
+    journal = Journal(path)
+    journal.extend(user(text) for text in "abc")
+    offset, _ = journal.records[1]
+    journal.close()
+    with open(path, "r+b") as f:
+        f.seek(offset)
+        f.write(b"#")
+    assert len(Journal(path)) == 1
+
+def test_other_files_are_refused(path):
+    with open(path, "wb") as f:
+        f.write(b"not a journal")
+    with pytest.raises(ValueError):
+        Journal(path)
+
+def test_can_be_used_after_close(path):
+    journal = Journal(path)
+    journal.extend(user(text) for text in "ab")
+    journal = reopen(journal)
+    journal.close()
+    journal.append(user("c"))
+    assert texts(journal) == ["a", "b", "c"]
+    assert texts(reopen(journal)) == ["a", "b", "c"]
+
+def test_unknown_fsync_policy_is_refused(path):
+    with pytest.raises(ValueError):
+        Journal(path, fsync="sometimes")
+
+def test_sessions_are_listed_and_found(tmp_path):
+    for session_id, text in [("20260101-000000-aaaa", "SYSTEM: setup"), ("20260102-000000-bbbb", "Hello")]:
+        journal = Journal(str(tmp_path / f"{session_id}.log"))
+        journal.append(user(text))
+        journal.append(user("Second message"))
+        journal.close()
+    os.utime(tmp_path / "20260101-000000-aaaa.log", (0, 0))
+    sessions = list_sessions(str(tmp_path))
+    assert [session["id"] for session in sessions] == ["20260102-000000-bbbb", "20260101-000000-aaaa"]
+    assert [session["title"] for session in sessions] == ["Hello", "Second message"]
+    assert find_session(str(tmp_path), "20260102") == "20260102-000000-bbbb"
+    with pytest.raises(KeyError):
+        find_session(str(tmp_path), "2026")
@@ -0,0 +1,179 @@
+import os
+
+import pytest
+from google.genai import types
+
+import response_cache
+from fake_genai import call, make_response
+from response_cache import ResponseCache, read_only
+
+CONFIG = types.GenerateContentConfig(system_instruction="You are Jasper.")
+
+
+def user(text):
+    return types.Content(role="user", parts=[types.Part(text=text)])
+
+def model(text):
+    return types.Content(role="model", parts=[types.Part(text=text)])
+
+@pytest.fixture
+def cache(tmp_path):
+    return ResponseCache(str(tmp_path / "cache.db"))
+
+
+def test_response_key_depends_on_model_prompt_and_tools(cache):
+    contents = [user("What time is it?")]
+    key = cache.response_key("gemini", CONFIG, contents)
+    assert cache.response_key("gemini", CONFIG, contents) == key
+    assert cache.response_key("other", CONFIG, contents) != key
+    assert cache.response_key("gemini", types.GenerateContentConfig(system_instruction="Memory: {}"), contents) != key
+    tools = types.GenerateContentConfig(system_instruction="You are Jasper.", tools=[types.Tool(function_declarations=[types.FunctionDeclaration(name="sh")])])
+    assert cache.response_key("gemini", tools, contents) != key
+
+def test_response_key_includes_the_previous_exchange(cache):
+    # "yes" after one question must not get the answer to "yes" after another.
+    first = [user("Shall I list your files?"), model("Shall I?"), user("yes")]
+    second = [user("Shall I delete your files?"), model("Shall I?"), user("yes")]
+    assert cache.response_key("gemini", CONFIG, first) != cache.response_key("gemini", CONFIG, second)
+
+def test_response_key_ignores_older_exchanges(cache):
+    recent = [user("Hi"), model("Hello!"), user("How are you?")]
+    assert cache.response_key("gemini", CONFIG, [user("Earlier"), model("Sure.")] + recent) == cache.response_key("gemini", CONFIG, [user("Other"), model("Ok.")] + recent)
+
+def test_command_output_does_not_count_as_a_user_message(cache):
+    turn = [user("Shall I list your files?"), model("```execute:sh\nls\n```"), user("SYSTEM: Command Output:\n\na b"), model("Shall I?"), user("yes")]
+    other = [user("Shall I delete your files?")] + turn[1:]
+    assert cache.response_key("gemini", CONFIG, turn) != cache.response_key("gemini", CONFIG, other)
+
+def test_responses_round_trip(cache):
+    key = cache.response_key("gemini", CONFIG, [user("Hi")])
+    assert cache.get_response(key) is None
+    cache.put_response(key, make_response("Hello!"))
+    assert cache.get_response(key).candidates[0].content.parts[0].text == "Hello!"
+    assert cache.stats()["response"]["hits"] == 1
+
+@pytest.mark.parametrize("reply", ["Let me look.\n```execute:sh\nls\n```", [call("sh", command="ls")]])
+def test_replies_that_run_commands_are_not_cached(cache, reply):
+    cache.put_response("key", make_response(reply))
+    assert cache.get_response("key") is None
+
+def test_incomplete_responses_are_not_cached(cache):
+    response = make_response("Cut sh")
+    response.candidates[0].finish_reason = types.FinishReason.MAX_TOKENS
+    cache.put_response("key", response)
+    assert cache.get_response("key") is None
+
+def test_disabled_cache_stores_nothing(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.db"), enabled=False)
+    cache.put_response("key", make_response("Hello!"))
+    assert cache.get_response("key") is None
+    assert not os.path.exists(tmp_path / "cache.db")
+
+def test_refresh_skips_lookups_but_stores(cache):
+    cache.put_response("key", make_response("Old."))
+    cache.refreshing = True
+    assert cache.get_response("key") is None
+    cache.put_response("key", make_response("New."))
+    cache.refreshing = False
+    assert cache.get_response("key").candidates[0].content.parts[0].text == "New."
+
+def test_tool_output_is_invalidated_when_a_file_changes(cache, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with open("notes.txt", "w") as f:
+        f.write("one\n")
+    key, files = cache.tool_key("sh", "cat notes.txt")
+    cache.put_tool(key, files, "one\n")
+    assert cache.get_tool(key) == "one\n"
+    with open("notes.txt", "a") as f:
+        f.write("two\n")
+    assert cache.get_tool(key) is None
+
+def test_tool_output_is_invalidated_when_a_missing_file_appears(cache, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with open("notes.txt", "w") as f:
+        f.write("one\n")
+    key, files = cache.tool_key("sh", "head notes.txt later.txt")
+    cache.put_tool(key, files, "one\n")
+    assert cache.get_tool(key) == "one\n"
+    open("later.txt", "w").close()
+    assert cache.get_tool(key) is None
+
+def test_entries_expire_after_their_ttl(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(response_cache.time, "time", lambda: now[0])
+    cache = ResponseCache(str(tmp_path / "cache.db"), tool_ttl=300)
+    cache.put_tool("key", [], "output")
+    now[0] += 299
+    assert cache.get_tool("key") == "output"
+    now[0] += 2
+    assert cache.get_tool("key") is None
+
+def test_least_recently_used_entries_are_evicted(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(response_cache.time, "time", lambda: now[0])
+    cache = ResponseCache(str(tmp_path / "cache.db"), tool_bytes=250)
+    for key in ("a", "b"):
+        now[0] += 1
+        cache.put_tool(key, [], "x" * 100)
+    now[0] += 1
+    cache.get_tool("a")
+    now[0] += 1
+    cache.put_tool("c", [], "x" * 100)
+    assert cache.get_tool("b") is None
+    assert cache.get_tool("a") is not None and cache.get_tool("c") is not None
+
+def test_timeouts_and_errors_are_not_cached(cache):
+    cache.put_tool("slow", [], "partial\n[Timed out after 10 seconds]")
+    cache.put_tool("failed", [], "Error executing: boom")
+    assert cache.get_tool("slow") is None and cache.get_tool("failed") is None
+
+
+@pytest.fixture
+def files(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.mkdir("folder")
+    with open("notes.txt", "w") as f:
+        f.write("one\n")
+
+@pytest.mark.parametrize("code, expected", [
+    ("cat notes.txt", ["notes.txt"]),
+    ("grep -n one notes.txt | wc -l", ["one", "notes.txt"]),
+    ("sort -r notes.txt", ["notes.txt"]),
+])
+def test_reading_files_is_read_only(files, code, expected):
+    assert read_only("sh", code) == expected
+
+@pytest.mark.parametrize("code", [
+    # Writes, or may write.
+    "rm notes.txt",
+    "cat notes.txt > copy.txt",
+    "sort -o sorted.txt notes.txt",
+    "sort -ro sorted.txt notes.txt",
+    "sort --output=sorted.txt notes.txt",
+    "find . -name '*.txt' -delete",
+    "cat notes.txt; rm notes.txt",
+    "cat $(echo notes.txt)",
+    "cat notes.txt &",
+    # Output not tied to a file that can be stamped.
+    "echo hello",
+    "uname -a",
+    "ls folder",
+    "cat *.txt",
+    "cat notes.txt folder",
+    # Not in the whitelist: state that changes without any file changing.
+    "ip addr",
+    "hostname",
+])
+def test_other_commands_are_not_read_only(files, code):
+    assert read_only("sh", code) is None
+
+def test_marked_commands_are_cached_without_files(files):
+    assert read_only("sh:readonly", "uname -a") == []
+    assert read_only("sh:readonly", "cat notes.txt missing.txt") == ["notes.txt"]
+    # The mark does not make a command that writes read-only.
+    assert read_only("sh:readonly", "rm notes.txt") == []
+
+def test_other_languages_are_only_read_only_when_marked():
+    assert read_only("py", "print(1)") is None
+    assert read_only("py:readonly", "print(1)") == []
+    assert read_only("analyse:text/plain", "notes.txt\n") == ["notes.txt"]
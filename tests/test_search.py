@@ -0,0 +1,66 @@
+import json
+
+import search
+from search import SearchCache, SearchEngine, StubBackend, normalize_query
+
+
+RESULTS = [{"title": "Weather", "url": "https://example.com/weather", "description": "Sunny."}]
+
+
+def test_normalize_query_ignores_case_and_spacing_but_not_order():
+    assert normalize_query("  Weather in   London ") == "weather in london"
+    assert normalize_query("flights London to Paris") != normalize_query("flights Paris to London")
+
+def test_cache_is_shared_by_equivalent_queries():
+    cache = SearchCache(path=None)
+    cache.put("Weather in London", RESULTS)
+    assert cache.get("weather  in london") == RESULTS
+
+def test_entries_expire_after_their_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(search.time, "time", lambda: now[0])
+    cache = SearchCache(path=None, ttl=60)
+    cache.put("weather", RESULTS)
+    now[0] += 60
+    assert cache.get("weather") == RESULTS
+    now[0] += 1
+    assert cache.get("weather") is None
+    assert "weather" not in cache.entries
+
+def test_least_recently_used_entries_are_evicted():
+    cache = SearchCache(path=None, max_entries=2)
+    cache.put("a", RESULTS)
+    cache.put("b", RESULTS)
+    # Reading "a" makes "b" the least recently used.
+    cache.get("a")
+    cache.put("c", RESULTS)
+    assert list(cache.entries) == ["a", "c"]
+    assert cache.get("b") is None
+
+def test_cache_is_saved_and_reloaded(tmp_path):
+    path = str(tmp_path / "search_cache.json")
+    SearchCache(path=path).put("weather", RESULTS)
+    assert SearchCache(path=path).get("weather") == RESULTS
+
+def test_unreadable_cache_file_starts_empty(tmp_path):
+    path = tmp_path / "search_cache.json"
+    path.write_text("{not json")
+    assert SearchCache(path=str(path)).entries == {}
+
+def test_engine_searches_each_query_once():
+    backend = StubBackend({"weather": RESULTS})
+    engine = SearchEngine(backend=backend, cache=SearchCache(path=None))
+    first = engine.search("weather")
+    assert engine.search(" Weather ") == first
+    assert "https://example.com/weather" in first
+    assert backend.calls == 1
+    assert (engine.hits, engine.misses) == (1, 1)
+
+def test_engine_does_not_cache_empty_results(tmp_path):
+    path = tmp_path / "search_cache.json"
+    backend = StubBackend({"weather": []})
+    engine = SearchEngine(backend=backend, cache=SearchCache(path=str(path)))
+    engine.search("weather")
+    engine.search("weather")
+    assert backend.calls == 2
+    assert not path.exists() or json.loads(path.read_text()) == {}
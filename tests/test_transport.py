@@ -0,0 +1,135 @@
+import asyncio
+
+import pytest
+from google.genai import errors, types
+
+import transport
+from fake_genai import FakeClient, FakeModels
+from transport import CircuitBreaker, CircuitOpenError, Metrics, ModelTransport
+
+
+CONTENTS = [types.Content(role="user", parts=[types.Part(text="Hi.")])]
+
+
+def make_transport(models, **options):
+    options = {"base_delay": 0, "max_attempts": 4, "metrics": Metrics(), **options}
+    return ModelTransport(FakeClient(models), **options)
+
+def text(response):
+    return response.candidates[0].content.parts[0].text
+
+
+def test_retries_transient_errors():
+    models = FakeModels(["Hello."], failures=[503, 429, None])
+    events = []
+    response = make_transport(models).generate("primary", CONTENTS, callback=events.append)
+    assert text(response) == "Hello."
+    assert models.models == ["primary"] * 3
+    assert [event["retry"]["attempt"] for event in events if "retry" in event] == [1, 2]
+    assert [event["model_call"]["attempts"] for event in events if "model_call" in event] == [3]
+
+def test_gives_up_after_max_attempts():
+    models = FakeModels(failure_rate=1)
+    with pytest.raises(errors.APIError):
+        make_transport(models, max_attempts=3).generate("primary", CONTENTS)
+    assert len(models.models) == 3
+
+def test_does_not_retry_client_errors():
+    models = FakeModels(failures=[400])
+    with pytest.raises(errors.APIError):
+        make_transport(models).generate("primary", CONTENTS)
+    assert len(models.models) == 1
+
+def test_backoff_grows_exponentially_up_to_max_delay(monkeypatch):
+    monkeypatch.setattr(transport.random, "uniform", lambda low, high: high)
+    model_transport = make_transport(FakeModels(), base_delay=1, max_delay=5)
+    error = ConnectionError()
+    assert [model_transport._delay(attempt, error) for attempt in range(5)] == [1, 2, 4, 5, 5]
+
+def test_backoff_waits_as_long_as_the_server_asks(monkeypatch):
+    waits = []
+    monkeypatch.setattr(transport.time, "sleep", waits.append)
+    models = FakeModels(failures=[429], retry_after=7)
+    make_transport(models, base_delay=0.01).generate("primary", CONTENTS)
+    # The fake model sleeps for its (zero) latency too.
+    assert [wait for wait in waits if wait] == [7]
+
+def test_circuit_opens_after_consecutive_failures():
+    models = FakeModels(failure_rate=1)
+    model_transport = make_transport(models, max_attempts=1, failure_threshold=2)
+    for _ in range(2):
+        with pytest.raises(errors.APIError):
+            model_transport.generate("primary", CONTENTS)
+    with pytest.raises(CircuitOpenError):
+        model_transport.generate("primary", CONTENTS)
+    # The open circuit fails the call without reaching the model.
+    assert len(models.models) == 2
+
+def test_circuit_lets_one_trial_call_through_and_closes_on_success(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(transport.time, "monotonic", lambda: now[0])
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+    breaker.failure()
+    assert breaker.state == "closed"
+    breaker.failure()
+    assert breaker.state == "open" and not breaker.allow()
+    now[0] += 30
+    assert breaker.state == "half-open"
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.success()
+    assert breaker.state == "closed" and breaker.allow()
+
+def test_failed_trial_call_opens_the_circuit_again(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(transport.time, "monotonic", lambda: now[0])
+    breaker = CircuitBreaker(failure_threshold=5, reset_timeout=30)
+    for _ in range(5):
+        breaker.failure()
+    now[0] += 30
+    assert breaker.allow()
+    breaker.failure()
+    assert breaker.state == "open"
+
+def test_falls_back_to_the_fallback_model():
+    models = FakeModels(["From the fallback."], failures=[503, 503])
+    events = []
+    response = make_transport(models, max_attempts=2, fallback_model="backup").generate("primary", CONTENTS, callback=events.append)
+    assert text(response) == "From the fallback."
+    assert models.models == ["primary", "primary", "backup"]
+    assert [event["fallback"] for event in events if "fallback" in event][0]["to"] == "backup"
+
+def test_falls_back_while_the_circuit_is_open():
+    models = FakeModels(failures=[503])
+    model_transport = make_transport(models, max_attempts=1, failure_threshold=1, fallback_model="backup")
+    model_transport.generate("primary", CONTENTS)
+    model_transport.generate("primary", CONTENTS)
+    assert models.models == ["primary", "backup", "backup"]
+
+def test_does_not_fall_back_on_client_errors():
+    models = FakeModels(failures=[400])
+    with pytest.raises(errors.APIError):
+        make_transport(models, fallback_model="backup").generate("primary", CONTENTS)
+    assert models.models == ["primary"]
+
+def test_stream_is_retried_until_the_first_chunk():
+    models = FakeModels(["A streamed reply."], failures=[503], chunk_size=4)
+    chunks = list(make_transport(models).generate_stream("primary", CONTENTS))
+    assert "".join(text(chunk) for chunk in chunks) == "A streamed reply."
+    assert models.models == ["primary", "primary"]
+
+def test_async_calls_retry_and_fall_back():
+    models = FakeModels(["Async."], failures=[503, 503])
+    model_transport = make_transport(models, max_attempts=2, fallback_model="backup")
+    response = asyncio.run(model_transport.generate_async("primary", CONTENTS))
+    assert text(response) == "Async."
+    assert models.models == ["primary", "primary", "backup"]
+
+def test_metrics_count_calls_retries_and_fallbacks():
+    metrics = Metrics()
+    models = FakeModels(failures=[503, 503])
+    make_transport(models, max_attempts=2, fallback_model="backup", metrics=metrics).generate("primary", CONTENTS)
+    counters = metrics.snapshot()["counters"]
+    assert counters["errors{primary}"] == 2
+    assert counters["fallbacks{backup}"] == 1
+    assert counters["calls{backup}"] == 1